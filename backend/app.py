@@ -1,10 +1,11 @@
 import eventlet
 eventlet.monkey_patch()
 import sys
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 import logging
 from flask_socketio import SocketIO
 from flask_cors import CORS
+import metrics
 
 
 
@@ -31,9 +32,16 @@ socketio = SocketIO(app,
 
 # 导入并初始化PTY终端处理器
 try:
-    from pty_handler import PtyTerminalHandler
-    pty_terminal_handler = PtyTerminalHandler(socketio)
-    print("[INFO] PTY Terminal handler initialized successfully")
+    from pty_shard import SHARD_WORKERS
+    if SHARD_WORKERS > 0:
+        # 会话分片到多个工作进程，本进程只负责Socket.IO连接和事件转发
+        from pty_shard import ShardedTerminalHandler
+        pty_terminal_handler = ShardedTerminalHandler(socketio, SHARD_WORKERS)
+        print(f"[INFO] PTY Terminal handler initialized with {SHARD_WORKERS} worker processes")
+    else:
+        from pty_handler import PtyTerminalHandler
+        pty_terminal_handler = PtyTerminalHandler(socketio)
+        print("[INFO] PTY Terminal handler initialized successfully")
     terminal_handler = pty_terminal_handler  # 保持向后兼容的变量名
 except ImportError as e:
     print(f"[ERROR] Failed to import pty_handler: {e}")
@@ -49,20 +57,38 @@ except Exception as e:
     print(f"[ERROR] Failed to initialize PTY terminal handler: {e}")
     terminal_handler = None
 
+# 文件传输通道：与终端事件并列，文件内容按二进制块传输，不经过pty
+try:
+    from file_transfer import FileTransferHandler
+    file_transfer_handler = FileTransferHandler(socketio)
+    file_transfer_handler.register_routes(app)
+    print("[INFO] File transfer handler initialized")
+except Exception as e:
+    print(f"[ERROR] Failed to initialize file transfer handler: {e}")
+    file_transfer_handler = None
+
 @app.route('/health')
 def health_check():
     terminal_status = 'available' if terminal_handler else 'unavailable'
-    terminal_type = 'pty' if hasattr(terminal_handler, 'sessions') and hasattr(list(terminal_handler.sessions.values())[0] if terminal_handler.sessions else type('dummy', (), {}), 'terminals') else 'basic'
     return jsonify({
         'status': 'healthy', 
         'message': 'Flask server is running',
         'terminal': {
             'status': terminal_status,
-            'type': terminal_type,
-            'features': ['pty', 'ansi_colors', 'interactive', 'resize', 'multi_task'] if terminal_type == 'pty' else ['basic', 'multi_task']
+            'type': terminal_handler.terminal_type if terminal_handler else None,
+            'features': terminal_handler.features if terminal_handler else [],
+            'sessions': len(terminal_handler.sessions) if terminal_handler else 0
         }
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus文本格式的运行指标"""
+    # 分片模式下会话在工作进程中，同名指标累加各进程的数值
+    worker_metrics = getattr(terminal_handler, 'worker_metrics', None)
+    others = worker_metrics() if worker_metrics else []
+    return Response(metrics.REGISTRY.render(others), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return jsonify({'message': 'Flask server with terminal support is running'})
@@ -80,6 +106,7 @@ if __name__ == '__main__':
     print(f"Starting Flask server with SocketIO on port {port}")
     print(f" * Running on http://127.0.0.1:{port}")
     print(f" * Health check: http://127.0.0.1:{port}/health")
+    print(f" * Metrics: http://127.0.0.1:{port}/metrics")
     print(f" * WebSocket endpoint: ws://127.0.0.1:{port}")
     
     # 使用 SocketIO 运行应用
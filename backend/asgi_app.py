@@ -0,0 +1,104 @@
+import sys
+import json
+import asyncio
+import logging
+
+import socketio
+
+import metrics
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+# asyncio/ASGI模式的入口：PTY fd直接注册到asyncio事件循环，不使用eventlet和monkey patch。
+# 事件协议与app.py（eventlet模式）相同，前端无需改动。
+
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+
+# 在事件循环启动后创建（反应器和发送队列都绑定到运行中的事件循环）
+terminal_handler = None
+
+
+async def on_startup():
+    global terminal_handler
+    try:
+        from pty_async import AsyncPtyTerminalHandler
+        terminal_handler = AsyncPtyTerminalHandler(sio, asyncio.get_running_loop())
+        print("[INFO] PTY Terminal handler initialized successfully (asyncio)")
+    except Exception as e:
+        print(f"[ERROR] Failed to initialize PTY terminal handler: {e}")
+        terminal_handler = None
+
+
+def on_shutdown():
+    # 在事件循环关闭前清理，之后atexit中的清理就不会再访问已关闭的循环
+    if terminal_handler:
+        terminal_handler.cleanup_all_sessions()
+
+
+async def _send(send, status: int, body: bytes, content_type: bytes):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'access-control-allow-origin', b'*')]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, data: dict, status: int = 200):
+    await _send(send, status, json.dumps(data).encode(), b'application/json')
+
+
+async def http_app(scope, receive, send):
+    """与app.py相同的HTTP接口"""
+    if scope['type'] != 'http':
+        return
+    path = scope['path']
+    if path == '/health':
+        await _send_json(send, {
+            'status': 'healthy',
+            'message': 'ASGI server is running',
+            'terminal': {
+                'status': 'available' if terminal_handler else 'unavailable',
+                'type': terminal_handler.terminal_type if terminal_handler else None,
+                'features': terminal_handler.features if terminal_handler else [],
+                'sessions': len(terminal_handler.sessions) if terminal_handler else 0
+            }
+        })
+    elif path == '/metrics':
+        await _send(send, 200, metrics.REGISTRY.render().encode(), b'text/plain; version=0.0.4')
+    elif path == '/':
+        await _send_json(send, {'message': 'ASGI server with terminal support is running'})
+    elif path == '/api/data':
+        await _send_json(send, {'data': 'Hello from ASGI!'})
+    else:
+        await _send_json(send, {'error': 'Not found'}, status=404)
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=on_startup, on_shutdown=on_shutdown)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    else:
+        port = 5000
+
+    if uvicorn is None:
+        print("[ERROR] asyncio mode requires uvicorn: pip install 'quick-demo[asgi]' (or uv sync --extra asgi)")
+        sys.exit(1)
+
+    print(f"Starting ASGI server with SocketIO on port {port}")
+    print(f" * Running on http://127.0.0.1:{port}")
+    print(f" * Health check: http://127.0.0.1:{port}/health")
+    print(f" * Metrics: http://127.0.0.1:{port}/metrics")
+    print(f" * WebSocket endpoint: ws://127.0.0.1:{port}")
+
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
@@ -0,0 +1,524 @@
+import os
+import mmap
+import time
+import uuid
+import zlib
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional, Tuple
+
+try:
+    # sha256整文件校验和磁盘读写会占用hub，交给原生线程池执行
+    from eventlet import tpool as _tpool
+except ImportError:
+    _tpool = None
+
+import metrics
+
+logger = logging.getLogger('FileTransfer')
+
+# 允许传输的根目录，所有路径都相对于它解析，不能通过..或符号链接跳出；启动时自动创建
+TRANSFER_ROOT = os.path.realpath(os.environ.get('PTY_TRANSFER_ROOT',
+                                                os.path.join(tempfile.gettempdir(), 'quickdemo-transfers')))
+# 每块的字节数；Socket.IO服务端单条消息默认上限1MB
+TRANSFER_CHUNK_BYTES = int(os.environ.get('PTY_TRANSFER_CHUNK_BYTES', str(256 * 1024)))
+# 下载时未确认的块数上限，客户端跟不上时停止发送
+TRANSFER_WINDOW = int(os.environ.get('PTY_TRANSFER_WINDOW', '8'))
+# 空闲多久（秒）的传输被关闭；之后仍可按偏移重新开始
+TRANSFER_IDLE_TIMEOUT = float(os.environ.get('PTY_TRANSFER_IDLE_TIMEOUT', '300'))
+
+PART_SUFFIX = '.part'
+
+TRANSFER_BYTES = metrics.REGISTRY.counter('file_transfer_bytes_total', 'File transfer payload bytes', ['direction'])
+ACTIVE_TRANSFERS = metrics.REGISTRY.gauge('file_transfers_active', 'Open file transfers', ['direction'])
+
+
+class TransferError(Exception):
+    """传输请求无效；status为HTTP接口返回的状态码"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset  # 偏移不符时，服务端期望的偏移
+
+
+def as_transfer_error(error: Exception) -> TransferError:
+    """把处理请求时的其他异常（文件系统错误等）转换为TransferError"""
+    if isinstance(error, TransferError):
+        return error
+    # 只返回错误原因，不把服务端的绝对路径透露给客户端
+    message = getattr(error, 'strerror', None) or str(error)
+    if isinstance(error, PermissionError):
+        return TransferError(message, 403)
+    return TransferError(message, 500)
+
+
+def parse_int(value, name: str, default: Optional[int] = None) -> Optional[int]:
+    """把客户端传来的整数参数转换为int；缺失时返回default，格式错误时抛出TransferError"""
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise TransferError('Invalid %s: %r' % (name, value)) from None
+
+
+def _blocking(func, *args):
+    return _tpool.execute(func, *args) if _tpool is not None else func(*args)
+
+
+def resolve_path(path: str) -> str:
+    """把客户端给出的路径解析为根目录下的绝对路径"""
+    if not path or not isinstance(path, str) or '\0' in path:
+        raise TransferError('Invalid path')
+    full = os.path.realpath(os.path.join(TRANSFER_ROOT, path))
+    if full != TRANSFER_ROOT and not full.startswith(TRANSFER_ROOT + os.sep):
+        raise TransferError('Path is outside the transfer root', 403)
+    return full
+
+
+def crc32(data: bytes) -> int:
+    return zlib.crc32(data) & 0xffffffff
+
+
+def _file_sha256(path: str, limit: Optional[int] = None) -> str:
+    """文件前limit字节（默认整个文件）的sha256"""
+    hasher = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            block = f.read(1024 * 1024 if remaining is None else min(remaining, 1024 * 1024))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher.hexdigest()
+
+
+class StreamingHash:
+    """按顺序到达的数据边传输边计算sha256；不是从0开始或中间有跳跃时在结束时整体重算"""
+
+    def __init__(self):
+        self._hasher = hashlib.sha256()
+        self.position = 0
+        self.complete = True  # 已经覆盖了从0到position的全部数据
+
+    def feed(self, offset: int, data):
+        if not self.complete:
+            return
+        if offset != self.position:
+            self.complete = False
+            return
+        self._hasher.update(data)
+        self.position += len(data)
+
+    def digest(self, path: str, size: int) -> str:
+        if self.complete and self.position == size:
+            return self._hasher.hexdigest()
+        return _blocking(_file_sha256, path, size)
+
+
+class Download:
+    """只读打开并mmap整个文件，按偏移切出块，不经过终端的解码路径"""
+
+    direction = 'download'
+
+    def __init__(self, path: str):
+        self.name = path  # 客户端给出的相对路径
+        self.path = resolve_path(path)
+        if not os.path.isfile(self.path):
+            raise TransferError('File not found: ' + path, 404)
+        self._file = open(self.path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.hash = StreamingHash()
+        ACTIVE_TRANSFERS.inc(direction=self.direction)
+
+    def read(self, offset: int, length: int) -> bytes:
+        if offset < 0 or offset > self.size:
+            raise TransferError('Offset out of range', 416, self.size)
+        if self._mmap is None:
+            return b''
+        data = self._mmap[offset:offset + length]
+        self.hash.feed(offset, data)
+        TRANSFER_BYTES.inc(len(data), direction=self.direction)
+        return data
+
+    def sha256(self) -> str:
+        return self.hash.digest(self.path, self.size)
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        self._file = None
+        ACTIVE_TRANSFERS.dec(direction=self.direction)
+
+
+class Upload:
+    """写入<目标>.part，只能在当前末尾追加；连接中断后按.part的大小续传，提交时校验并改名"""
+
+    direction = 'upload'
+
+    def __init__(self, path: str, size: Optional[int] = None, overwrite: bool = False):
+        self.name = path
+        self.path = resolve_path(path)
+        self.part_path = self.path + PART_SUFFIX
+        if os.path.isdir(self.path):
+            raise TransferError('Path is a directory: ' + path)
+        if not overwrite and os.path.exists(self.path):
+            raise TransferError('File already exists: ' + path, 409)
+        if not os.path.isdir(os.path.dirname(self.path)):
+            raise TransferError('Directory not found: ' + os.path.dirname(path), 404)
+        self.size = size  # 客户端声明的总大小，未知时为None
+        self._file = open(self.part_path, 'ab')
+        self.offset = self._file.tell()
+        if size is not None and self.offset > size:
+            # 残留的.part比新文件还大，说明不是同一个文件，从头开始
+            self._file.truncate(0)
+            self.offset = 0
+        self.hash = StreamingHash()
+        ACTIVE_TRANSFERS.inc(direction=self.direction)
+
+    def write(self, offset: int, data: bytes, checksum: Optional[int] = None) -> int:
+        """在offset处写入一块，返回新的末尾偏移"""
+        if offset != self.offset:
+            raise TransferError('Unexpected offset', 409, self.offset)
+        if checksum is not None and crc32(data) != checksum:
+            raise TransferError('Chunk checksum mismatch', 422, self.offset)
+        if self.size is not None and offset + len(data) > self.size:
+            raise TransferError('Chunk exceeds declared size', 413, self.offset)
+        self._file.write(data)
+        self.hash.feed(offset, data)
+        self.offset += len(data)
+        TRANSFER_BYTES.inc(len(data), direction=self.direction)
+        return self.offset
+
+    def write_stream(self, offset: int, stream, checksum: Optional[int] = None) -> int:
+        """把HTTP请求体按块写入offset处；校验失败时截断回offset，返回新的末尾偏移"""
+        if offset != self.offset:
+            raise TransferError('Unexpected offset', 409, self.offset)
+        crc = 0
+        while True:
+            block = stream.read(TRANSFER_CHUNK_BYTES)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            self._file.write(block)
+            self.offset += len(block)
+            TRANSFER_BYTES.inc(len(block), direction=self.direction)
+        if checksum is not None and crc & 0xffffffff != checksum:
+            self._file.truncate(offset)
+            self.offset = offset
+            raise TransferError('Chunk checksum mismatch', 422, offset)
+        return self.offset
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+
+    def commit(self, sha256: Optional[str] = None) -> Tuple[int, str]:
+        """校验完整性后把.part改名为目标文件，返回(大小, sha256)"""
+        if sha256 is not None and not isinstance(sha256, str):
+            raise TransferError('Invalid sha256: %r' % (sha256,))
+        if self.size is not None and self.offset != self.size:
+            raise TransferError('Upload incomplete', 409, self.offset)
+        self._file.flush()
+        _blocking(os.fsync, self._file.fileno())
+        digest = self.hash.digest(self.part_path, self.offset)
+        if sha256 and sha256.lower() != digest:
+            # 内容已损坏，续传也无法修复，丢弃.part
+            self.close()
+            os.remove(self.part_path)
+            raise TransferError('File checksum mismatch, upload discarded', 422, 0)
+        self.close()
+        os.replace(self.part_path, self.path)
+        logger.info("Upload committed: %s (%d bytes)", self.path, self.offset)
+        return self.offset, digest
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        ACTIVE_TRANSFERS.dec(direction=self.direction)
+
+
+class FileTransferHandler:
+    """与终端事件并列的文件传输通道
+
+    Socket.IO事件：
+      file_download_start {path, offset, chunkSize} -> file_download_info，随后连续发送file_chunk
+        {transferId, offset, data(二进制), crc32}，客户端用file_ack {transferId, offset}确认，
+        未确认的块最多TRANSFER_WINDOW个；全部确认后发送file_complete {transferId, size, sha256}
+      file_upload_start {path, size, overwrite} -> file_upload_ready {transferId, offset}
+      file_upload_chunk {transferId, offset, data, crc32} -> file_ack {transferId, offset}
+      file_upload_finish {transferId, sha256} -> file_complete
+      file_cancel {transferId}
+    出错时回复file_error {transferId, error, offset}，offset为服务端期望的续传偏移。
+    传输状态只用于加速；下载从任意偏移重新开始、上传从.part的大小继续都不依赖之前的transferId。
+    """
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+        os.makedirs(TRANSFER_ROOT, exist_ok=True)
+        self.transfers: Dict[str, dict] = {}  # transferId -> {transfer, sid, sent, acked, chunk, active}
+        self.register_handlers()
+        self.socketio.start_background_task(self._reap_idle)
+
+    def _reply(self, event: str, payload: dict, to: Optional[str] = None):
+        self.socketio.emit(event, payload, to=to or self._sid())
+
+    def _sid(self) -> Optional[str]:
+        from flask import request
+        return getattr(request, 'sid', None)
+
+    def _error(self, transfer_id: Optional[str], error: Exception):
+        error = as_transfer_error(error)
+        self._reply('file_error', {'transferId': transfer_id, 'error': str(error), 'offset': error.offset})
+
+    def _open(self, transfer, **state) -> str:
+        transfer_id = str(uuid.uuid4())
+        self.transfers[transfer_id] = dict(state, transfer=transfer, sid=self._sid(), active=time.monotonic())
+        return transfer_id
+
+    def _get(self, data: dict) -> Tuple[str, dict]:
+        transfer_id = data.get('transferId')
+        entry = self.transfers.get(transfer_id)
+        if not entry or entry['sid'] != self._sid():
+            raise TransferError('Transfer not found', 404)
+        entry['active'] = time.monotonic()
+        return transfer_id, entry
+
+    def _close(self, transfer_id: str):
+        entry = self.transfers.pop(transfer_id, None)
+        if entry:
+            entry['transfer'].close()
+
+    def _reap_idle(self):
+        """定期关闭长时间没有活动的传输（客户端断开后不会再发送事件）"""
+        while True:
+            self.socketio.sleep(min(60.0, TRANSFER_IDLE_TIMEOUT))
+            deadline = time.monotonic() - TRANSFER_IDLE_TIMEOUT
+            for transfer_id, entry in list(self.transfers.items()):
+                if entry['active'] < deadline:
+                    logger.info("Closing idle transfer %s", transfer_id)
+                    self._close(transfer_id)
+
+    def _send_window(self, transfer_id: str, entry: dict):
+        """在窗口允许的范围内继续发送下载块"""
+        download = entry['transfer']
+        chunk = entry['chunk']
+        while entry['sent'] < download.size and entry['sent'] - entry['acked'] < chunk * TRANSFER_WINDOW:
+            offset = entry['sent']
+            data = download.read(offset, chunk)
+            entry['sent'] += len(data)
+            self._reply('file_chunk', {
+                'transferId': transfer_id,
+                'offset': offset,
+                'data': data,
+                'crc32': crc32(data)
+            }, to=entry['sid'])
+        if entry['acked'] >= download.size:
+            self._reply('file_complete', {
+                'transferId': transfer_id,
+                'path': download.name,
+                'size': download.size,
+                'sha256': download.sha256()
+            }, to=entry['sid'])
+            self._close(transfer_id)
+
+    def register_handlers(self):
+        """注册SocketIO事件处理器"""
+
+        @self.socketio.on('file_download_start')
+        @metrics.instrument_event('file_download_start')
+        def handle_download_start(data):
+            try:
+                offset = parse_int(data.get('offset'), 'offset', 0)
+                chunk = parse_int(data.get('chunkSize'), 'chunkSize', TRANSFER_CHUNK_BYTES)
+                download = Download(data.get('path'))
+                if offset < 0 or offset > download.size:
+                    download.close()
+                    raise TransferError('Offset out of range', 416, download.size)
+            except (TransferError, OSError) as e:
+                self._error(None, e)
+                return
+            chunk = max(1, min(chunk, TRANSFER_CHUNK_BYTES))
+            transfer_id = self._open(download, sent=offset, acked=offset, chunk=chunk)
+            self._reply('file_download_info', {
+                'transferId': transfer_id,
+                'path': data.get('path'),
+                'size': download.size,
+                'offset': offset,
+                'chunkSize': chunk
+            })
+            logger.info("Download started: %s from %d (%d bytes)", download.path, offset, download.size)
+            self._send_window(transfer_id, self.transfers[transfer_id])
+
+        @self.socketio.on('file_ack')
+        @metrics.instrument_event('file_ack')
+        def handle_ack(data):
+            try:
+                transfer_id, entry = self._get(data)
+                offset = parse_int(data.get('offset'), 'offset', 0)
+                entry['acked'] = max(entry['acked'], min(offset, entry['sent']))
+                self._send_window(transfer_id, entry)
+            except (TransferError, OSError) as e:
+                self._error(data.get('transferId'), e)
+
+        @self.socketio.on('file_upload_start')
+        @metrics.instrument_event('file_upload_start')
+        def handle_upload_start(data):
+            try:
+                upload = Upload(data.get('path'), parse_int(data.get('size'), 'size'),
+                                bool(data.get('overwrite', False)))
+            except (TransferError, OSError) as e:
+                self._error(None, e)
+                return
+            transfer_id = self._open(upload)
+            self._reply('file_upload_ready', {
+                'transferId': transfer_id,
+                'path': data.get('path'),
+                'offset': upload.offset,
+                'chunkSize': TRANSFER_CHUNK_BYTES
+            })
+            logger.info("Upload started: %s from %d", upload.path, upload.offset)
+
+        @self.socketio.on('file_upload_chunk')
+        @metrics.instrument_event('file_upload_chunk')
+        def handle_upload_chunk(data):
+            try:
+                transfer_id, entry = self._get(data)
+                chunk = data.get('data') or b''
+                if not isinstance(chunk, (bytes, bytearray)):
+                    # JSON客户端发来的字符串等：块必须是Socket.IO二进制附件
+                    raise TransferError('Invalid data: chunks must be binary')
+                offset = entry['transfer'].write(parse_int(data.get('offset'), 'offset', -1), chunk,
+                                                 parse_int(data.get('crc32'), 'crc32'))
+                self._reply('file_ack', {'transferId': transfer_id, 'offset': offset})
+            except (TransferError, OSError) as e:
+                self._error(data.get('transferId'), e)
+
+        @self.socketio.on('file_upload_finish')
+        @metrics.instrument_event('file_upload_finish')
+        def handle_upload_finish(data):
+            try:
+                transfer_id, entry = self._get(data)
+                size, digest = entry['transfer'].commit(data.get('sha256'))
+                self.transfers.pop(transfer_id, None)
+                self._reply('file_complete', {
+                    'transferId': transfer_id,
+                    'path': entry['transfer'].name,
+                    'size': size,
+                    'sha256': digest
+                })
+            except (TransferError, OSError) as e:
+                entry = self.transfers.get(data.get('transferId'))
+                if entry and entry['transfer'].closed:
+                    self.transfers.pop(data.get('transferId'), None)
+                self._error(data.get('transferId'), e)
+
+        @self.socketio.on('file_cancel')
+        def handle_cancel(data):
+            transfer_id = data.get('transferId')
+            entry = self.transfers.get(transfer_id)
+            if entry and entry['sid'] == self._sid():
+                self._close(transfer_id)
+
+    def register_routes(self, app):
+        """HTTP接口：GET支持Range续传，PUT按偏移追加，POST提交"""
+        from flask import Response, jsonify, request
+
+        def error_response(e: Exception):
+            e = as_transfer_error(e)
+            return jsonify({'error': str(e), 'offset': e.offset}), e.status
+
+        @app.route('/files', methods=['GET'])
+        def download_file():
+            try:
+                download = Download(request.args.get('path', ''))
+            except (TransferError, OSError) as e:
+                return error_response(e)
+            start, stop = 0, download.size
+            status = 200
+            if request.range is not None:
+                byte_range = request.range.range_for_length(download.size)
+                if byte_range is None:
+                    download.close()
+                    return error_response(TransferError('Range not satisfiable', 416, download.size))
+                start, stop = byte_range
+                status = 206
+
+            def generate():
+                try:
+                    offset = start
+                    while offset < stop:
+                        data = download.read(offset, min(TRANSFER_CHUNK_BYTES, stop - offset))
+                        offset += len(data)
+                        yield data
+                finally:
+                    download.close()
+
+            response = Response(generate(), status=status, mimetype='application/octet-stream',
+                                direct_passthrough=True)
+            response.headers['Content-Length'] = str(stop - start)
+            response.headers['Accept-Ranges'] = 'bytes'
+            if status == 206:
+                response.headers['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1, download.size)
+            return response
+
+        @app.route('/files/stat', methods=['GET'])
+        def stat_file():
+            try:
+                path = resolve_path(request.args.get('path', ''))
+                result = {'path': request.args.get('path'), 'exists': os.path.isfile(path)}
+                if result['exists']:
+                    result['size'] = os.path.getsize(path)
+                    result['mtime'] = os.path.getmtime(path)
+                    if request.args.get('sha256'):
+                        result['sha256'] = _blocking(_file_sha256, path)
+                # 未完成的上传从这个偏移续传
+                result['uploadOffset'] = os.path.getsize(path + PART_SUFFIX) if os.path.isfile(path + PART_SUFFIX) else 0
+            except (TransferError, OSError) as e:
+                return error_response(e)
+            return jsonify(result)
+
+        @app.route('/files', methods=['PUT'])
+        def upload_chunk():
+            try:
+                offset = parse_int(request.args.get('offset'), 'offset')
+                checksum = parse_int(request.args.get('crc32'), 'crc32')
+                upload = Upload(request.args.get('path', ''), overwrite=request.args.get('overwrite') == 'true')
+            except (TransferError, OSError) as e:
+                return error_response(e)
+            try:
+                offset = upload.write_stream(upload.offset if offset is None else offset, request.stream, checksum)
+                return jsonify({'offset': offset})
+            except (TransferError, OSError) as e:
+                return error_response(e)
+            finally:
+                upload.close()
+
+        @app.route('/files/commit', methods=['POST'])
+        def commit_upload():
+            try:
+                path = request.args.get('path', '')
+                # Upload会创建空的.part，没有进行中的上传时不能把空文件当作上传结果提交
+                if not os.path.isfile(resolve_path(path) + PART_SUFFIX):
+                    raise TransferError('No upload in progress: ' + path, 404)
+                upload = Upload(path, overwrite=request.args.get('overwrite') == 'true')
+            except (TransferError, OSError) as e:
+                return error_response(e)
+            try:
+                size, digest = upload.commit(request.args.get('sha256'))
+                return jsonify({'path': upload.name, 'size': size, 'sha256': digest})
+            except (TransferError, OSError) as e:
+                return error_response(e)
+            finally:
+                upload.close()
@@ -0,0 +1,267 @@
+import os
+import time
+import bisect
+import functools
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 指标名前缀
+PREFIX = 'quickdemo_'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join('%s="%s"' % (k, v) for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self, others: Sequence[dict] = ()) -> List[str]:
+        """输出本指标；others为其他进程同名指标的快照，数值累加后一起输出"""
+        values = self.snapshot()
+        for other in others:
+            self._merge(values, other)
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.type_name)]
+        lines.extend(self._samples(values))
+        return lines
+
+    def snapshot(self) -> dict:
+        """当前数值的可序列化副本"""
+        raise NotImplementedError
+
+    def _merge(self, values: dict, other: dict):
+        raise NotImplementedError
+
+    def _samples(self, values: dict) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def _merge(self, values: dict, other: dict):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def _samples(self, values: dict) -> List[str]:
+        return ['%s%s %s' % (self.name, _format_labels(self.label_names, key), _format_value(v))
+                for key, v in sorted(values.items())]
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值；也可以绑定一个在抓取时调用的函数"""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._function: Optional[Callable[[], float]] = None
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """抓取时调用function取值（只用于本身就是O(1)的量）"""
+        self._function = function
+
+    def snapshot(self) -> dict:
+        if self._function is not None:
+            try:
+                return {(): self._function()}
+            except Exception:
+                return {}
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    """固定分桶的直方图"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = sorted(buckets)
+        # key -> [各桶计数(不累加，最后一个为+Inf), 总和]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def _merge(self, values: dict, other: dict):
+        for key, (counts, total) in other.items():
+            if key in values:
+                mine, my_total = values[key]
+                values[key] = ([a + b for a, b in zip(mine, counts)], my_total + total)
+            else:
+                values[key] = (list(counts), total)
+
+    def _samples(self, values: dict) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _format_labels(self.label_names, key, ('le', _format_value(bound))), cumulative))
+            labels = _format_labels(self.label_names, key)
+            lines.append('%s_sum%s %s' % (self.name, labels, _format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+
+class Registry:
+    """指标注册表，按Prometheus文本格式输出"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float], labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets, labels))
+
+    def snapshot(self) -> Dict[str, dict]:
+        """所有指标当前数值的快照，供其他进程合并输出"""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, others: Sequence[Dict[str, dict]] = ()) -> str:
+        """输出所有指标；others为其他进程（如分片工作进程）的快照，同名指标累加"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render([other.get(metric.name, {}) for other in others]))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 终端后端的指标：由处理器在事件发生时增量维护，抓取只是读出当前值
+SESSIONS = REGISTRY.gauge('terminal_sessions', 'Active terminal sessions')
+TASKS = REGISTRY.gauge('terminal_tasks', 'Terminal tasks by state', ['state'])
+TASKS_STARTED = REGISTRY.counter('terminal_tasks_started_total', 'Terminal tasks started', ['source'])
+OPEN_PTYS = REGISTRY.gauge('pty_open_master_fds', 'Open PTY master file descriptors')
+REACTOR_READERS = REGISTRY.gauge('reactor_readers', 'File descriptors registered with the I/O reactor (PTY masters and pidfds)')
+THREADS = REGISTRY.gauge('threads', 'Live Python threads')
+PAUSED_TASKS = REGISTRY.gauge('terminal_tasks_paused', 'Tasks whose PTY reads are paused by flow control')
+RESIZES = REGISTRY.counter('terminal_resizes_total', 'Terminal resize requests by outcome (applied, coalesced, unchanged)', ['result'])
+BYTES_READ = REGISTRY.counter('pty_read_bytes_total', 'Bytes read from PTY masters')
+BYTES_EMITTED = REGISTRY.counter('output_emitted_bytes_total', 'Output bytes emitted to clients')
+FRAMES_EMITTED = REGISTRY.counter('output_frames_total', 'Output frames emitted to clients')
+REDRAW_BYTES_DROPPED = REGISTRY.counter(
+    'output_redraw_dropped_bytes_total', 'Overwritten carriage-return redraw bytes dropped for clients that fell behind')
+EMIT_PENDING = REGISTRY.gauge('output_pending_bytes', 'Bytes read from PTYs and waiting in coalescers to be emitted')
+FRAME_BYTES = REGISTRY.histogram(
+    'output_frame_bytes', 'Size of emitted output frames',
+    [64, 256, 1024, 4096, 16384, 32768, 65536, 262144])
+SPAWN_SECONDS = REGISTRY.histogram(
+    'terminal_spawn_seconds', 'Time to start a task (PTY setup and fork, or handing a command to a warm shell)',
+    [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0], ['source'])
+THREADS.set_function(threading.active_count)
+
+# Socket.IO事件耗时统计开关；关闭时instrument_event直接返回原处理器，没有任何额外开销
+EVENT_METRICS_ENABLED = os.environ.get('PTY_EVENT_METRICS', 'false').lower() == 'true'
+
+EVENT_SECONDS = REGISTRY.histogram(
+    'socketio_event_handler_seconds', 'Time spent inside a Socket.IO event handler',
+    [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0], ['event'])
+EVENT_QUEUE_SECONDS = REGISTRY.histogram(
+    'socketio_event_queue_seconds', 'Delay from the client sending an event (sentAt) to its handler starting',
+    [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0], ['event'])
+EVENT_PAYLOAD_BYTES = REGISTRY.histogram(
+    'socketio_event_payload_bytes', 'Size of string and binary fields in a Socket.IO event payload',
+    [16, 64, 256, 1024, 4096, 16384, 65536], ['event'])
+
+
+def _payload_size(data) -> int:
+    if isinstance(data, (str, bytes, bytearray)):
+        return len(data)
+    if isinstance(data, dict):
+        return sum(len(v) for v in data.values() if isinstance(v, (str, bytes, bytearray)))
+    return 0
+
+
+def instrument_event(event: str, enabled: Optional[bool] = None):
+    """Socket.IO事件处理器装饰器：按事件记录处理耗时、排队延迟和负载大小
+
+    排队延迟依赖客户端在负载中附带的发送时间sentAt（毫秒时间戳），没有时不记录。
+    处理耗时统计的是处理器本身占用hub的时间，可以据此找出阻塞eventlet的事件。
+    """
+    def decorator(handler: Callable) -> Callable:
+        if not (EVENT_METRICS_ENABLED if enabled is None else enabled):
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(*args):
+            started = time.perf_counter()
+            data = args[0] if args else None
+            if isinstance(data, dict):
+                sent_at = data.get('sentAt')
+                if isinstance(sent_at, (int, float)):
+                    delay = time.time() - sent_at / 1000.0
+                    if delay >= 0:  # 客户端时钟超前时无法计算
+                        EVENT_QUEUE_SECONDS.observe(delay, event=event)
+            EVENT_PAYLOAD_BYTES.observe(_payload_size(data), event=event)
+            try:
+                return handler(*args)
+            finally:
+                EVENT_SECONDS.observe(time.perf_counter() - started, event=event)
+        return wrapper
+    return decorator
@@ -0,0 +1,63 @@
+import os
+import signal
+import time
+import logging
+import subprocess
+from typing import Iterable
+
+logger = logging.getLogger('ProcessUtils')
+
+# 批量终止时等待进程响应SIGTERM的统一期限（秒）
+TERMINATE_TIMEOUT = 2.0
+
+
+def signal_process_group(process: subprocess.Popen, sig: int):
+    """向进程所在的进程组发送信号（Windows下退化为terminate/kill）"""
+    try:
+        if os.name == 'nt':
+            if sig == signal.SIGTERM:
+                process.terminate()
+            else:
+                process.kill()
+        else:
+            os.killpg(os.getpgid(process.pid), sig)
+    except (ProcessLookupError, PermissionError, OSError):
+        # 进程已经退出
+        pass
+
+
+def terminate_process_groups(processes: Iterable[subprocess.Popen], timeout: float = TERMINATE_TIMEOUT):
+    """同时终止一批进程组，并在统一的截止时间内回收
+
+    先一次性向所有进程组发送SIGHUP和SIGTERM，再在共同的期限内并发回收；
+    期限到了仍未退出的统一发送SIGKILL。总耗时不随进程数量增长。
+    """
+    alive = [p for p in processes if p is not None and p.poll() is None]
+    if not alive:
+        return
+
+    for process in alive:
+        if os.name != 'nt':
+            # 与终端挂断一致：pty里的交互式shell忽略SIGTERM，但收到SIGHUP会退出
+            signal_process_group(process, signal.SIGHUP)
+        signal_process_group(process, signal.SIGTERM)
+
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while alive:
+        alive = [p for p in alive if p.poll() is None]
+        remaining = deadline - time.monotonic()
+        if not alive or remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.1)
+
+    if alive:
+        logger.warning("%d processes ignored SIGTERM, sending SIGKILL", len(alive))
+        for process in alive:
+            signal_process_group(process, signal.SIGKILL)
+        for process in alive:
+            try:
+                process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                logger.error("Process %s did not exit after SIGKILL", process.pid)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import contextvars
+import threading
+from typing import Callable, Dict, Optional
+
+from pty_handler import PtyTerminalHandler
+from pty_reactor import AsyncioReactor
+
+logger = logging.getLogger('PtyAsync')
+
+# 当前事件来自哪个Socket.IO客户端（每个事件在自己的上下文中处理）
+_current_sid: contextvars.ContextVar = contextvars.ContextVar('current_sid', default=None)
+
+# 需要在执行器中处理的事件：终止进程组会等待进程退出，不能挡住事件循环
+BLOCKING_EVENTS = {'terminal_disconnect'}
+
+
+class AsyncSocketIOAdapter:
+    """asyncio模式下代替SocketIO：收集事件处理器，emit和加入房间交给AsyncServer执行
+
+    emit可能来自事件循环中的反应器回调，也可能来自执行器线程；
+    所有操作进入同一个队列，由一个任务按顺序发送，保证同一会话的事件不乱序。
+    """
+
+    def __init__(self, sio, loop: asyncio.AbstractEventLoop):
+        self.sio = sio
+        self.loop = loop
+        self.handlers: Dict[str, Callable] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._thread_ident = threading.get_ident()
+        self._pump_task = loop.create_task(self._pump())
+
+    def on(self, event: str, namespace: Optional[str] = None):
+        def decorator(handler):
+            self.handlers[event] = handler
+            return handler
+        return decorator
+
+    def emit(self, event: str, payload: dict, to: Optional[str] = None, **kwargs):
+        self._put(('emit', event, payload, to))
+
+    def enter_room(self, sid: str, room: str):
+        self._put(('join', sid, room))
+
+    def _put(self, item: tuple):
+        if threading.get_ident() == self._thread_ident:
+            self._queue.put_nowait(item)
+        else:
+            self.loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def _pump(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                if item[0] == 'emit':
+                    _, event, payload, to = item
+                    await self.sio.emit(event, payload, to=to)
+                else:
+                    _, sid, room = item
+                    await self.sio.enter_room(sid, room)
+            except Exception as e:
+                logger.error("Failed to send %s: %s", item[1], e)
+
+
+class AsyncPtyTerminalHandler(PtyTerminalHandler):
+    """asyncio模式的PTY终端处理器
+
+    master fd直接注册到事件循环（loop.add_reader），事件处理器在事件循环中同步执行，
+    与eventlet模式使用同一套事件协议，不需要monkey patch。必须在事件循环中创建。
+    """
+
+    def __init__(self, sio, loop: Optional[asyncio.AbstractEventLoop] = None):
+        loop = loop or asyncio.get_running_loop()
+        self.loop = loop
+        super().__init__(AsyncSocketIOAdapter(sio, loop), AsyncioReactor(loop))
+        for event in self.socketio.handlers:
+            # connect/disconnect的参数与终端事件不同，且只记录日志，无需转发
+            if event.startswith('terminal_'):
+                sio.on(event, self._make_dispatcher(event))
+
+    def _reply(self, event: str, payload: dict, to: Optional[str] = None):
+        self.socketio.emit(event, payload, to=to or _current_sid.get())
+
+    def _join(self, room: str):
+        self.socketio.enter_room(_current_sid.get(), room)
+
+    def _run_in_background(self, target):
+        self.loop.run_in_executor(None, contextvars.copy_context().run, target)
+
+    def _make_dispatcher(self, event: str):
+        handler = self.socketio.handlers[event]
+        blocking = event in BLOCKING_EVENTS
+
+        async def dispatch(sid, data=None):
+            _current_sid.set(sid)
+            try:
+                if blocking:
+                    context = contextvars.copy_context()
+                    await self.loop.run_in_executor(None, context.run, handler, data)
+                else:
+                    handler(data)
+            except Exception as e:
+                logger.error("Error handling %s: %s", event, e)
+        return dispatch
@@ -1,17 +1,34 @@
 import os
-import pty
-import select
-import subprocess
+import codecs
+import errno
 import threading
 import uuid
 import time
 import signal
-from flask_socketio import SocketIO, emit
-from typing import Dict, Optional, List
+from flask_socketio import SocketIO, emit, join_room
+from typing import Callable, Dict, Optional, List
 import logging
-import termios
-import struct
-import fcntl
+from functools import partial
+
+try:
+    # 打过补丁的os.read在EAGAIN时会挂起等待可读，过期的就绪事件会卡住反应器；这里需要原生的非阻塞读
+    from eventlet import patcher as _patcher
+    _os = _patcher.original('os')
+except ImportError:
+    _os = os
+
+import metrics
+from pty_output import (COLLAPSE_REDRAWS, CommandMarkerScanner, OutputCoalescer, ScrollbackBuffer,
+                        collapse_redraws)
+from pty_pool import (PtyPool, persistent_command_line, set_terminal_size, spawn_idle_shell,
+                      spawn_pty_process, start_persistent_shell)
+from process_utils import terminate_process_groups
+from pty_input import InputWriter
+from pty_recorder import start_recording
+from pty_screen import SCREEN_FPS, ScreenModel, screen_available
+from pty_reactor import PtyReactor, get_reactor
+from pty_scheduler import ScheduledTask, TaskScheduler
+from pty_stats import STATS_INTERVAL, ProcessSampler, stats_available
 
 # 配置日志
 logging.basicConfig(
@@ -32,16 +49,59 @@ def info_log(message: str, *args):
     """重要信息日志"""
     logger.info(message, *args)
 
+def parse_int(value, default: Optional[int] = None) -> Optional[int]:
+    """把客户端传来的整数参数转换为int；缺失时返回default，格式错误时返回None"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# 进程退出后最多再从pty中读出的字节数，防止仍持有slave端的子孙进程无限输出
+PTY_DRAIN_LIMIT = 1024 * 1024
+
+# 流控水位（字节）：未确认输出超过高水位时暂停读取pty，回落到低水位后恢复
+FLOW_HIGH_WATER = int(os.environ.get('PTY_FLOW_HIGH_WATER', str(256 * 1024)))
+FLOW_LOW_WATER = int(os.environ.get('PTY_FLOW_LOW_WATER', str(FLOW_HIGH_WATER // 2)))
+
+# 中断升级时间表（秒）：Ctrl+C后多久发SIGTERM，SIGTERM后多久发SIGKILL
+INTERRUPT_TERM_DELAY = 0.5
+INTERRUPT_KILL_DELAY = 3.0
+
+# 尺寸调整的静默期（秒）：拖动窗口时连续的resize只立即应用第一个，
+# 之后只在停止调整这么久后应用最新的尺寸，避免全屏程序反复重绘
+RESIZE_DEBOUNCE = float(os.environ.get('PTY_RESIZE_DEBOUNCE', '0.15'))
+
 class PtyTerminalSession:
-    def __init__(self, session_id: str, socketio: SocketIO):
+    def __init__(self, session_id: str, socketio: SocketIO, reactor: Optional[PtyReactor] = None,
+                 binary: bool = False, flow_control: bool = False, pool: Optional[PtyPool] = None):
         self.session_id = session_id
         self.socketio = socketio
-        self.terminals: Dict[str, dict] = {}  # taskId -> {master_fd, slave_fd, process, thread}
+        self.reactor = reactor or get_reactor()
+        self.pool = pool
+        self.binary = binary  # True: 输出以原始字节作为Socket.IO二进制附件发送
+        self.flow_control = flow_control  # True: 客户端通过terminal_ack确认消费进度
+        self.terminals: Dict[str, dict] = {}  # taskId -> {master_fd, process, command, rows, cols, created_at}
         self.running_tasks: Dict[str, bool] = {}  # taskId -> is_running
+        self.on_task_done: Optional[Callable[[str], None]] = None  # 任务结束后调用（归还调度配额）
         debug_log("Created pty terminal session: %s", session_id)
     
-    def create_terminal(self, task_id: str, command: str, rows: int = 24, cols: int = 80):
-        """创建新的pty终端"""
+    def _emit(self, event: str, payload: dict):
+        """只向加入了本会话房间的客户端发送事件"""
+        self.socketio.emit(event, payload, to=self.session_id)
+    
+    def create_terminal(self, task_id: str, command: str, rows: int = 24, cols: int = 80,
+                        persistent: bool = False, record: bool = False, screen: bool = False):
+        """创建新的pty终端
+
+        persistent为True时任务对应一个常驻shell，命令结束后shell保留，
+        后续命令通过run_command写入同一个pty。record为True时把输出录制为asciicast v2文件。
+        screen为True时输出由服务端屏幕模型解析，按帧率发送屏幕差异（需要pyte）。
+        """
+        master_fd = process = None
         try:
             debug_log("Creating pty terminal for task: %s, command: %s", task_id, command)
             
@@ -50,56 +110,25 @@ class PtyTerminalSession:
                 debug_log("Terminal %s already exists", task_id)
                 return False
             
-            # 创建pty
-            master_fd, slave_fd = pty.openpty()
-            
-            # 设置终端尺寸
-            self._set_terminal_size(master_fd, rows, cols)
-            
-            # 创建进程
-            env = os.environ.copy()
-            env['TERM'] = 'xterm-256color'
-            env['COLORTERM'] = 'truecolor'  # 支持24位真彩色
-            env['COLUMNS'] = str(cols)
-            env['LINES'] = str(rows)
-            # 强制启用颜色输出
-            env['CLICOLOR'] = '1'
-            env['FORCE_COLOR'] = '1'
-            env['CLICOLOR_FORCE'] = '1'
-            # 禁用分页器以确保颜色输出
-            env['PAGER'] = 'cat'
-            env['LESS'] = '-R'  # 允许ANSI颜色通过
-            # Python特定的颜色强制
-            env['PYTHONUNBUFFERED'] = '1'
-            env['PY_COLORS'] = '1'
-            
-            if os.name == 'nt':  # Windows - 使用winpty或者fallback到subprocess
-                # Windows下pty支持有限，可能需要特殊处理
-                process = subprocess.Popen(
-                    command,
-                    shell=True,
-                    stdin=slave_fd,
-                    stdout=slave_fd,
-                    stderr=slave_fd,
-                    env=env,
-                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
-                )
-            else:  # Unix/Linux
-                process = subprocess.Popen(
-                    command,
-                    shell=True,
-                    stdin=slave_fd,
-                    stdout=slave_fd,
-                    stderr=slave_fd,
-                    env=env,
-                    preexec_fn=os.setsid
-                )
-            
-            # 关闭子进程中的slave端
-            os.close(slave_fd)
-            
-            # 设置master端为非阻塞
-            fcntl.fcntl(master_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+            if screen and not screen_available():
+                logger.warning("Screen mode needs pyte (pip install 'quick-demo[screen]'), "
+                               "task %s streams raw output instead", task_id)
+            
+            started = time.perf_counter()
+            # 超长的命令写不进空闲shell的一行输入，直接启动进程
+            use_pool = self.pool and (persistent or self.pool.accepts(command, rows, cols))
+            shell = self.pool.acquire() if use_pool else None
+            source = 'pool' if shell else 'spawn'
+            if persistent:
+                master_fd, process = shell or spawn_idle_shell(rows, cols)
+                start_persistent_shell(master_fd, rows, cols)
+            elif shell:
+                # 预热池中的shell已就绪，直接把命令交给它执行
+                master_fd, process = shell
+                self.pool.run_command(master_fd, command, rows, cols)
+                debug_log("Using warm shell %s for task %s", process.pid, task_id)
+            else:
+                master_fd, process = spawn_pty_process(command, rows, cols, shell=True)
             
             # 保存终端信息
             self.terminals[task_id] = {
@@ -108,20 +137,44 @@ class PtyTerminalSession:
                 'command': command,
                 'rows': rows,
                 'cols': cols,
-                'created_at': time.time()
+                'created_at': time.time(),
+                'coalescer': OutputCoalescer(self.reactor, partial(self._emit_output, task_id)),
+                'writer': InputWriter(self.reactor, master_fd),  # 用户输入写队列
+                'scrollback': ScrollbackBuffer(),
+                'emitted': 0,  # 已发送的字节偏移
+                'acked': 0,  # 客户端已确认的字节偏移
+                'paused': False,  # 流控暂停读取
+                # 文本模式下跨帧保留未完整的多字节字符
+                'decoder': None if self.binary else codecs.getincrementaldecoder('utf-8')(errors='replace'),
+                'recording': start_recording(task_id, command, rows, cols) if record else None,
+                'screen': ScreenModel(rows, cols) if screen and screen_available() else None,
+                'screen_timer': None,  # 下一帧屏幕的定时器
+                'screen_seq': 0,  # 已发送的屏幕帧序号
+                'stats': None,  # 最近一次资源采样（cpu/rss/read/write/procs）
+                'resize_timer': None,  # 合并尺寸调整的静默期定时器
+                'pending_size': None  # 静默期内收到的最新尺寸(rows, cols)
             }
+            metrics.OPEN_PTYS.inc()
+            self._set_task_state(self.terminals[task_id], 'running')
             self.running_tasks[task_id] = True
+            # 首块输出不等合并窗口，缩短命令启动到首字节的延迟
+            self.terminals[task_id]['coalescer'].immediate = True
             
-            # 启动输出读取线程
-            output_thread = threading.Thread(
-                target=self._read_pty_output, 
-                args=(task_id,)
-            )
-            output_thread.daemon = True
-            output_thread.start()
+            if persistent:
+                self.terminals[task_id].update({
+                    'persistent': True,
+                    'marker': CommandMarkerScanner(),
+                    'seq': 0,  # 当前命令序号，只认与之匹配的结束标记
+                    'busy': False  # 是否有命令正在执行
+                })
+                self._send_shell_command(task_id, self.terminals[task_id], command)
             
-            self.terminals[task_id]['thread'] = output_thread
+            # 交给共享反应器监听输出和进程退出
+            self.reactor.add_reader(master_fd, self._on_pty_readable, task_id)
+            self.reactor.watch_process(process, self._on_process_exit, task_id)
             
+            metrics.TASKS_STARTED.inc(source=source)
+            metrics.SPAWN_SECONDS.observe(time.perf_counter() - started, source=source)
             info_log("Terminal created for task: %s", task_id)
             return True
             
@@ -130,32 +183,123 @@ class PtyTerminalSession:
             # 清理资源
             if task_id in self.terminals:
                 terminal_info = self.terminals[task_id]
-                if 'master_fd' in terminal_info:
-                    try:
-                        os.close(terminal_info['master_fd'])
-                    except:
-                        pass
+                if terminal_info.get('master_fd') is not None:
+                    terminal_info['writer'].close()
+                    # 可能已经注册到反应器，经由反应器注销后再关闭
+                    self.reactor.close_fd(terminal_info['master_fd'])
+                    metrics.OPEN_PTYS.dec()
+                self._set_task_state(terminal_info, None)
                 del self.terminals[task_id]
+            elif master_fd is not None:
+                # 还没登记的shell（例如向预热shell写入命令失败）
+                try:
+                    os.close(master_fd)
+                except OSError:
+                    pass
+            if process is not None:
+                terminate_process_groups([process], timeout=0.5)
             return False
     
+    def run_command(self, task_id: str, command: str) -> bool:
+        """在空闲的常驻shell中执行下一条命令"""
+        terminal_info = self.terminals.get(task_id)
+        if (not terminal_info or not terminal_info.get('persistent') or terminal_info['busy']
+                or terminal_info.get('finished') or terminal_info.get('master_fd') is None):
+            return False
+        started = time.perf_counter()
+        try:
+            self._send_shell_command(task_id, terminal_info, command)
+        except OSError as e:
+            logger.error("Failed to run command in shell %s: %s", task_id, e)
+            terminal_info['busy'] = False
+            self.running_tasks[task_id] = False
+            return False
+        terminal_info['command'] = command
+        terminal_info['coalescer'].immediate = True
+        self._set_task_state(terminal_info, 'running')
+        metrics.TASKS_STARTED.inc(source='shell')
+        metrics.SPAWN_SECONDS.observe(time.perf_counter() - started, source='shell')
+        return True
+    
+    def _send_shell_command(self, task_id: str, terminal_info: dict, command: str):
+        if terminal_info['recording']:
+            terminal_info['recording'].marker(command)
+        terminal_info['seq'] += 1
+        terminal_info['busy'] = True
+        self.running_tasks[task_id] = True
+        terminal_info['writer'].write(persistent_command_line(
+            command, terminal_info['marker'].marker_command(terminal_info['seq'])))
+        debug_log("Sent command %d to shell %s", terminal_info['seq'], task_id)
+    
+    def _set_task_state(self, terminal_info: dict, state: Optional[str]):
+        """更新任务状态并同步按状态统计的任务数；state为None表示任务被移除"""
+        previous = terminal_info.get('state')
+        if previous == state:
+            return
+        if previous:
+            metrics.TASKS.dec(state=previous)
+        if state:
+            metrics.TASKS.inc(state=state)
+        terminal_info['state'] = state
+    
     def _set_terminal_size(self, fd: int, rows: int, cols: int):
         """设置终端尺寸"""
         try:
-            size = struct.pack('HHHH', rows, cols, 0, 0)
-            fcntl.ioctl(fd, termios.TIOCSWINSZ, size)
+            set_terminal_size(fd, rows, cols)
         except Exception as e:
             debug_log("Failed to set terminal size: %s", e)
     
     def resize_terminal(self, task_id: str, rows: int, cols: int):
-        """调整终端尺寸"""
-        if task_id in self.terminals:
-            terminal_info = self.terminals[task_id]
-            self._set_terminal_size(terminal_info['master_fd'], rows, cols)
-            terminal_info['rows'] = rows
-            terminal_info['cols'] = cols
-            debug_log("Resized terminal %s to %dx%d", task_id, rows, cols)
-            return True
-        return False
+        """调整终端尺寸
+
+        同一任务的连续调整会被合并：静默期外的第一次立即生效，静默期内只记录最新尺寸，
+        静默期结束后再应用；与当前尺寸相同的调整直接忽略。
+        """
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or terminal_info.get('master_fd') is None:
+            return False
+        self.reactor.call_soon_threadsafe(self._request_resize, task_id, rows, cols)
+        return True
+    
+    def _request_resize(self, task_id: str, rows: int, cols: int):
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or terminal_info.get('master_fd') is None:
+            return
+        if terminal_info['resize_timer'] is not None:
+            # 静默期内：只保留最新尺寸，并从现在起重新计时
+            terminal_info['pending_size'] = (rows, cols)
+            terminal_info['resize_timer'].cancel()
+            terminal_info['resize_timer'] = self.reactor.call_later(RESIZE_DEBOUNCE, self._flush_resize, task_id)
+            metrics.RESIZES.inc(result='coalesced')
+            return
+        if self._apply_resize(task_id, terminal_info, rows, cols) and RESIZE_DEBOUNCE > 0:
+            terminal_info['resize_timer'] = self.reactor.call_later(RESIZE_DEBOUNCE, self._flush_resize, task_id)
+    
+    def _flush_resize(self, task_id: str):
+        """静默期结束，应用期间收到的最新尺寸"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info:
+            return
+        terminal_info['resize_timer'] = None
+        size, terminal_info['pending_size'] = terminal_info['pending_size'], None
+        if size and terminal_info.get('master_fd') is not None:
+            self._apply_resize(task_id, terminal_info, *size)
+    
+    def _apply_resize(self, task_id: str, terminal_info: dict, rows: int, cols: int) -> bool:
+        """设置pty尺寸（每次都会让前台程序收到SIGWINCH），尺寸未变时返回False"""
+        if (rows, cols) == (terminal_info['rows'], terminal_info['cols']):
+            metrics.RESIZES.inc(result='unchanged')
+            return False
+        self._set_terminal_size(terminal_info['master_fd'], rows, cols)
+        terminal_info['rows'] = rows
+        terminal_info['cols'] = cols
+        if terminal_info['recording']:
+            terminal_info['recording'].resize(cols, rows)
+        if terminal_info['screen']:
+            self._resize_screen(task_id, rows, cols)
+        metrics.RESIZES.inc(result='applied')
+        debug_log("Resized terminal %s to %dx%d", task_id, rows, cols)
+        return True
     
     def write_to_terminal(self, task_id: str, data: str):
         """向终端写入数据（用户输入）"""
@@ -164,83 +308,303 @@ class PtyTerminalSession:
             return False
         
         terminal_info = self.terminals[task_id]
+        if terminal_info.get('master_fd') is None:
+            debug_log("Terminal %s already closed", task_id)
+            return False
         try:
             # 将字符串编码为字节
             data_bytes = data.encode('utf-8')
-            os.write(terminal_info['master_fd'], data_bytes)
-            debug_log("Wrote %d bytes to terminal %s", len(data_bytes), task_id)
+            # 排队由反应器写入，pty暂时写不进去时不会丢失或阻塞
+            if not terminal_info['writer'].write(data_bytes):
+                logger.warning("Input queue full for terminal %s, rejected %d bytes", task_id, len(data_bytes))
+                return False
+            if terminal_info['recording']:
+                terminal_info['recording'].input(data_bytes)
+            # 用户输入后的回显不等待合并窗口，保证交互响应
+            terminal_info['coalescer'].immediate = True
+            debug_log("Queued %d bytes for terminal %s", len(data_bytes), task_id)
             return True
         except Exception as e:
             logger.error("Failed to write to terminal %s: %s", task_id, e)
             return False
     
-    def _read_pty_output(self, task_id: str):
-        """读取pty输出"""
+    def _read_pty_chunk(self, task_id: str, master_fd: int) -> Optional[bytes]:
+        """从master fd读取一块数据；无数据返回None，EOF返回b''"""
+        try:
+            return _os.read(master_fd, 4096)
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            if e.errno != errno.EIO:  # EIO - 通常表示pty已关闭
+                logger.error("Error reading from pty %s: %s", task_id, e)
+            return b''
+    
+    def _on_pty_readable(self, task_id: str):
+        """反应器回调：pty有输出可读"""
         terminal_info = self.terminals.get(task_id)
-        if not terminal_info:
+        if not terminal_info or terminal_info.get('master_fd') is None:
             return
         
         master_fd = terminal_info['master_fd']
-        process = terminal_info['process']
+        data = self._read_pty_chunk(task_id, master_fd)
+        if data is None:
+            return
+        if data:
+            self._on_output(task_id, terminal_info, data)
+        else:
+            # EOF：slave端已全部关闭，等进程退出后再结束任务
+            debug_log("PTY closed for task %s", task_id)
+            self.reactor.remove_reader(master_fd)
+    
+    def _on_process_exit(self, task_id: str):
+        """反应器回调：任务进程已退出"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or terminal_info.get('finished'):
+            return
         
-        try:
-            debug_log("Starting pty output reading for task: %s", task_id)
-            
-            while True:
-                # 检查进程是否还在运行
-                if process.poll() is not None:
-                    debug_log("Process for task %s has terminated", task_id)
+        # 读出进程退出前留在pty缓冲区里的输出
+        master_fd = terminal_info.get('master_fd')
+        if master_fd is not None:
+            drained = 0
+            while drained < PTY_DRAIN_LIMIT:
+                data = self._read_pty_chunk(task_id, master_fd)
+                if not data:  # None：缓冲区已读空
                     break
-                
-                # 使用select检查是否有数据可读
-                ready, _, _ = select.select([master_fd], [], [], 0.1)
-                
-                if ready:
-                    try:
-                        # 读取数据
-                        data = os.read(master_fd, 4096)
-                        if data:
-                            # 解码并发送到前端
-                            output = data.decode('utf-8', errors='replace')
-                            debug_log("Read %d bytes from pty %s", len(data), task_id)
-                            
-                            self.socketio.emit('terminal_output', {
-                                'sessionId': self.session_id,
-                                'taskId': task_id,
-                                'output': output,
-                                'type': 'pty'
-                            })
-                        else:
-                            # EOF
-                            break
-                    except OSError as e:
-                        if e.errno == 5:  # EIO - 通常表示pty已关闭
-                            debug_log("PTY closed for task %s", task_id)
-                            break
-                        else:
-                            logger.error("Error reading from pty %s: %s", task_id, e)
-                            break
-            
-            # 进程结束处理
-            return_code = process.poll() if process else -1
-            info_log("Task %s completed with code: %s", task_id, return_code)
-            
-            self.socketio.emit('terminal_complete', {
+                drained += len(data)
+                self._on_output(task_id, terminal_info, data)
+        
+        self._finish_terminal(task_id)
+    
+    def _on_output(self, task_id: str, terminal_info: dict, data: bytes):
+        """处理从pty读到的一块输出"""
+        metrics.BYTES_READ.inc(len(data))
+        marker = terminal_info.get('marker')
+        if not marker:
+            self._deliver_output(task_id, terminal_info, data)
+            return
+        
+        # 常驻shell：剥离命令结束标记，标记之前的输出先发出
+        for item in marker.feed(data):
+            if isinstance(item, tuple):
+                self._on_command_done(task_id, terminal_info, *item)
+            else:
+                self._deliver_output(task_id, terminal_info, item)
+    
+    def _deliver_output(self, task_id: str, terminal_info: dict, data: bytes):
+        terminal_info['scrollback'].append(data)
+        if terminal_info['recording']:
+            # 只入队，写盘在录像线程中完成
+            terminal_info['recording'].output(data)
+        if terminal_info['screen']:
+            # 屏幕模式：输出只进入屏幕模型，按帧率发送屏幕变化，不经过合并与流控
+            terminal_info['screen'].feed(data)
+            if terminal_info['screen_timer'] is None:
+                terminal_info['screen_timer'] = self.reactor.call_later(
+                    1.0 / SCREEN_FPS, self._render_screen, task_id)
+            return
+        metrics.EMIT_PENDING.inc(len(data))
+        terminal_info['coalescer'].feed(data)
+        
+        if (self.flow_control and not terminal_info['paused']
+                and self._unacked_bytes(terminal_info) >= FLOW_HIGH_WATER):
+            # 客户端跟不上：停止读取master fd，让内核pty缓冲区阻塞子进程
+            terminal_info['paused'] = True
+            metrics.PAUSED_TASKS.inc()
+            self.reactor.remove_reader(terminal_info['master_fd'])
+            debug_log("Paused reading pty %s, %d bytes unacknowledged",
+                      task_id, self._unacked_bytes(terminal_info))
+    
+    def _unacked_bytes(self, terminal_info: dict) -> int:
+        """已读出但客户端尚未确认的字节数（含合并缓冲区中未发送的部分）"""
+        return terminal_info['emitted'] + terminal_info['coalescer'].pending - terminal_info['acked']
+    
+    def acknowledge_output(self, task_id: str, offset: int):
+        """客户端确认已消费到offset的输出"""
+        self.reactor.call_soon_threadsafe(self._on_ack, task_id, offset)
+    
+    def _on_ack(self, task_id: str, offset: int):
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info:
+            return
+        terminal_info['acked'] = max(terminal_info['acked'], min(offset, terminal_info['emitted']))
+        
+        if terminal_info['paused'] and self._unacked_bytes(terminal_info) <= FLOW_LOW_WATER:
+            terminal_info['paused'] = False
+            metrics.PAUSED_TASKS.dec()
+            if terminal_info.get('master_fd') is not None:
+                self.reactor.add_reader(terminal_info['master_fd'], self._on_pty_readable, task_id)
+                debug_log("Resumed reading pty %s", task_id)
+    
+    def _client_behind(self, terminal_info: dict, data: bytes) -> bool:
+        """客户端是否跟不上：未确认输出超过低水位，或一个合并窗口内就攒满了一整帧"""
+        if self.flow_control and terminal_info['emitted'] - terminal_info['acked'] >= FLOW_LOW_WATER:
+            return True
+        return len(data) >= terminal_info['coalescer'].max_bytes
+    
+    def _emit_output(self, task_id: str, data: bytes, final: bool = False):
+        """发送一帧输出到前端：二进制会话直接发送原始字节，文本会话增量解码"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info:
+            return
+        
+        frame = data
+        if COLLAPSE_REDRAWS and self._client_behind(terminal_info, data):
+            # 偏移仍按原始字节计算，只是少发被覆盖的进度条重绘
+            frame = collapse_redraws(data, terminal_info['cols'])
+            metrics.REDRAW_BYTES_DROPPED.inc(len(data) - len(frame))
+        terminal_info['emitted'] += len(data)
+        metrics.EMIT_PENDING.dec(len(data))
+        payload = {
+            'sessionId': self.session_id,
+            'taskId': task_id,
+            'type': 'pty'
+        }
+        if self.binary:
+            if not frame:
+                return
+            payload['data'] = frame
+            payload['end'] = terminal_info['emitted']
+        else:
+            decoder = terminal_info['decoder']
+            output = decoder.decode(frame, final)
+            if not output:
+                return
+            payload['output'] = output
+            # 末尾未解码完的字节留到下一帧，end只算已发送的完整字符
+            payload['end'] = terminal_info['emitted'] - len(decoder.getstate()[0])
+        
+        debug_log("Emitting %d bytes from pty %s", len(frame), task_id)
+        self._emit('terminal_output', payload)
+        metrics.FRAMES_EMITTED.inc()
+        metrics.BYTES_EMITTED.inc(len(frame))
+        metrics.FRAME_BYTES.observe(len(frame))
+    
+    def _render_screen(self, task_id: str, final: bool = False):
+        """把屏幕模型自上一帧以来的变化发送到前端"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or not terminal_info['screen']:
+            return
+        if terminal_info['screen_timer'] is not None:
+            terminal_info['screen_timer'].cancel()
+            terminal_info['screen_timer'] = None
+        
+        frame = terminal_info['screen'].render(final)
+        if not frame:
+            return
+        terminal_info['screen_seq'] += 1
+        payload = {
+            'sessionId': self.session_id,
+            'taskId': task_id,
+            'seq': terminal_info['screen_seq']
+        }
+        payload.update(frame)
+        debug_log("Emitting %s frame %d for pty %s", frame['type'], payload['seq'], task_id)
+        self._emit('terminal_screen', payload)
+        metrics.FRAMES_EMITTED.inc()
+        metrics.FRAME_BYTES.observe(len(frame['output']))
+    
+    def refresh_screen(self, task_id: str):
+        """让屏幕模式任务补发一帧完整快照"""
+        terminal_info = self.terminals.get(task_id)
+        if terminal_info and terminal_info['screen']:
+            self.reactor.call_soon_threadsafe(self._refresh_screen, task_id)
+    
+    def _refresh_screen(self, task_id: str):
+        terminal_info = self.terminals.get(task_id)
+        if terminal_info and terminal_info['screen']:
+            terminal_info['screen'].invalidate()
+            self._render_screen(task_id)
+    
+    def _resize_screen(self, task_id: str, rows: int, cols: int):
+        terminal_info = self.terminals.get(task_id)
+        if terminal_info and terminal_info['screen']:
+            terminal_info['screen'].resize(rows, cols)
+            self._render_screen(task_id)
+    
+    def _on_command_done(self, task_id: str, terminal_info: dict, seq: int, exit_code: int):
+        """常驻shell中的一条命令结束"""
+        if not terminal_info['busy'] or seq != terminal_info['seq']:
+            debug_log("Ignoring stale marker %d for shell %s", seq, task_id)
+            return
+        terminal_info['busy'] = False
+        self._set_task_state(terminal_info, 'idle')
+        try:
+            terminal_info['coalescer'].flush()
+            if terminal_info['screen']:
+                self._render_screen(task_id, final=True)
+            info_log("Command %d in shell %s completed with code: %s", seq, task_id, exit_code)
+            self._report_completion(task_id, terminal_info, exit_code)
+        finally:
+            terminal_info['interrupt'] = None
+            self.running_tasks[task_id] = False
+    
+    def _report_completion(self, task_id: str, terminal_info: dict, return_code: Optional[int]):
+        """向前端发送完成事件（被中断时附带中断提示和最终信号）"""
+        interrupt = terminal_info.get('interrupt')
+        if interrupt:
+            if interrupt['timer'] is not None:
+                interrupt['timer'].cancel()
+            # 发送中断通知
+            self._emit('terminal_output', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
-                'exitCode': return_code
-                # 移除message，不在终端中显示退出码
+                'output': '\r\n^C (interrupted)\r\n',
+                'type': 'system'
             })
-            
-            self.socketio.emit('terminal_status', {
+            self._emit('terminal_complete', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
-                'status': 'idle'
+                'exitCode': -2,  # 中断退出码
+                'signal': interrupt['signal']  # 最终生效的中断信号
             })
+        else:
+            self._emit('terminal_complete', {
+                'sessionId': self.session_id,
+                'taskId': task_id,
+                'exitCode': return_code
+                # 移除message，不在终端中显示退出码
+            })
+        
+        self._emit('terminal_status', {
+            'sessionId': self.session_id,
+            'taskId': task_id,
+            'status': 'idle'
+        })
+    
+    def _finish_terminal(self, task_id: str):
+        """任务结束处理：释放master fd并通知前端"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or terminal_info.get('finished'):
+            return
+        terminal_info['finished'] = True
+        
+        try:
+            marker = terminal_info.get('marker')
+            if marker:
+                # shell退出时未收全的标记前缀按普通输出发出
+                leftover = marker.flush()
+                if leftover:
+                    self._deliver_output(task_id, terminal_info, leftover)
+            terminal_info['coalescer'].flush()
+            self._emit_output(task_id, b'', final=True)
+            if terminal_info['screen']:
+                # 完成事件之前先发出最终屏幕
+                self._render_screen(task_id, final=True)
+            self._close_master(terminal_info)
+            if terminal_info['recording']:
+                terminal_info['recording'].close()
+            self._set_task_state(terminal_info, 'completed')
+            if terminal_info['paused']:
+                terminal_info['paused'] = False
+                metrics.PAUSED_TASKS.dec()
             
+            process = terminal_info['process']
+            return_code = process.poll() if process else -1
+            info_log("Task %s completed with code: %s", task_id, return_code)
+            self._report_completion(task_id, terminal_info, return_code)
         except Exception as e:
-            logger.error("Error in pty output reading thread for task %s: %s", task_id, e)
-            self.socketio.emit('terminal_error', {
+            logger.error("Error finishing pty task %s: %s", task_id, e)
+            self._emit('terminal_error', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'error': f'PTY reading failed: {str(e)}'
@@ -248,10 +612,25 @@ class PtyTerminalSession:
         finally:
             # 清理任务状态
             self.running_tasks[task_id] = False
-            debug_log("PTY output reading thread finished for task: %s", task_id)
+            if self.on_task_done:
+                self.on_task_done(task_id)
+            debug_log("PTY task finished: %s", task_id)
+    
+    def _close_master(self, terminal_info: dict):
+        """注销并关闭master fd"""
+        master_fd = terminal_info.get('master_fd')
+        if master_fd is not None:
+            terminal_info['master_fd'] = None
+            terminal_info['writer'].close()
+            self.reactor.close_fd(master_fd)
+            metrics.OPEN_PTYS.dec()
     
     def interrupt_terminal(self, task_id: str):
-        """中断指定终端"""
+        """中断指定终端：发送Ctrl+C后交给反应器按时间表升级，立即返回
+
+        SIGINT未生效时依次升级为SIGTERM、SIGKILL；最终结果在进程退出后
+        通过terminal_complete异步上报。
+        """
         logger.debug("Interrupting terminal: %s", task_id)
         
         if task_id not in self.terminals:
@@ -261,118 +640,171 @@ class PtyTerminalSession:
         terminal_info = self.terminals[task_id]
         process = terminal_info['process']
         
-        if process.poll() is not None:
+        if process.poll() is not None or terminal_info.get('finished'):
             logger.debug("Process already terminated for task: %s", task_id)
             return False
+        if terminal_info.get('persistent') and not terminal_info['busy']:
+            logger.debug("No command running in shell: %s", task_id)
+            return False
         
+        self.reactor.call_soon_threadsafe(self._start_interrupt, task_id)
+        return True
+    
+    def _start_interrupt(self, task_id: str):
+        """反应器线程中执行：发出第一级中断并安排后续升级"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or terminal_info.get('finished'):
+            return
+        if terminal_info.get('interrupt'):
+            debug_log("Interrupt already in progress for task: %s", task_id)
+            return
+        
+        process = terminal_info['process']
+        interrupt = terminal_info['interrupt'] = {'signal': None, 'timer': None}
         try:
             if os.name == 'nt':  # Windows
-                # Windows处理
-                try:
-                    process.terminate()
-                    try:
-                        process.wait(timeout=2)
-                    except subprocess.TimeoutExpired:
-                        process.kill()
-                        process.wait()
-                except Exception as e:
-                    logger.error("Failed to terminate Windows process: %s", e)
-                    return False
+                process.terminate()
+                interrupt['signal'] = 'SIGTERM'
+                interrupt['timer'] = self.reactor.call_later(
+                    INTERRUPT_KILL_DELAY, self._escalate_interrupt, task_id, 'SIGKILL')
             else:  # Unix/Linux
-                # Unix/Linux: 发送SIGTERM到进程组
-                try:
-                    # 首先尝试发送Ctrl+C (SIGINT)
-                    os.write(terminal_info['master_fd'], b'\x03')  # Ctrl+C
-                    
-                    # 等待一下看是否响应
-                    time.sleep(0.5)
-                    if process.poll() is None:
-                        # 如果还没退出，发送SIGTERM
-                        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                        try:
-                            process.wait(timeout=3)
-                        except subprocess.TimeoutExpired:
-                            # 最后使用SIGKILL
-                            os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                            process.wait()
-                except ProcessLookupError:
-                    # 进程已经退出
-                    logger.debug("Process already terminated for task: %s", task_id)
-                except Exception as e:
-                    logger.error("Failed to terminate Unix process: %s", e)
-                    return False
-            
-            # 立即更新状态
-            self.running_tasks[task_id] = False
-            
-            # 发送中断通知
-            self.socketio.emit('terminal_output', {
-                'sessionId': self.session_id,
-                'taskId': task_id,
-                'output': '\r\n^C (interrupted)\r\n',
-                'type': 'system'
-            })
-            
-            self.socketio.emit('terminal_complete', {
-                'sessionId': self.session_id,
-                'taskId': task_id,
-                'exitCode': -2  # 中断退出码
-                # 移除message，不在终端中显示中断信息
-            })
-            
-            logger.info("Terminal interrupted successfully: %s", task_id)
-            return True
-            
+                # 首先尝试发送Ctrl+C (SIGINT)，由pty转发给前台进程组
+                if terminal_info.get('master_fd') is not None:
+                    # 与终端的INTR一样丢弃尚未写入的输入，Ctrl+C不必排在大段粘贴之后
+                    terminal_info['writer'].discard()
+                    terminal_info['writer'].write(b'\x03')  # Ctrl+C
+                    interrupt['signal'] = 'SIGINT'
+                    interrupt['timer'] = self.reactor.call_later(
+                        INTERRUPT_TERM_DELAY, self._escalate_interrupt, task_id, 'SIGTERM')
+                else:
+                    self._escalate_interrupt(task_id, 'SIGTERM')
+            logger.info("Terminal interrupt initiated: %s (%s)", task_id, interrupt['signal'])
         except Exception as e:
             logger.error("Failed to interrupt terminal %s: %s", task_id, e)
-            self.socketio.emit('terminal_error', {
+            terminal_info.pop('interrupt', None)
+            self._emit('terminal_error', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'error': f'Failed to interrupt terminal: {str(e)}'
             })
-            return False
     
-    def cleanup(self):
-        """清理资源"""
+    def _escalate_interrupt(self, task_id: str, signal_name: str):
+        """定时器回调：进程仍未退出时升级信号"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info or terminal_info.get('finished'):
+            return
+        
+        process = terminal_info['process']
+        interrupt = terminal_info['interrupt']
+        interrupt['timer'] = None
+        if process.poll() is not None:
+            return
+        
+        try:
+            if os.name == 'nt':
+                process.kill()
+            else:
+                # 发送到整个进程组
+                os.killpg(os.getpgid(process.pid), getattr(signal, signal_name))
+            interrupt['signal'] = signal_name
+            debug_log("Escalated interrupt for task %s to %s", task_id, signal_name)
+        except ProcessLookupError:
+            # 进程已经退出
+            logger.debug("Process already terminated for task: %s", task_id)
+            return
+        except Exception as e:
+            logger.error("Failed to send %s to task %s: %s", signal_name, task_id, e)
+        
+        if signal_name == 'SIGTERM':
+            # 最后使用SIGKILL
+            interrupt['timer'] = self.reactor.call_later(
+                INTERRUPT_KILL_DELAY, self._escalate_interrupt, task_id, 'SIGKILL')
+    
+    def live_processes(self) -> List:
+        """仍在运行的任务进程"""
+        return [terminal_info['process'] for terminal_info in list(self.terminals.values())
+                if terminal_info.get('process') and terminal_info['process'].poll() is None]
+    
+    def cleanup(self, terminate: bool = True):
+        """清理资源
+
+        terminate为False时表示进程已由调用方统一终止，这里只释放pty和状态。
+        """
         logger.debug("Cleaning up pty session: %s", self.session_id)
         
-        # 清理所有终端
+        # 先停止监听并标记结束，避免进程被终止时再上报完成事件
+        for terminal_info in list(self.terminals.values()):
+            terminal_info['finished'] = True
+            process = terminal_info.get('process')
+            if process:
+                self.reactor.unwatch_process(process)
+            interrupt = terminal_info.get('interrupt')
+            if interrupt and interrupt['timer'] is not None:
+                interrupt['timer'].cancel()
+            if terminal_info.get('screen_timer') is not None:
+                terminal_info['screen_timer'].cancel()
+            if terminal_info.get('resize_timer') is not None:
+                terminal_info['resize_timer'].cancel()
+        
+        # 所有进程组同时终止，统一期限内回收
+        if terminate:
+            terminate_process_groups(self.live_processes())
+        
+        # 关闭pty master端
         for task_id, terminal_info in list(self.terminals.items()):
             try:
-                # 关闭进程
-                process = terminal_info.get('process')
-                if process and process.poll() is None:
-                    try:
-                        if os.name == 'nt':
-                            process.terminate()
-                        else:
-                            os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                        process.wait(timeout=2)
-                    except:
-                        try:
-                            if os.name == 'nt':
-                                process.kill()
-                            else:
-                                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                            process.wait()
-                        except:
-                            pass
-                
-                # 关闭pty master端
-                master_fd = terminal_info.get('master_fd')
-                if master_fd:
-                    try:
-                        os.close(master_fd)
-                    except:
-                        pass
-                        
+                self._close_master(terminal_info)
             except Exception as e:
                 logger.error("Error cleaning up terminal %s: %s", task_id, e)
+            self._set_task_state(terminal_info, None)
+            if terminal_info['recording']:
+                terminal_info['recording'].close()
+            if terminal_info.get('paused'):
+                terminal_info['paused'] = False
+                metrics.PAUSED_TASKS.dec()
+            metrics.EMIT_PENDING.dec(terminal_info['coalescer'].pending)
         
         # 清理状态
         self.terminals.clear()
         self.running_tasks.clear()
     
+    def replay_output(self, task_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[dict]:
+        """读取任务回放缓冲区中从offset开始的输出"""
+        terminal_info = self.terminals.get(task_id)
+        if not terminal_info:
+            return None
+        
+        start, data = terminal_info['scrollback'].read_from(offset, limit)
+        payload = {
+            'sessionId': self.session_id,
+            'taskId': task_id,
+            'status': self.get_task_status(task_id),
+            'truncated': start > offset
+        }
+        if self.binary:
+            payload['offset'] = start
+            payload['data'] = data
+            payload['end'] = start + len(data)
+        else:
+            # 环形缓冲区回绕处可能从多字节字符中间开始，跳过残缺的续字节
+            skip = 0
+            while skip < min(3, len(data)) and 0x80 <= data[skip] <= 0xBF:
+                skip += 1
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            payload['offset'] = start + skip
+            payload['output'] = decoder.decode(data[skip:])
+            payload['end'] = start + len(data) - len(decoder.getstate()[0])
+        return payload
+    
+    def describe_tasks(self) -> List[dict]:
+        """会话中所有任务的概要，供客户端重连后恢复界面"""
+        return [{
+            'taskId': task_id,
+            'command': terminal_info['command'],
+            'status': self.get_task_status(task_id),
+            'end': terminal_info['scrollback'].end
+        } for task_id, terminal_info in list(self.terminals.items())]
+    
     def get_running_tasks(self) -> List[str]:
         """获取正在运行的任务列表"""
         return [task_id for task_id, is_running in self.running_tasks.items() if is_running]
@@ -385,17 +817,159 @@ class PtyTerminalSession:
         terminal_info = self.terminals[task_id]
         process = terminal_info.get('process')
         if process and process.poll() is None:
+            if terminal_info.get('persistent') and not terminal_info['busy']:
+                return 'idle'  # 常驻shell等待下一条命令
             return 'running'
         else:
             return 'completed'
 
 class PtyTerminalHandler:
-    def __init__(self, socketio: SocketIO):
+    terminal_type = 'pty'
+    features = ['pty', 'ansi_colors', 'interactive', 'resize', 'multi_task', 'binary_output', 'replay',
+                'flow_control', 'persistent_shell', 'recording', 'batch'] + (['screen'] if screen_available() else []) + (
+                    ['stats'] if STATS_INTERVAL > 0 and stats_available() else [])
+    
+    def __init__(self, socketio: SocketIO, reactor: Optional[PtyReactor] = None):
         self.socketio = socketio
         self.sessions: Dict[str, PtyTerminalSession] = {}
+        # 所有会话共用一个I/O反应器和预热shell池
+        self.reactor = reactor or get_reactor()
+        self.pool = PtyPool()
+        self.pool.start()
+        # 新任务经调度器限制并发，避免批量提交时同时fork大量shell
+        self.scheduler = TaskScheduler(self.reactor, self._start_scheduled, self._notify_session)
+        # 定时采样各任务的CPU、内存和I/O
+        self.sampler = ProcessSampler() if STATS_INTERVAL > 0 and stats_available() else None
+        if self.sampler:
+            self.reactor.call_later(STATS_INTERVAL, self._sample_stats)
+        metrics.REACTOR_READERS.set_function(self.reactor.registered_fds)
         self.register_handlers()
+        
+        global pty_terminal_handler
+        pty_terminal_handler = self
         logger.info("PtyTerminalHandler initialized")
     
+    def _reply(self, event: str, payload: dict, to: Optional[str] = None):
+        """回复当前事件的发送方；指定to时发往该房间"""
+        emit(event, payload, to=to)
+    
+    def _join(self, room: str):
+        """让当前事件的发送方加入房间"""
+        join_room(room)
+    
+    def _run_in_background(self, target):
+        """在后台执行可能阻塞的操作（创建进程等）"""
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+    
+    def _notify_session(self, session_id: str, event: str, payload: dict):
+        """向会话房间发送事件（可在反应器线程中调用）"""
+        self.socketio.emit(event, payload, to=session_id)
+    
+    def _sample_stats(self, tasks: Optional[list] = None):
+        """采样所有运行中任务的资源占用，每个会话发送一条terminal_stats（在反应器线程中执行）
+
+        一次采样分多个时间片完成，tasks为进行中的采样对应的任务列表。
+        """
+        delay = STATS_INTERVAL
+        try:
+            if tasks is None:
+                tasks = []
+                for session in list(self.sessions.values()):
+                    for task_id, terminal_info in list(session.terminals.items()):
+                        process = terminal_info.get('process')
+                        if process and process.returncode is None and not terminal_info.get('finished'):
+                            tasks.append((session.session_id, task_id, terminal_info, process.pid))
+                if not tasks:
+                    self.sampler.reset()
+                    return
+                self.sampler.begin(pid for _, _, _, pid in tasks)
+            
+            results = self.sampler.step()
+            if results is None:
+                # 时间片用完，先让反应器处理其他事件再继续
+                delay = 0
+                return
+            
+            updates: Dict[str, list] = {}
+            for session_id, task_id, terminal_info, pid in tasks:
+                if terminal_info.get('finished'):
+                    continue
+                terminal_info['stats'] = results[pid]
+                updates.setdefault(session_id, []).append(dict(results[pid], taskId=task_id))
+            for session_id, stats in updates.items():
+                self._notify_session(session_id, 'terminal_stats', {'sessionId': session_id, 'tasks': stats})
+        except Exception as e:
+            logger.error("Failed to sample task resources: %s", e)
+        finally:
+            if delay:
+                self.reactor.call_later(delay, self._sample_stats)
+            else:
+                self.reactor.call_later(0, self._sample_stats, tasks)
+    
+    def _add_session(self, session_id: str, session: PtyTerminalSession):
+        session.on_task_done = partial(self.scheduler.release, session_id)
+        self.sessions[session_id] = session
+    
+    def _start_scheduled(self, task: ScheduledTask):
+        """调度器分配到配额后启动任务（在反应器线程中调用）"""
+        session = self.sessions.get(task.session_id)
+        if session is None:
+            self.scheduler.release(task.session_id, task.task_id)
+            return
+        options = task.options
+        self._create_task(session, task.task_id, task.command, options['rows'], options['cols'],
+                          record=options['record'], screen=options['screen'])
+    
+    def _task_exists(self, task: ScheduledTask) -> bool:
+        session = self.sessions.get(task.session_id)
+        return session is not None and task.task_id in session.terminals
+    
+    def _create_task(self, session: PtyTerminalSession, task_id: str, command: str, rows: int, cols: int,
+                     persistent: bool = False, record: bool = False, screen: bool = False):
+        """创建任务的pty和进程，并向会话房间上报状态"""
+        session_id = session.session_id
+        self._notify_session(session_id, 'terminal_status', {
+            'sessionId': session_id,
+            'taskId': task_id,
+            'status': 'creating',
+            'command': command
+        })
+        
+        def create_terminal_async():
+            success = session.create_terminal(task_id, command, rows, cols, persistent, record, screen)
+            if success:
+                self._notify_session(session_id, 'terminal_status', {
+                    'sessionId': session_id,
+                    'taskId': task_id,
+                    'status': 'running',
+                    'command': command
+                })
+            else:
+                self.scheduler.release(session_id, task_id)
+                self._notify_session(session_id, 'terminal_error', {
+                    'sessionId': session_id,
+                    'taskId': task_id,
+                    'error': 'Failed to create terminal'
+                })
+        
+        if self.pool.available() and (persistent or self.pool.accepts(command, rows, cols)):
+            # 有空闲shell时创建只是一次写入，无需另起线程
+            create_terminal_async()
+        else:
+            self._run_in_background(create_terminal_async)
+    
+    def _validate_command(self, session_id: Optional[str], task_id: Optional[str], command: Optional[str]) -> Optional[str]:
+        """检查命令请求，返回错误信息；合法时返回None"""
+        if not session_id or session_id not in self.sessions:
+            return 'Session not found: ' + (session_id or 'unknown')
+        if not task_id:
+            return 'Task ID is required'
+        if not isinstance(command, str) or not command.strip():
+            return 'Empty command'
+        return None
+    
     def register_handlers(self):
         """注册SocketIO事件处理器"""
         
@@ -408,20 +982,47 @@ class PtyTerminalHandler:
             logger.debug("Client disconnected from SocketIO")
         
         @self.socketio.on('terminal_connect')
+        @metrics.instrument_event('terminal_connect')
         def handle_connect_event(data):
             logger.debug("Received terminal_connect event: %s", data)
+            options = data if isinstance(data, dict) else {}
+            features = self.features
+            
+            # 重连：恢复已有会话，客户端随后用terminal_replay补齐输出
+            session_id = options.get('sessionId')
+            if session_id and session_id in self.sessions:
+                self._join(session_id)
+                self._reply('terminal_connected', {
+                    'sessionId': session_id,
+                    'message': 'PTY Terminal session resumed',
+                    'features': features,
+                    'resumed': True,
+                    'tasks': self.sessions[session_id].describe_tasks() + self.scheduler.describe(session_id)
+                })
+                logger.info("PTY terminal session resumed: %s", session_id)
+                return
+            
             session_id = str(uuid.uuid4())
-            self.sessions[session_id] = PtyTerminalSession(session_id, self.socketio)
+            self._add_session(session_id, PtyTerminalSession(
+                session_id, self.socketio, self.reactor,
+                binary=bool(options.get('binary', False)),
+                flow_control=bool(options.get('flowControl', False)),
+                pool=self.pool
+            ))
+            metrics.SESSIONS.inc()
+            # 会话事件只发往该房间，避免广播给所有客户端
+            self._join(session_id)
             
-            emit('terminal_connected', {
+            self._reply('terminal_connected', {
                 'sessionId': session_id,
                 'message': 'PTY Terminal session established',
-                'features': ['pty', 'ansi_colors', 'interactive', 'resize']
+                'features': features
             })
             
             logger.info("New pty terminal session created: %s", session_id)
         
         @self.socketio.on('terminal_command')
+        @metrics.instrument_event('terminal_command')
         def handle_command(data):
             logger.debug("Received terminal_command event: %s", data)
             session_id = data.get('sessionId')
@@ -429,80 +1030,131 @@ class PtyTerminalHandler:
             command = data.get('command')
             rows = data.get('rows', 24)
             cols = data.get('cols', 80)
+            persistent = bool(data.get('persistent', False))
+            record = bool(data.get('record', False))
+            screen = bool(data.get('screen', False))
             
-            if not session_id or session_id not in self.sessions:
-                error_msg = 'Session not found: ' + (session_id or 'unknown')
+            error_msg = self._validate_command(session_id, task_id, command)
+            if error_msg:
                 logger.error(error_msg)
-                emit('terminal_error', {
+                self._reply('terminal_error', {
                     'sessionId': session_id or 'unknown',
                     'taskId': task_id,
                     'error': error_msg
                 })
                 return
             
-            if not task_id:
-                error_msg = 'Task ID is required'
-                logger.error(error_msg)
-                emit('terminal_error', {
+            session = self.sessions[session_id]
+            
+            # 常驻shell空闲时，后续命令直接写入同一个pty
+            if persistent and session.run_command(task_id, command.strip()):
+                self._reply('terminal_status', {
                     'sessionId': session_id,
                     'taskId': task_id,
-                    'error': error_msg
-                })
+                    'status': 'running',
+                    'command': command
+                }, to=session_id)
                 return
             
-            if not command or not command.strip():
-                error_msg = 'Empty command'
+            # 检查任务是否已存在
+            if task_id in session.terminals or self.scheduler.is_queued(session_id, task_id):
+                error_msg = 'Terminal already exists'
                 logger.error(error_msg)
-                emit('terminal_error', {
+                self._reply('terminal_error', {
                     'sessionId': session_id,
                     'taskId': task_id,
                     'error': error_msg
                 })
                 return
             
-            session = self.sessions[session_id]
+            if persistent:
+                # 常驻shell是交互会话，不占用调度配额
+                self._create_task(session, task_id, command.strip(), rows, cols, True, record, screen)
+                return
             
-            # 检查任务是否已存在
-            if task_id in session.terminals:
-                error_msg = 'Terminal already exists'
-                logger.error(error_msg)
-                emit('terminal_error', {
+            priority = parse_int(data.get('priority'), 0)
+            if priority is None:
+                self._reply('terminal_error', {
                     'sessionId': session_id,
                     'taskId': task_id,
+                    'error': 'Invalid priority'
+                })
+                return
+            
+            self.scheduler.submit([ScheduledTask(session_id, task_id, command.strip(), {
+                'rows': rows, 'cols': cols, 'record': record, 'screen': screen
+            }, priority)], self._task_exists)
+        
+        @self.socketio.on('terminal_batch')
+        @metrics.instrument_event('terminal_batch')
+        def handle_batch(data):
+            """一次提交多条命令，由调度器按优先级和并发上限依次启动"""
+            session_id = data.get('sessionId')
+            commands = data.get('commands')
+            debug_log("Received terminal_batch event with %s commands", len(commands or ()))
+            
+            if not session_id or session_id not in self.sessions:
+                error_msg = 'Session not found: ' + (session_id or 'unknown')
+                logger.error(error_msg)
+                self._reply('terminal_error', {
+                    'sessionId': session_id or 'unknown',
+                    'taskId': None,
                     'error': error_msg
                 })
                 return
             
-            # 发送执行状态
-            emit('terminal_status', {
-                'sessionId': session_id,
-                'taskId': task_id,
-                'status': 'creating',
-                'command': command
-            })
+            if not isinstance(commands, list):
+                self._reply('terminal_error', {
+                    'sessionId': session_id,
+                    'taskId': None,
+                    'error': 'Batch commands must be a list'
+                })
+                return
             
-            # 在新线程中创建终端
-            def create_terminal_async():
-                success = session.create_terminal(task_id, command.strip(), rows, cols)
-                if success:
-                    self.socketio.emit('terminal_status', {
-                        'sessionId': session_id,
-                        'taskId': task_id,
-                        'status': 'running',
-                        'command': command
-                    })
-                else:
-                    self.socketio.emit('terminal_error', {
+            default_priority = parse_int(data.get('priority'), 0)
+            if default_priority is None:
+                self._reply('terminal_error', {
+                    'sessionId': session_id,
+                    'taskId': None,
+                    'error': 'Invalid priority'
+                })
+                return
+            
+            tasks = []
+            rejected = []
+            for item in commands:
+                item = item if isinstance(item, dict) else {}
+                task_id = item.get('taskId')
+                command = item.get('command')
+                error_msg = self._validate_command(session_id, task_id, command)
+                priority = parse_int(item.get('priority'), default_priority)
+                if not error_msg and priority is None:
+                    error_msg = 'Invalid priority'
+                if error_msg:
+                    rejected.append({'taskId': task_id, 'error': error_msg})
+                    self._reply('terminal_error', {
                         'sessionId': session_id,
                         'taskId': task_id,
-                        'error': 'Failed to create terminal'
+                        'error': error_msg
                     })
+                    continue
+                tasks.append(ScheduledTask(session_id, task_id, command.strip(), {
+                    'rows': item.get('rows', data.get('rows', 24)),
+                    'cols': item.get('cols', data.get('cols', 80)),
+                    'record': bool(item.get('record', False)),
+                    'screen': bool(item.get('screen', False))
+                }, priority))
             
-            thread = threading.Thread(target=create_terminal_async)
-            thread.daemon = True
-            thread.start()
+            self._reply('terminal_batch_accepted', {
+                'sessionId': session_id,
+                'taskIds': [task.task_id for task in tasks],
+                'rejected': rejected
+            })
+            if tasks:
+                self.scheduler.submit(tasks, self._task_exists)
         
         @self.socketio.on('terminal_input')
+        @metrics.instrument_event('terminal_input')
         def handle_input(data):
             """处理终端输入"""
             logger.debug("Received terminal_input event: %s", data)
@@ -522,13 +1174,14 @@ class PtyTerminalHandler:
             success = session.write_to_terminal(task_id, input_data)
             
             if not success:
-                emit('terminal_error', {
+                self._reply('terminal_error', {
                     'sessionId': session_id,
                     'taskId': task_id,
                     'error': 'Failed to send input to terminal'
                 })
         
         @self.socketio.on('terminal_resize')
+        @metrics.instrument_event('terminal_resize')
         def handle_resize(data):
             """处理终端尺寸调整"""
             logger.debug("Received terminal_resize event: %s", data)
@@ -541,7 +1194,68 @@ class PtyTerminalHandler:
                 session = self.sessions[session_id]
                 session.resize_terminal(task_id, rows, cols)
         
+        @self.socketio.on('terminal_ack')
+        @metrics.instrument_event('terminal_ack')
+        def handle_ack(data):
+            """客户端确认已消费的输出偏移（流控）"""
+            session_id = data.get('sessionId')
+            task_id = data.get('taskId')
+            offset = parse_int(data.get('offset'))
+            
+            if session_id not in self.sessions or not task_id:
+                return
+            if offset is None:
+                self._reply('terminal_error', {
+                    'sessionId': session_id,
+                    'taskId': task_id,
+                    'error': 'Invalid ack offset'
+                })
+                return
+            self.sessions[session_id].acknowledge_output(task_id, offset)
+        
+        @self.socketio.on('terminal_replay')
+        @metrics.instrument_event('terminal_replay')
+        def handle_replay(data):
+            """回放任务输出（客户端重连或刷新后恢复）"""
+            logger.debug("Received terminal_replay event: %s", data)
+            session_id = data.get('sessionId')
+            task_id = data.get('taskId')
+            
+            if not session_id or session_id not in self.sessions:
+                error_msg = 'Session not found: ' + (session_id or 'unknown')
+                logger.error(error_msg)
+                self._reply('terminal_error', {
+                    'sessionId': session_id or 'unknown',
+                    'taskId': task_id,
+                    'error': error_msg
+                })
+                return
+            
+            offset = parse_int(data.get('offset'), 0)
+            limit = parse_int(data.get('maxBytes'), 0)  # 0表示不限
+            if offset is None or limit is None:
+                self._reply('terminal_error', {
+                    'sessionId': session_id,
+                    'taskId': task_id,
+                    'error': 'Invalid replay offset or maxBytes'
+                })
+                return
+            
+            payload = self.sessions[session_id].replay_output(task_id, offset, limit or None)
+            if payload is None:
+                self._reply('terminal_error', {
+                    'sessionId': session_id,
+                    'taskId': task_id,
+                    'error': 'Terminal not found'
+                })
+                return
+            
+            self._reply('terminal_replay', payload)
+            # 屏幕模式回放的是原始输出，随后补发完整快照让客户端回到屏幕模型的状态
+            self.sessions[session_id].refresh_screen(task_id)
+        
         @self.socketio.on('terminal_interrupt')
+        @metrics.instrument_event('terminal_interrupt')
         def handle_interrupt(data):
             logger.debug("Received terminal_interrupt event: %s", data)
             session_id = data.get('sessionId')
@@ -550,7 +1264,7 @@ class PtyTerminalHandler:
             if not session_id or session_id not in self.sessions:
                 error_msg = 'Session not found: ' + (session_id or 'unknown')
                 logger.error(error_msg)
-                emit('terminal_error', {
+                self._reply('terminal_error', {
                     'sessionId': session_id or 'unknown',
                     'taskId': task_id,
                     'error': error_msg
@@ -560,7 +1274,7 @@ class PtyTerminalHandler:
             if not task_id:
                 error_msg = 'Task ID is required for interrupt'
                 logger.error(error_msg)
-                emit('terminal_error', {
+                self._reply('terminal_error', {
                     'sessionId': session_id,
                     'taskId': task_id,
                     'error': error_msg
@@ -569,10 +1283,15 @@ class PtyTerminalHandler:
             
             session = self.sessions[session_id]
             
+            # 还在排队的任务直接移出队列
+            if self.scheduler.is_queued(session_id, task_id):
+                self.scheduler.cancel(session_id, task_id)
+                return
+            
             # 检查终端是否存在
             if task_id not in session.terminals:
                 logger.debug("Terminal not found for interrupt: %s", task_id)
-                emit('terminal_output', {
+                self._reply('terminal_output', {
                     'sessionId': session_id,
                     'taskId': task_id,
                     'output': 'Terminal not found.\r\n',
@@ -585,13 +1304,22 @@ class PtyTerminalHandler:
                 if task_id in session.terminals:
                     terminal_info = session.terminals[task_id]
                     process = terminal_info.get('process')
+                    if terminal_info.get('persistent') and process and process.poll() is None:
+                        # 常驻shell空闲，没有可中断的命令
+                        self._reply('terminal_output', {
+                            'sessionId': session_id,
+                            'taskId': task_id,
+                            'output': 'No command running.\r\n',
+                            'type': 'system'
+                        })
+                        return
                     if process and process.poll() is None:
                         # 进程仍在运行，更新运行状态并继续中断
                         session.running_tasks[task_id] = True
                         logger.debug("Updated running status for task: %s", task_id)
                     else:
                         logger.debug("Process already terminated for task: %s", task_id)
-                        emit('terminal_output', {
+                        self._reply('terminal_output', {
                             'sessionId': session_id,
                             'taskId': task_id,
                             'output': 'Process already terminated.\r\n',
@@ -600,7 +1328,7 @@ class PtyTerminalHandler:
                         return
                 else:
                     logger.debug("No terminal found for interrupt: %s", task_id)
-                    emit('terminal_output', {
+                    self._reply('terminal_output', {
                         'sessionId': session_id,
                         'taskId': task_id,
                         'output': 'Terminal not found.\r\n',
@@ -613,33 +1341,46 @@ class PtyTerminalHandler:
             if success:
                 logger.info("Terminal interrupt initiated: %s", task_id)
             else:
-                emit('terminal_error', {
+                self._reply('terminal_error', {
                     'sessionId': session_id,
                     'taskId': task_id,
                     'error': 'Failed to interrupt terminal'
                 })
         
         @self.socketio.on('terminal_disconnect')
+        @metrics.instrument_event('terminal_disconnect')
         def handle_disconnect_event(data):
             session_id = data.get('sessionId')
             logger.debug("Received terminal_disconnect for session: %s", session_id)
             if session_id in self.sessions:
-                session = self.sessions[session_id]
+                # 先移除会话，调度器不会再为它启动排队中的任务
+                session = self.sessions.pop(session_id)
+                self.scheduler.drop_session(session_id)
                 session.cleanup()
-                del self.sessions[session_id]
+                metrics.SESSIONS.dec()
                 logger.info("PTY Terminal session terminated: %s", session_id)
     
     def cleanup_all_sessions(self):
-        """清理所有会话"""
-        for session_id, session in list(self.sessions.items()):
-            session.cleanup()
-            del self.sessions[session_id]
+        """清理所有会话：所有会话的进程一起终止，总耗时与任务数量无关"""
+        sessions = list(self.sessions.items())
+        for session_id, _ in sessions:
+            self.scheduler.drop_session(session_id)
+        processes = [process for _, session in sessions for process in session.live_processes()]
+        terminate_process_groups(processes)
+        
+        for session_id, session in sessions:
+            session.cleanup(terminate=False)
+            if self.sessions.pop(session_id, None):
+                metrics.SESSIONS.dec()
+        self.pool.close()
         logger.info("All pty terminal sessions cleaned up")
 
+# 当前的处理器实例，供退出时清理
+pty_terminal_handler: Optional[PtyTerminalHandler] = None
+
 # 全局清理函数
 def cleanup_pty_terminals():
     """清理所有pty终端会话"""
-    global pty_terminal_handler
     if pty_terminal_handler:
         pty_terminal_handler.cleanup_all_sessions()
         logger.info("All pty terminal sessions cleaned up")
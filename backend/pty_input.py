@@ -0,0 +1,118 @@
+import os
+import errno
+import logging
+import threading
+
+try:
+    # 打过补丁的os.write在EAGAIN时会挂起等待可写，会卡住反应器；这里需要原生的非阻塞写
+    from eventlet import patcher as _patcher
+    _os = _patcher.original('os')
+except ImportError:
+    _os = os
+
+import metrics
+
+logger = logging.getLogger('PtyInput')
+
+# 每个任务排队等待写入pty的输入上限（字节），超出的输入被拒绝
+INPUT_QUEUE_BYTES = int(os.environ.get('PTY_INPUT_QUEUE_BYTES', str(16 * 1024 * 1024)))
+# 单次write的最大字节数
+WRITE_CHUNK_BYTES = 64 * 1024
+
+INPUT_PENDING = metrics.REGISTRY.gauge('input_pending_bytes', 'User input queued and waiting for PTYs to become writable')
+INPUT_WRITES = metrics.REGISTRY.counter('input_writes_total', 'write() calls on PTY masters for user input')
+INPUT_REJECTED = metrics.REGISTRY.counter('input_rejected_bytes_total', 'User input rejected because the task input queue was full')
+
+
+class InputWriter:
+    """任务的输入写队列
+
+    pty的输入缓冲区只有几KB，前台程序没有及时读取时非阻塞的write会部分写入或返回EAGAIN。
+    输入先追加到队列，在反应器线程中尽量写出；写不完时注册fd可写回调，可写后继续，
+    期间到达的输入与队列中的数据合并成大块写入。write可以在任意线程调用，
+    实际写入都在反应器线程中按提交顺序进行。
+    """
+
+    def __init__(self, reactor, fd: int, max_bytes: int = INPUT_QUEUE_BYTES):
+        self.reactor = reactor
+        self.fd = fd
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending = 0  # 已接受但尚未写出的字节数
+        self._buffer = bytearray()  # 反应器线程中等待写出的数据
+        self._waiting = False  # 是否已注册可写回调
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def write(self, data: bytes) -> bool:
+        """排队写入；队列已满或已关闭时返回False"""
+        if not data:
+            return True
+        with self._lock:
+            if self._closed or self._pending + len(data) > self.max_bytes:
+                INPUT_REJECTED.inc(len(data))
+                return False
+            self._pending += len(data)
+        INPUT_PENDING.inc(len(data))
+        self.reactor.run_in_loop(self._enqueue, data)
+        return True
+
+    def discard(self):
+        """丢弃尚未写出的输入（中断时与终端的INTR行为一致）"""
+        self.reactor.run_in_loop(self._discard)
+
+    def close(self):
+        """停止写入；应在关闭fd之前调用，之后到达的输入都会被丢弃"""
+        with self._lock:
+            self._closed = True
+        self.reactor.run_in_loop(self._discard)
+
+    def _enqueue(self, data: bytes):
+        if self._closed:
+            self._consumed(len(data))
+            return
+        self._buffer += data
+        if not self._waiting:
+            self._flush()
+
+    def _flush(self):
+        buffer = self._buffer
+        while buffer:
+            try:
+                written = _os.write(self.fd, buffer[:WRITE_CHUNK_BYTES])
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                # EIO等：slave端已关闭，剩余输入没有读者了
+                logger.debug("Dropping %d bytes of input for fd %s: %s", len(buffer), self.fd, e)
+                self._discard()
+                return
+            INPUT_WRITES.inc()
+            del buffer[:written]
+            self._consumed(written)
+            if written < WRITE_CHUNK_BYTES and buffer:
+                break  # 部分写入，说明缓冲区已满，等待可写
+        if buffer and not self._waiting:
+            self._waiting = True
+            self.reactor.add_writer(self.fd, self._flush)
+        elif not buffer and self._waiting:
+            self._waiting = False
+            self.reactor.remove_writer(self.fd)
+
+    def _discard(self):
+        if self._buffer:
+            self._consumed(len(self._buffer))
+            self._buffer = bytearray()
+        if self._waiting:
+            self._waiting = False
+            self.reactor.remove_writer(self.fd)
+
+    def _consumed(self, size: int):
+        with self._lock:
+            self._pending -= size
+        INPUT_PENDING.dec(size)
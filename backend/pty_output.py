@@ -0,0 +1,271 @@
+import os
+import re
+import uuid
+import threading
+from typing import Callable, List, Optional, Tuple, Union
+
+# 输出合并窗口（毫秒）和单帧最大字节数，先到者触发发送
+COALESCE_WINDOW_MS = float(os.environ.get('PTY_COALESCE_MS', '8'))
+COALESCE_MAX_BYTES = int(os.environ.get('PTY_COALESCE_BYTES', str(32 * 1024)))
+
+
+class OutputCoalescer:
+    """按时间窗口/大小合并pty输出，把大量小块输出合成一帧发送
+
+    所有方法都应在反应器线程中调用；只有immediate标记可以从其他线程设置。
+    """
+
+    def __init__(self, reactor, flush_callback: Callable[[bytes], None],
+                 window_ms: float = COALESCE_WINDOW_MS,
+                 max_bytes: int = COALESCE_MAX_BYTES):
+        self.reactor = reactor
+        self.flush_callback = flush_callback
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_bytes = max_bytes
+        self.immediate = False  # 下一块输出立即发送（交互回显路径）
+        self._buffer = bytearray()
+        self._timer = None
+
+    @property
+    def pending(self) -> int:
+        """尚未发送的字节数"""
+        return len(self._buffer)
+
+    def feed(self, data: bytes):
+        """追加输出，必要时立即发送"""
+        self._buffer += data
+        if self.immediate or self.window <= 0 or len(self._buffer) >= self.max_bytes:
+            self.immediate = False
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.reactor.call_later(self.window, self._on_timer)
+
+    def flush(self):
+        """立即发送缓冲区中的全部输出"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self.flush_callback(data)
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+
+# 客户端跟不上时是否折叠被回车覆盖的进度条重绘
+COLLAPSE_REDRAWS = os.environ.get('PTY_COLLAPSE_REDRAWS', 'true').lower() == 'true'
+
+_SGR = re.compile(rb'\x1b\[[0-9;]*m')
+# 去掉SGR后只剩这些字节的内容宽度可以精确计算（可打印ASCII，\r分隔多段）
+_PLAIN_BYTES = bytes(range(0x20, 0x7f)) + b'\r'
+_PLAIN_PREFIX = re.compile(rb'(?:[\x20-\x7e]|\x1b\[[0-9;]*m)*')
+# 擦除整行或光标到行尾
+_ERASE_LINE = re.compile(rb'(?:\x1b\[[0-9;]*m)*\x1b\[[02]?K')
+
+
+def _strip_sgr(data: bytes) -> Optional[bytes]:
+    """去掉SGR后的可见内容；含有其他控制字符或非ASCII时返回None"""
+    visible = _SGR.sub(b'', data) if b'\x1b' in data else data
+    return None if visible.translate(None, _PLAIN_BYTES) else visible
+
+
+def _visible_width(plain: bytes) -> int:
+    return len(_SGR.sub(b'', plain)) if b'\x1b' in plain else len(plain)
+
+
+def _covered_width(segment: bytes, cols: int) -> int:
+    """segment从行首写出时一定会被覆盖的列数"""
+    if _ERASE_LINE.match(segment):
+        return cols
+    return _visible_width(_PLAIN_PREFIX.match(segment).group())
+
+
+def _carried_sgr(dropped: List[bytes]) -> bytes:
+    """被丢弃的段里仍影响后续文字颜色的SGR（最近一次重置之后的部分）"""
+    run = b''.join(dropped)
+    if b'\x1b' not in run:
+        return b''
+    reset = max(run.rfind(b'\x1b[0m'), run.rfind(b'\x1b[m'))
+    return b''.join(_SGR.findall(run[max(reset, 0):]))
+
+
+def _collapse_line(line: bytes, cols: int) -> bytes:
+    segments = line.split(b'\r')
+    last = len(segments) - 1
+    # widths[i]为第i段的显示宽度，不是纯ASCII+SGR的段为None（不能丢弃）
+    visible = _strip_sgr(line[line.index(b'\r') + 1:line.rindex(b'\r')])
+    if visible is not None:
+        widths = [None] + [len(x) for x in visible.split(b'\r')]
+    else:
+        widths = [None]
+        for segment in segments[1:last]:
+            visible = _strip_sgr(segment)
+            widths.append(None if visible is None else len(visible))
+
+    kept = [segments[0]]
+    run_start = None
+    for i in range(1, last):
+        width = widths[i]
+        if width is not None and width < cols:
+            following = widths[i + 1] if i + 1 < last else None
+            if following is None:
+                following = _covered_width(segments[i + 1], cols)
+            if following >= width:
+                if run_start is None:
+                    run_start = i
+                continue
+        kept.append(segments[i] if run_start is None else _carried_sgr(segments[run_start:i]) + segments[i])
+        run_start = None
+    kept.append(segments[last] if run_start is None else _carried_sgr(segments[run_start:last]) + segments[last])
+    return b'\r'.join(kept)
+
+
+def collapse_redraws(data: bytes, cols: int) -> bytes:
+    """丢弃一帧中被回车覆盖的中间重绘（pip/wget/tqdm的进度条），最终屏幕内容不变
+
+    只丢弃同一行内以\\r开头、不折行、并被后一段从行首完全覆盖的段；被丢弃段中的SGR
+    保留下来，保证后续文字的颜色不变。帧首段（光标位置未知）和帧末段总是原样保留。
+    """
+    carriage_returns = data.count(b'\r')
+    if carriage_returns < 2 or carriage_returns == data.count(b'\r\n'):
+        return data  # 没有不跟换行的回车，不存在重绘
+    lines = data.split(b'\n')
+    for n, line in enumerate(lines):
+        if line.count(b'\r') >= 2:
+            lines[n] = _collapse_line(line, cols)
+    return b'\n'.join(lines)
+
+
+# 每个任务保留的回放字节数上限，0表示不保留
+SCROLLBACK_BYTES = int(os.environ.get('PTY_SCROLLBACK_BYTES', str(1024 * 1024)))
+
+
+class ScrollbackBuffer:
+    """固定容量的字节环形缓冲区，按绝对偏移量读取尾部输出
+
+    偏移量从任务开始时的0累计，不会因为回绕而重置；
+    缓冲区按需增长，写满capacity后开始覆盖最旧的数据，内存严格有界。
+    """
+
+    def __init__(self, capacity: int = SCROLLBACK_BYTES):
+        self.capacity = max(0, capacity)
+        self.end = 0  # 已写入的总字节数
+        self._buf = bytearray()
+        self._lock = threading.Lock()  # 反应器线程写入，事件处理线程读取
+
+    @property
+    def start(self) -> int:
+        """仍可读取的最早偏移量"""
+        return max(0, self.end - self.capacity)
+
+    def append(self, data: bytes):
+        n = len(data)
+        if not n:
+            return
+        capacity = self.capacity
+        if not capacity:
+            self.end += n
+            return
+
+        with self._lock:
+            if len(self._buf) == self.end and self.end + n <= capacity:
+                # 尚未写满：直接追加
+                self._buf += data
+            else:
+                if len(self._buf) < capacity:
+                    self._buf.extend(bytes(capacity - len(self._buf)))
+                with memoryview(data) as view:
+                    tail = view[-capacity:]
+                    pos = (self.end + n - len(tail)) % capacity
+                    first = min(len(tail), capacity - pos)
+                    self._buf[pos:pos + first] = tail[:first]
+                    self._buf[:len(tail) - first] = tail[first:]
+            self.end += n
+
+    def read_from(self, offset: int, limit: Optional[int] = None) -> Tuple[int, bytes]:
+        """读取从offset到末尾的数据，返回(实际起始偏移, 数据)
+
+        offset早于可读范围时从最早的数据开始；limit限制最多返回的尾部字节数。
+        """
+        with self._lock:
+            offset = min(max(offset, self.start), self.end)
+            if limit is not None:
+                offset = max(offset, self.end - limit)
+            length = self.end - offset
+            if not length:
+                return offset, b''
+            pos = offset % self.capacity
+            first = min(length, self.capacity - pos)
+            return offset, bytes(self._buf[pos:pos + first]) + bytes(self._buf[:length - first])
+
+
+# 常驻shell的命令结束标记：ESC ] 777;qd;<nonce>;<seq>;<退出码> BEL
+COMMAND_MARKER = b'\x1b]777;qd;'
+# 标记中nonce之后部分（seq;退出码）的最大长度，超出则视为普通输出
+MARKER_BODY_MAX = 32
+
+
+class CommandMarkerScanner:
+    """从常驻shell的输出中识别并剥离命令结束标记
+
+    标记由每条命令后追加的printf输出，nonce随任务随机生成，命令自身的输出无法伪造；
+    跨读取块被截断的标记前缀会暂存到下一块再判断。
+    """
+
+    def __init__(self, nonce: Optional[str] = None):
+        self.nonce = nonce or uuid.uuid4().hex[:12]
+        self.prefix = COMMAND_MARKER + self.nonce.encode('ascii') + b';'
+        self._pending = b''
+
+    def marker_command(self, seq: int) -> str:
+        """输出第seq条命令结束标记的shell语句（退出码取自$__qd）"""
+        return "printf '\\033]777;qd;%s;%d;%%d\\007' \"$__qd\"" % (self.nonce, seq)
+
+    def feed(self, data: bytes) -> List[Union[bytes, Tuple[int, int]]]:
+        """按顺序返回普通输出片段和(seq, 退出码)标记"""
+        buf = self._pending + data
+        self._pending = b''
+        items: List[Union[bytes, Tuple[int, int]]] = []
+        while buf:
+            index = buf.find(self.prefix)
+            if index < 0:
+                keep = self._partial_prefix(buf)
+                if len(buf) > keep:
+                    items.append(buf[:len(buf) - keep])
+                self._pending = buf[len(buf) - keep:]
+                break
+            if index:
+                items.append(buf[:index])
+            body = index + len(self.prefix)
+            end = buf.find(b'\x07', body, body + MARKER_BODY_MAX)
+            if end < 0:
+                if len(buf) - body < MARKER_BODY_MAX:
+                    # 标记还没收全
+                    self._pending = buf[index:]
+                    break
+                items.append(buf[index:body])
+                buf = buf[body:]
+                continue
+            try:
+                seq, exit_code = buf[body:end].split(b';')
+                items.append((int(seq), int(exit_code)))
+            except ValueError:
+                items.append(buf[index:end + 1])
+            buf = buf[end + 1:]
+        return items
+
+    def flush(self) -> bytes:
+        """取出暂存的不完整数据（shell退出时调用）"""
+        data, self._pending = self._pending, b''
+        return data
+
+    def _partial_prefix(self, buf: bytes) -> int:
+        """buf末尾与标记前缀开头重合的长度"""
+        for size in range(min(len(self.prefix) - 1, len(buf)), 0, -1):
+            if buf.endswith(self.prefix[:size]):
+                return size
+        return 0
@@ -0,0 +1,243 @@
+import os
+import pty
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+import termios
+import struct
+import fcntl
+from collections import deque
+from typing import Optional, Tuple
+from process_utils import terminate_process_groups
+
+logger = logging.getLogger('PtyPool')
+
+# 预热的空闲shell数量，0表示关闭预热池
+POOL_SIZE = int(os.environ.get('PTY_POOL_SIZE', '2'))
+DEFAULT_ROWS = 24
+DEFAULT_COLS = 80
+# 取用后延迟补充（秒）：eventlet下fork会阻塞整个hub，不能挡在刚交出的命令前面
+REFILL_DELAY = 0.1
+# 空闲shell转为常驻shell：去掉提示符，stderr并回pty，捕获SIGINT使Ctrl+C只结束前台命令；
+# 尺寸随resize变化，不再通过COLUMNS/LINES固定
+PERSISTENT_SHELL_SETUP = 'PS1=; PS2=; exec 2>&1; trap : INT; unset COLUMNS LINES\n'
+# 规范模式下tty一行输入的上限：内核的行缓冲区N_TTY_BUF_SIZE为4096字节（含换行符），
+# 超出的部分被静默丢弃，shell读到的是截断的命令。写给shell的命令行不能超过这个长度（留出余量）
+MAX_INPUT_LINE = 4000
+
+
+def build_terminal_env(rows: int, cols: int) -> dict:
+    """构造终端子进程的环境变量"""
+    env = os.environ.copy()
+    env['TERM'] = 'xterm-256color'
+    env['COLORTERM'] = 'truecolor'  # 支持24位真彩色
+    env['COLUMNS'] = str(cols)
+    env['LINES'] = str(rows)
+    # 强制启用颜色输出
+    env['CLICOLOR'] = '1'
+    env['FORCE_COLOR'] = '1'
+    env['CLICOLOR_FORCE'] = '1'
+    # 禁用分页器以确保颜色输出
+    env['PAGER'] = 'cat'
+    env['LESS'] = '-R'  # 允许ANSI颜色通过
+    # Python特定的颜色强制
+    env['PYTHONUNBUFFERED'] = '1'
+    env['PY_COLORS'] = '1'
+    return env
+
+
+def set_terminal_size(fd: int, rows: int, cols: int):
+    """设置终端尺寸"""
+    size = struct.pack('HHHH', rows, cols, 0, 0)
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, size)
+
+
+def set_echo(fd: int, enabled: bool):
+    """开关终端回显（master和slave共享termios设置）"""
+    attrs = termios.tcgetattr(fd)
+    if enabled:
+        attrs[3] |= termios.ECHO
+    else:
+        attrs[3] &= ~termios.ECHO
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+
+def spawn_idle_shell(rows: int = DEFAULT_ROWS, cols: int = DEFAULT_COLS) -> Tuple[int, subprocess.Popen]:
+    """启动一个关闭回显、从pty读取命令的空闲shell"""
+    # stderr不是终端时sh为非交互模式，不会输出提示符；之后再把stderr重定向回pty
+    return spawn_pty_process(['/bin/sh'], rows, cols, stderr=subprocess.DEVNULL, echo=False)
+
+
+def start_persistent_shell(master_fd: int, rows: int, cols: int):
+    """把空闲shell初始化为常驻shell"""
+    set_terminal_size(master_fd, rows, cols)
+    os.write(master_fd, PERSISTENT_SHELL_SETUP.encode('utf-8'))
+
+
+def persistent_command_line(command: str, marker_command: str) -> bytes:
+    """常驻shell中执行命令的输入行，命令结束后输出结束标记
+
+    命令用eval在shell自身中执行，cd和变量会保留到后续命令；回显只在命令运行期间打开。
+    一行写不下的命令先写入临时文件，由shell用`.`在自身中执行，文件的第一行删除文件自己。
+    """
+    line = 'stty echo; eval %s; __qd=$?; stty -echo; %s\n' % (shlex.quote(command), marker_command)
+    if len(line.encode('utf-8')) > MAX_INPUT_LINE:
+        fd, path = tempfile.mkstemp(prefix='quickdemo-cmd-', suffix='.sh')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('rm -f %s\n%s\n' % (shlex.quote(path), command))
+        line = 'stty echo; . %s; __qd=$?; stty -echo; %s\n' % (shlex.quote(path), marker_command)
+    return line.encode('utf-8')
+
+
+def _acquire_controlling_tty():
+    """子进程中执行：把pty的slave端设为新会话的控制终端，使Ctrl+C等信号生效"""
+    try:
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+    except OSError:
+        pass
+
+
+def spawn_pty_process(args, rows: int, cols: int, shell: bool = False,
+                      stderr=None, echo: bool = True) -> Tuple[int, subprocess.Popen]:
+    """在新pty中启动进程，返回(非阻塞的master fd, 进程)"""
+    master_fd, slave_fd = pty.openpty()
+    try:
+        set_terminal_size(master_fd, rows, cols)
+        if not echo:
+            set_echo(slave_fd, False)
+        env = build_terminal_env(rows, cols)
+
+        if os.name == 'nt':  # Windows - 使用winpty或者fallback到subprocess
+            # Windows下pty支持有限，可能需要特殊处理
+            process = subprocess.Popen(
+                args,
+                shell=shell,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd if stderr is None else stderr,
+                env=env,
+                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
+            )
+        else:  # Unix/Linux
+            process = subprocess.Popen(
+                args,
+                shell=shell,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd if stderr is None else stderr,
+                env=env,
+                start_new_session=True,
+                preexec_fn=_acquire_controlling_tty
+            )
+    except Exception:
+        os.close(master_fd)
+        raise
+    finally:
+        # 关闭父进程中的slave端
+        os.close(slave_fd)
+
+    # 设置master端为非阻塞
+    fcntl.fcntl(master_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+    return master_fd, process
+
+
+class PtyPool:
+    """预先创建的空闲shell池
+
+    每个空闲shell都已经打开pty、设置好尺寸并exec了/bin/sh，正在阻塞读取命令。
+    取用时只需把命令写进pty，省去openpty、复制环境变量和fork/exec的开销；
+    取走后由后台线程补充新的空闲shell。
+    """
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size if os.name != 'nt' else 0
+        self._idle: deque = deque()  # (master_fd, process)
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._closed = False
+
+    def start(self):
+        """后台填充空闲shell"""
+        self._refill_async()
+
+    def available(self) -> int:
+        """当前可用的空闲shell数量"""
+        return len(self._idle)
+
+    def acquire(self) -> Optional[Tuple[int, subprocess.Popen]]:
+        """取出一个空闲shell，池为空时返回None"""
+        shell = None
+        with self._lock:
+            while self._idle:
+                master_fd, process = self._idle.popleft()
+                if process.poll() is None:
+                    shell = (master_fd, process)
+                    break
+                os.close(master_fd)
+        self._refill_async()
+        return shell
+
+    @staticmethod
+    def _command_line(command: str, rows: int, cols: int) -> bytes:
+        # 空闲shell的回显是关闭的，命令行本身不会出现在输出里；
+        # pty对写入的处理是异步的，所以由shell读到这一行后自己恢复回显，供交互程序使用
+        line = 'stty echo; export COLUMNS=%d LINES=%d; exec /bin/sh -c %s 2>&1\n' % (
+            cols, rows, shlex.quote(command))
+        return line.encode('utf-8')
+
+    def accepts(self, command: str, rows: int, cols: int) -> bool:
+        """命令能否交给空闲shell执行；命令行超过tty的行长度上限时只能直接启动进程"""
+        return len(self._command_line(command, rows, cols)) <= MAX_INPUT_LINE
+
+    def run_command(self, master_fd: int, command: str, rows: int, cols: int):
+        """让取出的空闲shell以`/bin/sh -c command`的方式执行命令"""
+        line = self._command_line(command, rows, cols)
+        if len(line) > MAX_INPUT_LINE:
+            raise ValueError('command line of %d bytes exceeds the tty line limit' % len(line))
+        set_terminal_size(master_fd, rows, cols)
+        os.write(master_fd, line)
+
+    def close(self):
+        """关闭所有空闲shell"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        terminate_process_groups([process for _, process in idle], timeout=0.5)
+        for master_fd, _ in idle:
+            try:
+                os.close(master_fd)
+            except OSError:
+                pass
+
+    def _refill_async(self):
+        with self._lock:
+            if self._refilling or self._closed or len(self._idle) >= self.size:
+                return
+            self._refilling = True
+        thread = threading.Thread(target=self._refill, name='PtyPoolRefill')
+        thread.daemon = True
+        thread.start()
+
+    def _refill(self):
+        try:
+            while True:
+                time.sleep(REFILL_DELAY)
+                with self._lock:
+                    if self._closed or len(self._idle) >= self.size:
+                        return
+                shell = spawn_idle_shell()
+                with self._lock:
+                    if self._closed:
+                        master_fd, process = shell
+                        process.kill()
+                        os.close(master_fd)
+                        return
+                    self._idle.append(shell)
+        except Exception as e:
+            logger.error("Failed to spawn idle shell: %s", e)
+        finally:
+            with self._lock:
+                self._refilling = False
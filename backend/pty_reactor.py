@@ -0,0 +1,490 @@
+import os
+import heapq
+import logging
+import select
+import selectors
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+try:
+    # eventlet打补丁后select模块不再提供epoll，selectors.DefaultSelector退化为经由hub的select：
+    # 每次等待都要把所有fd加入hub再移除，开销随任务数增长。这里取原生模块自行等待
+    from eventlet import hubs as _hubs, patcher as _patcher
+    _select = _patcher.original('select')
+    _os = _patcher.original('os')
+    _GREEN = _patcher.is_monkey_patched('select')
+except ImportError:
+    _hubs = None
+    _select = select
+    _os = os
+    _GREEN = False
+
+logger = logging.getLogger('PtyReactor')
+
+# 没有pidfd（非Linux或内核低于5.3）时退出检测的轮询间隔（秒）；所有任务共用一个定时器
+PROCESS_POLL_INTERVAL = 0.1
+
+
+class TimerHandle:
+    """call_later返回的定时器句柄"""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other: 'TimerHandle'):
+        return self.when < other.when
+
+
+class _WaitTimeout(Exception):
+    pass
+
+
+class EpollSelector:
+    """基于原生epoll的selector（只实现反应器用到的接口）
+
+    所有fd都注册在同一个epoll中。eventlet打补丁时只把epoll fd本身交给hub等待，
+    hub中始终只有这一个fd；唤醒后用poll(0)一次取出全部就绪事件，
+    单次等待的开销与注册的fd数量无关。未打补丁时直接阻塞在epoll.poll上。
+    """
+
+    def __init__(self):
+        self._epoll = _select.epoll()
+        self._map: Dict[int, selectors.SelectorKey] = {}
+
+    @staticmethod
+    def _mask(events: int) -> int:
+        mask = 0
+        if events & selectors.EVENT_READ:
+            mask |= _select.EPOLLIN
+        if events & selectors.EVENT_WRITE:
+            mask |= _select.EPOLLOUT
+        return mask
+
+    def fileno(self) -> int:
+        return self._epoll.fileno()
+
+    def get_map(self) -> Dict[int, selectors.SelectorKey]:
+        return self._map
+
+    def register(self, fd: int, events: int, data=None) -> selectors.SelectorKey:
+        if fd in self._map:
+            raise KeyError(f"{fd} is already registered")
+        self._epoll.register(fd, self._mask(events))
+        key = self._map[fd] = selectors.SelectorKey(fd, fd, events, data)
+        return key
+
+    def modify(self, fd: int, events: int, data=None) -> selectors.SelectorKey:
+        key = self._map[fd]
+        if events != key.events:
+            self._epoll.modify(fd, self._mask(events))
+        key = self._map[fd] = key._replace(events=events, data=data)
+        return key
+
+    def unregister(self, fd: int) -> selectors.SelectorKey:
+        key = self._map.pop(fd)
+        try:
+            self._epoll.unregister(fd)
+        except OSError:
+            pass  # fd已被关闭，epoll会自动移除
+        return key
+
+    def select(self, timeout: Optional[float] = None) -> list:
+        if _GREEN and timeout != 0:
+            try:
+                _hubs.trampoline(self._epoll.fileno(), read=True, timeout=timeout, timeout_exc=_WaitTimeout)
+            except _WaitTimeout:
+                return []
+            timeout = 0
+        try:
+            events = self._epoll.poll(-1 if timeout is None else timeout)
+        except InterruptedError:
+            return []
+        ready = []
+        for fd, mask in events:
+            key = self._map.get(fd)
+            if key is None:
+                continue
+            events = 0
+            if mask & ~_select.EPOLLOUT:  # EPOLLIN/EPOLLHUP/EPOLLERR都按可读处理
+                events |= selectors.EVENT_READ
+            if mask & ~_select.EPOLLIN:
+                events |= selectors.EVENT_WRITE
+            ready.append((key, events & key.events))
+        return ready
+
+    def close(self):
+        self._epoll.close()
+        self._map.clear()
+
+
+class PtyReactor:
+    """共享的PTY I/O反应器
+
+    一个后台线程通过epoll（非Linux下为selectors）监听所有会话的master fd，
+    按事件分发回调，线程数和空闲CPU不随任务数增长。
+    接口与asyncio事件循环的add_reader/add_writer/call_later保持一致；
+    同一fd可以同时注册读和写回调，selector中的数据为(读回调, 写回调)。
+    所有回调都在反应器线程中执行；其他线程修改fd注册时会被转交到反应器线程，
+    因此fd的注销和关闭也应通过call_soon_threadsafe在反应器线程中完成。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready: list = []  # 待执行的(callback, args)
+        self._timers: list = []  # TimerHandle最小堆
+        self._processes: Dict[int, tuple] = {}  # pid -> (process, callback, args, pidfd)
+        self._poll_timer: Optional[TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_ident: Optional[int] = None
+        self._running = False
+        self._wakeup_pending = False
+        self._open()
+
+    def _open(self):
+        """创建selector和自唤醒管道"""
+        self._selector = EpollSelector() if hasattr(_select, 'epoll') else selectors.DefaultSelector()
+        # 自唤醒管道：其他线程投递任务后唤醒select
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+    def start(self):
+        """启动反应器线程"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='PtyReactor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止反应器线程"""
+        self._running = False
+        self._wakeup()
+
+    def in_reactor_thread(self) -> bool:
+        return threading.get_ident() == self._thread_ident
+
+    def registered_fds(self) -> int:
+        """当前注册的fd数量（pty master和pidfd，不含自唤醒管道）"""
+        return len(self._selector.get_map()) - 1
+
+    def call_soon_threadsafe(self, callback: Callable, *args):
+        """从任意线程投递回调到反应器线程执行"""
+        with self._lock:
+            self._ready.append((callback, args))
+        self._wakeup()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """延迟delay秒后在反应器线程中执行回调"""
+        handle = TimerHandle(time.monotonic() + max(0.0, delay), callback, args)
+        with self._lock:
+            heapq.heappush(self._timers, handle)
+        if not self.in_reactor_thread():
+            self._wakeup()
+        return handle
+
+    def add_reader(self, fd: int, callback: Callable, *args):
+        """fd可读时调用callback(*args)"""
+        self.run_in_loop(self._add_reader, fd, callback, args)
+
+    def remove_reader(self, fd: int):
+        """停止监听fd"""
+        self.run_in_loop(self._remove_reader, fd)
+
+    def add_writer(self, fd: int, callback: Callable, *args):
+        """fd可写时调用callback(*args)"""
+        self.run_in_loop(self._add_writer, fd, callback, args)
+
+    def remove_writer(self, fd: int):
+        """停止监听fd可写"""
+        self.run_in_loop(self._remove_writer, fd)
+
+    def close_fd(self, fd: int):
+        """注销并关闭fd（在反应器线程中执行，避免select到已关闭的fd）"""
+        self.run_in_loop(self._close_fd, fd)
+
+    def watch_process(self, process, callback: Callable, *args):
+        """进程退出后调用callback(*args)"""
+        self.run_in_loop(self._watch_process, process, callback, args)
+
+    def unwatch_process(self, process):
+        """取消进程退出监听"""
+        self.run_in_loop(self._unwatch_process, process.pid)
+
+    def run_in_loop(self, callback: Callable, *args):
+        """在反应器线程中执行回调：已在反应器线程中时立即执行，否则投递过去"""
+        if self.in_reactor_thread():
+            callback(*args)
+        else:
+            self.call_soon_threadsafe(callback, *args)
+
+    def _add_reader(self, fd: int, callback: Callable, args: tuple):
+        self._add_handler(fd, selectors.EVENT_READ, (callback, args))
+
+    def _remove_reader(self, fd: int):
+        self._remove_handler(fd, selectors.EVENT_READ)
+
+    def _add_writer(self, fd: int, callback: Callable, args: tuple):
+        self._add_handler(fd, selectors.EVENT_WRITE, (callback, args))
+
+    def _remove_writer(self, fd: int):
+        self._remove_handler(fd, selectors.EVENT_WRITE)
+
+    def _add_handler(self, fd: int, event: int, handler: tuple):
+        key = self._selector.get_map().get(fd)
+        try:
+            if key is None:
+                self._selector.register(fd, event, (handler, None) if event == selectors.EVENT_READ else (None, handler))
+            else:
+                reader, writer = key.data
+                if event == selectors.EVENT_READ:
+                    reader = handler
+                else:
+                    writer = handler
+                self._selector.modify(fd, key.events | event, (reader, writer))
+        except (ValueError, OSError) as e:
+            logger.error("Failed to register fd %s: %s", fd, e)
+
+    def _remove_handler(self, fd: int, event: int):
+        key = self._selector.get_map().get(fd)
+        if key is None or key.data is None:
+            return
+        reader, writer = key.data
+        if event == selectors.EVENT_READ:
+            reader = None
+        else:
+            writer = None
+        try:
+            if key.events & ~event:
+                self._selector.modify(fd, key.events & ~event, (reader, writer))
+            else:
+                self._selector.unregister(fd)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _close_fd(self, fd: int):
+        # 先从epoll注销再关闭：fd号随后被新的pty或pidfd复用时不会收到旧fd的事件
+        self._remove_reader(fd)
+        self._remove_writer(fd)
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def _watch_process(self, process, callback: Callable, args: tuple):
+        pidfd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                # 进程退出时pidfd变为可读，无需轮询
+                pidfd = os.pidfd_open(process.pid)
+            except ProcessLookupError:
+                # 已经退出并被回收
+                self._invoke(callback, args)
+                return
+            except OSError:
+                pidfd = None
+
+        self._processes[process.pid] = (process, callback, args, pidfd)
+        if pidfd is not None:
+            self._add_reader(pidfd, self._on_pidfd_readable, (process.pid,))
+        elif self._poll_timer is None:
+            self._poll_timer = self.call_later(PROCESS_POLL_INTERVAL, self._poll_processes)
+
+    def _unwatch_process(self, pid: int):
+        entry = self._processes.pop(pid, None)
+        if entry and entry[3] is not None:
+            self._close_fd(entry[3])
+
+    def _on_pidfd_readable(self, pid: int):
+        entry = self._processes.get(pid)
+        if not entry:
+            return
+        process, callback, args, _ = entry
+        self._unwatch_process(pid)
+        # 回收子进程并记录returncode
+        process.poll()
+        self._invoke(callback, args)
+
+    def _poll_processes(self):
+        """统一检查所有轮询方式监听的进程是否已退出"""
+        self._poll_timer = None
+        polled = False
+        for pid, (process, callback, args, pidfd) in list(self._processes.items()):
+            if pidfd is not None:
+                continue
+            if process.poll() is not None:
+                self._processes.pop(pid, None)
+                self._invoke(callback, args)
+            else:
+                polled = True
+        if polled and self._poll_timer is None:
+            self._poll_timer = self.call_later(PROCESS_POLL_INTERVAL, self._poll_processes)
+
+    def _wakeup(self):
+        with self._lock:
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        try:
+            _os.write(self._wakeup_w, b'\0')
+        except OSError:
+            pass
+
+    def _drain_wakeup(self):
+        with self._lock:
+            self._wakeup_pending = False
+        try:
+            _os.read(self._wakeup_r, 4096)
+        except OSError:
+            pass
+
+    def _invoke(self, callback: Callable, args: tuple):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.exception("Error in reactor callback %s: %s", getattr(callback, '__name__', callback), e)
+
+    def _next_timeout(self) -> Optional[float]:
+        with self._lock:
+            if self._ready:
+                return 0
+            while self._timers and self._timers[0].cancelled:
+                heapq.heappop(self._timers)
+            if not self._timers:
+                return None
+            return max(0.0, self._timers[0].when - time.monotonic())
+
+    def _run(self):
+        self._thread_ident = threading.get_ident()
+        logger.debug("PTY reactor started")
+        while self._running:
+            try:
+                events = self._selector.select(self._next_timeout())
+            except (OSError, ValueError) as e:
+                logger.error("Reactor select failed: %s", e)
+                time.sleep(0.01)
+                continue
+
+            selector_map = self._selector.get_map()
+            for key, mask in events:
+                if key.data is None:
+                    self._drain_wakeup()
+                    continue
+                # 同一轮中前面的回调可能已经注销了这个fd（或关闭后被新fd复用），
+                # 读回调也可能注销了写回调；只调用仍然注册着的同一个回调
+                reader, writer = key.data
+                if reader is not None and mask & selectors.EVENT_READ:
+                    current = selector_map.get(key.fd)
+                    if current is not None and current.data[0] is reader:
+                        self._invoke(*reader)
+                if writer is not None and mask & selectors.EVENT_WRITE:
+                    current = selector_map.get(key.fd)
+                    if current is not None and current.data[1] is writer:
+                        self._invoke(*writer)
+
+            # 到期的定时器
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                while self._timers and self._timers[0].when <= now:
+                    due.append(heapq.heappop(self._timers))
+                ready, self._ready = self._ready, []
+            for handle in due:
+                if not handle.cancelled:
+                    self._invoke(handle.callback, handle.args)
+            for callback, args in ready:
+                self._invoke(callback, args)
+        logger.debug("PTY reactor stopped")
+
+
+class AsyncioReactor(PtyReactor):
+    """在asyncio事件循环上实现PtyReactor的接口（asyncio/ASGI模式使用）
+
+    fd监听直接交给loop.add_reader，定时器交给loop.call_later，不再需要独立的反应器线程；
+    进程退出监听沿用pidfd/轮询的实现。所有回调都在事件循环线程中执行，
+    其他线程（执行器中的阻塞操作）的调用同样会被转交到事件循环。
+    必须在事件循环线程中创建。
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._readers: set = set()
+        self._writers: set = set()
+        super().__init__()
+        self._thread_ident = threading.get_ident()
+
+    def _open(self):
+        pass  # fd监听和唤醒都由事件循环负责
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def registered_fds(self) -> int:
+        return len(self._readers | self._writers)
+
+    def call_soon_threadsafe(self, callback: Callable, *args):
+        self.loop.call_soon_threadsafe(self._invoke, callback, args)
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        handle = TimerHandle(time.monotonic() + max(0.0, delay), callback, args)
+        self.run_in_loop(self._schedule, handle)
+        return handle
+
+    def _schedule(self, handle: TimerHandle):
+        self.loop.call_later(max(0.0, handle.when - time.monotonic()), self._fire, handle)
+
+    def _fire(self, handle: TimerHandle):
+        if not handle.cancelled:
+            self._invoke(handle.callback, handle.args)
+
+    def _add_reader(self, fd: int, callback: Callable, args: tuple):
+        try:
+            self.loop.add_reader(fd, self._invoke, callback, args)
+            self._readers.add(fd)
+        except (ValueError, OSError) as e:
+            logger.error("Failed to register fd %s: %s", fd, e)
+
+    def _remove_reader(self, fd: int):
+        if fd in self._readers:
+            self._readers.discard(fd)
+            self.loop.remove_reader(fd)
+
+    def _add_writer(self, fd: int, callback: Callable, args: tuple):
+        try:
+            self.loop.add_writer(fd, self._invoke, callback, args)
+            self._writers.add(fd)
+        except (ValueError, OSError) as e:
+            logger.error("Failed to register fd %s: %s", fd, e)
+
+    def _remove_writer(self, fd: int):
+        if fd in self._writers:
+            self._writers.discard(fd)
+            self.loop.remove_writer(fd)
+
+
+_reactor: Optional[PtyReactor] = None
+_reactor_lock = threading.Lock()
+
+
+def get_reactor() -> PtyReactor:
+    """获取（必要时创建并启动）全局共享的反应器"""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = PtyReactor()
+            _reactor.start()
+        return _reactor
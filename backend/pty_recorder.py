@@ -0,0 +1,289 @@
+import os
+import re
+import json
+import mmap
+import time
+import uuid
+import codecs
+import struct
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    # eventlet打补丁后threading/queue都是绿色的，磁盘写入仍会占用hub；写入线程要用原生线程
+    from eventlet import patcher as _patcher
+    _threading = _patcher.original('threading')
+    _queue = _patcher.original('queue')
+except ImportError:
+    import threading as _threading
+    import queue as _queue
+
+import metrics
+
+logger = logging.getLogger('PtyRecorder')
+
+# 录像目录，相对路径以backend目录为基准
+RECORD_DIR = os.environ.get('PTY_RECORD_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings'))
+# 是否同时记录用户输入（"i"事件）；默认只记录输出
+RECORD_INPUT = os.environ.get('PTY_RECORD_INPUT', 'false').lower() == 'true'
+# 索引间隔（秒）：每隔这么长的录像时间写一条 时间->文件偏移 索引
+INDEX_INTERVAL = float(os.environ.get('PTY_RECORD_INDEX_INTERVAL', '1.0'))
+# 写入线程每批最多等待的时间（秒）和最多处理的事件数
+WRITE_INTERVAL = 0.1
+WRITE_BATCH = 4096
+# 待写事件队列上限，写入跟不上时丢弃事件而不是阻塞读取
+QUEUE_LIMIT = 65536
+
+# 索引文件记录：录像时间(double)、事件行在.cast文件中的字节偏移(uint64)
+INDEX_RECORD = struct.Struct('<dQ')
+INDEX_SUFFIX = '.idx'
+
+RECORDINGS_DROPPED = metrics.REGISTRY.counter(
+    'recording_dropped_events_total', 'Recording events dropped because the writer fell behind')
+
+_CLOSE = object()
+
+
+class Recording:
+    """单个任务的asciicast v2录像
+
+    事件只在调用线程里打上时间戳并入队，编码和写盘都由RecordingWriter的线程完成。
+    """
+
+    def __init__(self, writer: 'RecordingWriter', path: str, header: dict):
+        self.writer = writer
+        self.path = path
+        self.header = header
+        self.started = time.monotonic()
+        self.closed = False
+        self.dropped = 0
+        # 以下只在写入线程中使用
+        self._file = None
+        self._index = None
+        self._size = 0
+        self._next_index_time = 0.0
+        self._decoders = {}
+
+    def output(self, data: bytes):
+        self._submit('o', data)
+
+    def input(self, data: bytes):
+        if RECORD_INPUT:
+            self._submit('i', data)
+
+    def resize(self, cols: int, rows: int):
+        self._submit('r', '%dx%d' % (cols, rows))
+
+    def marker(self, label: str):
+        self._submit('m', label)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.submit((self, _CLOSE, None, None))
+
+    def _submit(self, kind: str, data):
+        if self.closed:
+            return
+        if not self.writer.submit((self, time.monotonic() - self.started, kind, data)):
+            self.dropped += 1
+            RECORDINGS_DROPPED.inc()
+            if self.dropped == 1:
+                logger.warning("Recording %s is falling behind, dropping events", self.path)
+
+    # ---- 写入线程 ----
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._index = open(self.path + INDEX_SUFFIX, 'ab')
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._write_lines([json.dumps(self.header, ensure_ascii=False)])
+
+    def _text(self, kind: str, data) -> str:
+        if isinstance(data, str):
+            return data
+        # 每类事件各自保留跨批次未完整的多字节字符
+        decoder = self._decoders.get(kind)
+        if decoder is None:
+            decoder = self._decoders[kind] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        return decoder.decode(data)
+
+    def _write_events(self, events: List[Tuple[float, str, object]]):
+        if self._file is None:
+            self._open()
+        lines = []
+        index_time = None
+        for elapsed, kind, data in events:
+            text = self._text(kind, data)
+            if not text:
+                continue
+            if index_time is None and elapsed >= self._next_index_time:
+                index_time = elapsed
+            lines.append(json.dumps([round(elapsed, 6), kind, text], ensure_ascii=False))
+        if not lines:
+            return
+        if index_time is not None:
+            # 索引指向本批第一条事件所在行
+            self._index.write(INDEX_RECORD.pack(index_time, self._size))
+            self._next_index_time = index_time + INDEX_INTERVAL
+        self._write_lines(lines)
+
+    def _write_lines(self, lines: List[str]):
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        self._file.write(data)
+        self._size += len(data)
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._index.flush()
+
+    def _close_files(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+
+class RecordingWriter:
+    """所有录像共用的批量写入线程"""
+
+    def __init__(self):
+        self._queue = _queue.Queue(QUEUE_LIMIT)
+        self._thread = None
+        self._lock = _threading.Lock()
+
+    def submit(self, item) -> bool:
+        """入队一个事件，队列已满时返回False（从不阻塞）"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except _queue.Full:
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = _threading.Thread(target=self._run, name='PtyRecorder', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_INTERVAL
+        while len(batch) < WRITE_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except _queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # 按录像分组，保持各自事件顺序；每个文件每批只写一次
+            grouped = {}
+            for recording, elapsed, kind, data in batch:
+                grouped.setdefault(recording, []).append((elapsed, kind, data))
+            for recording, events in grouped.items():
+                try:
+                    close = events[-1][0] is _CLOSE
+                    pending = [e for e in events if e[0] is not _CLOSE]
+                    if pending:
+                        recording._write_events(pending)
+                    recording._flush()
+                    if close:
+                        recording._close_files()
+                except Exception as e:
+                    logger.error("Failed to write recording %s: %s", recording.path, e)
+                    recording.closed = True
+                    try:
+                        recording._close_files()
+                    except Exception:
+                        pass
+
+
+_writer: Optional[RecordingWriter] = None
+
+
+def start_recording(name: str, command: str, rows: int, cols: int,
+                    directory: Optional[str] = None) -> Recording:
+    """为任务创建一个录像；文件由写入线程在第一批事件时创建"""
+    global _writer
+    if _writer is None:
+        _writer = RecordingWriter()
+    directory = directory or RECORD_DIR
+    os.makedirs(directory, exist_ok=True)
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+    # 不同会话可能在同一秒录制同名任务，加上随机后缀避免写进同一个文件
+    path = os.path.join(directory, '%s-%s-%s.cast' % (time.strftime('%Y%m%d-%H%M%S'), safe_name,
+                                                      uuid.uuid4().hex[:8]))
+    header = {
+        'version': 2,
+        'width': cols,
+        'height': rows,
+        'timestamp': int(time.time()),
+        'command': command,
+        'title': name,
+        'env': {'TERM': 'xterm-256color', 'SHELL': '/bin/sh'}
+    }
+    return Recording(_writer, path, header)
+
+
+class RecordingIndex:
+    """录像的时间索引，用mmap二分查找，不需要从头扫描录像"""
+
+    def __init__(self, cast_path: str):
+        self.cast_path = cast_path
+        with open(cast_path + INDEX_SUFFIX, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._count = size // INDEX_RECORD.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> Tuple[float, int]:
+        return INDEX_RECORD.unpack_from(self._mmap, i * INDEX_RECORD.size)
+
+    def offset_for(self, seconds: float) -> int:
+        """不晚于seconds的最后一个索引点在.cast文件中的偏移（没有则为第一条事件）"""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] <= seconds:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return self._entry(0)[1] if self._count else 0
+        return self._entry(lo - 1)[1]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def read_events(cast_path: str, start: float = 0.0) -> Iterator[list]:
+    """从录像时间start开始读取事件，借助索引直接定位"""
+    index = RecordingIndex(cast_path)
+    try:
+        offset = index.offset_for(start)
+    finally:
+        index.close()
+    with open(cast_path, 'rb') as f:
+        if offset == 0:
+            f.readline()  # 跳过头部
+        else:
+            f.seek(offset)
+        for line in f:
+            event = json.loads(line)
+            if event[0] >= start:
+                yield event
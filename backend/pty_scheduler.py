@@ -0,0 +1,206 @@
+import os
+import heapq
+import logging
+import itertools
+import time
+from typing import Callable, Dict, List, Optional
+
+import metrics
+from pty_reactor import PtyReactor
+
+logger = logging.getLogger('PtyScheduler')
+
+# 同时运行的任务数上限（所有会话合计）
+MAX_RUNNING = int(os.environ.get('PTY_MAX_RUNNING', '64'))
+# 单个会话同时运行的任务数上限，避免一个批量作业占满全局配额
+MAX_RUNNING_PER_SESSION = int(os.environ.get('PTY_MAX_RUNNING_PER_SESSION', '16'))
+# 单个会话最多排队的任务数
+MAX_QUEUED = int(os.environ.get('PTY_MAX_QUEUED', '10000'))
+
+QUEUED_TASKS = metrics.REGISTRY.gauge('scheduler_queued_tasks', 'Tasks waiting in the scheduler queue')
+RUNNING_TASKS = metrics.REGISTRY.gauge('scheduler_running_tasks', 'Tasks holding a scheduler slot')
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    'scheduler_queue_wait_seconds', 'Time a task waited in the scheduler queue before starting',
+    [0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0])
+
+
+class ScheduledTask:
+    """排队中的任务；优先级高的先运行，同优先级按提交顺序"""
+
+    __slots__ = ('session_id', 'task_id', 'command', 'options', 'priority', 'seq', 'queued_at', 'cancelled')
+
+    def __init__(self, session_id: str, task_id: str, command: str, options: dict, priority: int = 0):
+        self.session_id = session_id
+        self.task_id = task_id
+        self.command = command
+        self.options = options  # rows/cols/record/screen
+        self.priority = priority
+        self.seq = 0
+        self.queued_at = 0.0
+        self.cancelled = False
+
+    def __lt__(self, other: 'ScheduledTask'):
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class TaskScheduler:
+    """有并发上限的任务调度器
+
+    每个会话一个优先级队列，启动任务时在有空余配额的会话中选出优先级最高、最早提交的任务。
+    调度状态只在反应器线程中修改：提交、释放和取消都会被转交到反应器线程，
+    任务结束（_finish_terminal）本来就在反应器线程中，释放配额后立即启动下一个任务。
+    """
+
+    def __init__(self, reactor: PtyReactor, start: Callable[[ScheduledTask], None],
+                 notify: Callable[[str, str, dict], None], max_running: int = MAX_RUNNING,
+                 max_per_session: int = MAX_RUNNING_PER_SESSION, max_queued: int = MAX_QUEUED):
+        self.reactor = reactor
+        self._start = start  # 启动任务，在反应器线程中调用
+        self._notify = notify  # notify(session_id, event, payload)：向会话房间发送事件
+        self.max_running = max(1, max_running)
+        self.max_per_session = max(1, max_per_session)
+        self.max_queued = max_queued
+        self._queues: Dict[str, list] = {}  # sessionId -> ScheduledTask最小堆
+        self._queued: Dict[tuple, ScheduledTask] = {}  # (sessionId, taskId) -> 排队中的任务
+        self._running: Dict[str, set] = {}  # sessionId -> 占用配额的taskId
+        self._running_total = 0
+        self._seq = itertools.count()
+
+    def submit(self, tasks: List[ScheduledTask], is_duplicate: Callable[[ScheduledTask], bool]):
+        """提交任务；is_duplicate在反应器线程中检查taskId是否已被使用"""
+        self.reactor.run_in_loop(self._submit, tasks, is_duplicate)
+
+    def release(self, session_id: str, task_id: str):
+        """任务结束或启动失败，归还配额"""
+        self.reactor.run_in_loop(self._release, session_id, task_id)
+
+    def cancel(self, session_id: str, task_id: str):
+        """取消排队中的任务"""
+        self.reactor.run_in_loop(self._cancel, session_id, task_id)
+
+    def drop_session(self, session_id: str):
+        """会话关闭：丢弃其排队任务并归还其全部配额"""
+        self.reactor.run_in_loop(self._drop_session, session_id)
+
+    def is_queued(self, session_id: str, task_id: str) -> bool:
+        return (session_id, task_id) in self._queued
+
+    def describe(self, session_id: str) -> List[dict]:
+        """会话中排队任务的概要，格式与describe_tasks相同"""
+        return [{'taskId': task.task_id, 'command': task.command, 'status': 'queued', 'end': 0}
+                for (sid, _), task in list(self._queued.items()) if sid == session_id]
+
+    def _submit(self, tasks: List[ScheduledTask], is_duplicate: Callable[[ScheduledTask], bool]):
+        accepted = []
+        for task in tasks:
+            # 已分配配额但还在启动中的任务尚未出现在会话的终端列表里，也要算作重复
+            if ((task.session_id, task.task_id) in self._queued
+                    or task.task_id in self._running.get(task.session_id, ()) or is_duplicate(task)):
+                self._notify(task.session_id, 'terminal_error', {
+                    'sessionId': task.session_id,
+                    'taskId': task.task_id,
+                    'error': 'Terminal already exists'
+                })
+                continue
+            queue = self._queues.setdefault(task.session_id, [])
+            if len(queue) >= self.max_queued:
+                self._notify(task.session_id, 'terminal_error', {
+                    'sessionId': task.session_id,
+                    'taskId': task.task_id,
+                    'error': 'Task queue is full'
+                })
+                continue
+            task.seq = next(self._seq)
+            task.queued_at = time.monotonic()
+            heapq.heappush(queue, task)
+            self._queued[(task.session_id, task.task_id)] = task
+            metrics.TASKS.inc(state='queued')
+            QUEUED_TASKS.inc()
+            accepted.append(task)
+
+        self._dispatch()
+        # 没能立即启动的任务通知前端正在排队
+        for task in accepted:
+            if (task.session_id, task.task_id) in self._queued:
+                self._notify(task.session_id, 'terminal_status', {
+                    'sessionId': task.session_id,
+                    'taskId': task.task_id,
+                    'status': 'queued',
+                    'command': task.command
+                })
+
+    def _release(self, session_id: str, task_id: str):
+        if self._free_slot(session_id, task_id):
+            self._dispatch()
+
+    def _free_slot(self, session_id: str, task_id: str) -> bool:
+        running = self._running.get(session_id)
+        if not running or task_id not in running:
+            return False
+        running.discard(task_id)
+        if not running:
+            del self._running[session_id]
+        self._running_total -= 1
+        RUNNING_TASKS.dec()
+        return True
+
+    def _cancel(self, session_id: str, task_id: str):
+        task = self._dequeue(session_id, task_id)
+        if task is None:
+            return
+        # 与运行中被中断的任务一样上报完成
+        payload = {'sessionId': session_id, 'taskId': task_id}
+        self._notify(session_id, 'terminal_complete', dict(payload, exitCode=-2))
+        self._notify(session_id, 'terminal_status', dict(payload, status='idle'))
+        logger.info("Queued task %s cancelled", task_id)
+
+    def _drop_session(self, session_id: str):
+        for task in self._queues.pop(session_id, []):
+            if not task.cancelled:
+                self._dequeue(session_id, task.task_id)
+        running = self._running.pop(session_id, set())
+        if running:
+            self._running_total -= len(running)
+            RUNNING_TASKS.dec(len(running))
+            self._dispatch()
+
+    def _dequeue(self, session_id: str, task_id: str) -> Optional[ScheduledTask]:
+        """把任务移出排队状态；堆中的条目只做标记，出堆时跳过"""
+        task = self._queued.pop((session_id, task_id), None)
+        if task is not None:
+            task.cancelled = True
+            metrics.TASKS.dec(state='queued')
+            QUEUED_TASKS.dec()
+        return task
+
+    def _next_task(self) -> Optional[ScheduledTask]:
+        """在有空余配额的会话中选出下一个要启动的任务"""
+        best = None
+        for session_id, queue in list(self._queues.items()):
+            while queue and queue[0].cancelled:
+                heapq.heappop(queue)
+            if not queue:
+                del self._queues[session_id]
+                continue
+            if len(self._running.get(session_id, ())) >= self.max_per_session:
+                continue
+            if best is None or queue[0] < best:
+                best = queue[0]
+        return best
+
+    def _dispatch(self):
+        while self._running_total < self.max_running:
+            task = self._next_task()
+            if task is None:
+                return
+            heapq.heappop(self._queues[task.session_id])
+            self._dequeue(task.session_id, task.task_id)
+            self._running.setdefault(task.session_id, set()).add(task.task_id)
+            self._running_total += 1
+            RUNNING_TASKS.inc()
+            QUEUE_WAIT_SECONDS.observe(time.monotonic() - task.queued_at)
+            try:
+                self._start(task)
+            except Exception as e:
+                logger.error("Failed to start task %s: %s", task.task_id, e)
+                self._free_slot(task.session_id, task.task_id)
@@ -0,0 +1,250 @@
+import os
+import re
+import time
+from typing import List, Optional
+
+try:
+    import pyte
+    from pyte import graphics as _graphics
+    from wcwidth import wcwidth
+except ImportError:  # 可选依赖：没有pyte时屏幕模式不可用，任务退回普通输出流
+    pyte = None
+
+import metrics
+
+# 屏幕帧的最高发送频率（帧/秒）
+SCREEN_FPS = float(os.environ.get('PTY_SCREEN_FPS', '15'))
+# 距上次完整快照超过该时间（秒）时，下一帧发完整快照而不是差异
+SNAPSHOT_INTERVAL = 5.0
+# 跳过已滚出屏幕的输出时，往前最多回溯的SGR序列数
+SGR_LOOKBACK = 64
+
+# "简单"输出：可打印字符、\t \r \n、SGR颜色序列和不设置标题的OSC序列，不会改变光标行以外的终端状态。
+# UTF-8编码的C1控制字符(U+0080-U+009F)也可能被当作控制序列，一并排除
+_SIMPLE_PREFIX = re.compile(rb'(?:[^\x00-\x08\x0b\x0c\x0e-\x1f\x1b\xc2]+|\xc2[^\x80-\x9f]|\x1b\[[0-9;]*m'
+                            rb'|\x1b\](?![012];)[^\x07\x1b\xc2]*\x07)*')
+
+# 末尾未收全的转义序列或UTF-8字符，留到下一帧再解析，使每次解析都从初始状态开始
+_INCOMPLETE_TAIL = re.compile(rb'(?:\x1b(?:\[[0-9;?]*|\][^\x07\x1b]*)?'
+                              rb'|[\xc0-\xdf]|[\xe0-\xef][\x80-\xbf]?|[\xf0-\xf7][\x80-\xbf]{0,2})\Z')
+
+SCREEN_SKIPPED = metrics.REGISTRY.counter(
+    'screen_skipped_bytes_total', 'Output bytes that scrolled off screen and were never parsed by the screen model')
+
+if pyte is not None:
+    _FG_CODES = {name: code for table in (_graphics.FG_ANSI, _graphics.FG_AIXTERM)
+                 for code, name in table.items() if name != 'default'}
+    _BG_CODES = {name: code for table in (_graphics.BG_ANSI, _graphics.BG_AIXTERM)
+                 for code, name in table.items() if name != 'default'}
+
+
+def screen_available() -> bool:
+    """是否安装了pyte，可以使用屏幕模式"""
+    return pyte is not None
+
+
+def _color_sgr(color: str, names: dict, extended: int) -> Optional[str]:
+    if color == 'default':
+        return None
+    if color in names:
+        return str(names[color])
+    if len(color) == 6:
+        try:
+            return '%d;2;%d;%d;%d' % (extended, int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16))
+        except ValueError:
+            return None
+    return None
+
+
+def _sgr(char) -> str:
+    codes = ['0']
+    if char.bold:
+        codes.append('1')
+    if char.italics:
+        codes.append('3')
+    if char.underscore:
+        codes.append('4')
+    if char.blink:
+        codes.append('5')
+    if char.reverse:
+        codes.append('7')
+    if char.strikethrough:
+        codes.append('9')
+    fg = _color_sgr(char.fg, _FG_CODES, 38)
+    if fg:
+        codes.append(fg)
+    bg = _color_sgr(char.bg, _BG_CODES, 48)
+    if bg:
+        codes.append(bg)
+    return '\x1b[' + ';'.join(codes) + 'm'
+
+
+class ScreenModel:
+    """服务端VT屏幕模型：输出先在这里解析，只把屏幕的变化发给客户端
+
+    输出在render时才真正交给pyte解析；大段滚动输出中已经滚出屏幕的部分不会被解析，
+    只保留其中的颜色状态，所以解析开销与屏幕大小和帧率相关，而与输出量无关。
+    所有方法都在反应器线程中调用。
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self.screen = pyte.Screen(cols, rows)
+        self.stream = pyte.ByteStream(self.screen)
+        self._pending = bytearray()
+        self._force_snapshot = True
+        self._last_snapshot = 0.0
+        self._last_cursor = None
+
+    @property
+    def rows(self) -> int:
+        return self.screen.lines
+
+    @property
+    def cols(self) -> int:
+        return self.screen.columns
+
+    def feed(self, data: bytes):
+        """追加输出，等到render时再解析"""
+        self._pending += data
+
+    def resize(self, rows: int, cols: int):
+        self._apply_pending(True)
+        screen = self.screen
+        shrink = screen.lines - rows
+        cursor_y = screen.cursor.y
+        screen.resize(rows, cols)
+        # pyte缩小时删掉顶部的行却恢复了原来的光标行，光标要随内容一起上移
+        if shrink > 0:
+            screen.cursor.y = max(0, cursor_y - shrink)
+        screen.ensure_hbounds()
+        screen.ensure_vbounds()
+        self._force_snapshot = True
+
+    def invalidate(self):
+        """下一帧发送完整快照（客户端的屏幕可能已不一致，例如重连回放之后）"""
+        self._force_snapshot = True
+
+    def render(self, final: bool = False) -> Optional[dict]:
+        """生成一帧：自上一帧以来变化的行（或完整快照），没有变化时返回None
+
+        final为True时（任务或命令结束）不再保留末尾未收全的序列，全部解析。
+        """
+        self._apply_pending(final)
+        screen = self.screen
+        cursor = (screen.cursor.x, screen.cursor.y, screen.cursor.hidden)
+        snapshot = self._force_snapshot
+        if not snapshot and not screen.dirty and cursor == self._last_cursor:
+            return None
+        if not snapshot and time.monotonic() - self._last_snapshot >= SNAPSHOT_INTERVAL:
+            snapshot = True
+
+        rows = range(self.rows) if snapshot else sorted(y for y in screen.dirty if y < self.rows)
+        screen.dirty.clear()
+        self._force_snapshot = False
+        self._last_cursor = cursor
+        if snapshot:
+            self._last_snapshot = time.monotonic()
+
+        lines = [(y, self._render_line(y)) for y in rows]
+        # 客户端可以直接写入xterm的重绘序列
+        parts = ['\x1b[0m']
+        if snapshot:
+            parts.append('\x1b[H\x1b[2J')
+        for y, text in lines:
+            parts.append('\x1b[%d;1H%s\x1b[0m\x1b[K' % (y + 1, text))
+        parts.append('\x1b[%d;%dH' % (cursor[1] + 1, min(cursor[0], self.cols - 1) + 1))
+        parts.append('\x1b[?25l' if cursor[2] else '\x1b[?25h')
+
+        return {
+            'type': 'snapshot' if snapshot else 'diff',
+            'rows': self.rows,
+            'cols': self.cols,
+            'lines': lines,
+            'cursor': {'x': cursor[0], 'y': cursor[1], 'hidden': cursor[2]},
+            'output': ''.join(parts)
+        }
+
+    def _render_line(self, y: int) -> str:
+        line = self.screen.buffer[y]
+        default = self.screen.default_char
+        last = self.cols - 1
+        while last >= 0 and line[last] == default:
+            last -= 1
+        out: List[str] = []
+        current = None
+        wide = False
+        for x in range(last + 1):
+            char = line[x]
+            data = char.data
+            if not data:
+                if wide:
+                    wide = False
+                    continue  # 宽字符的第二格
+                data = ' '  # 宽字符前半被覆盖后留下的空格
+            attrs = char[1:]
+            if attrs != current:
+                out.append(_sgr(char))
+                current = attrs
+            out.append(data)
+            wide = wcwidth(data[0]) == 2
+        return ''.join(out)
+
+    def _apply_pending(self, final: bool = False):
+        if not self._pending:
+            return
+        data = bytes(self._pending)
+        self._pending.clear()
+        tail = None if final else _INCOMPLETE_TAIL.search(data, max(0, len(data) - 256))
+        if tail and tail.start() > 0:
+            self._pending += data[tail.start():]
+            data = data[:tail.start()]
+        self.stream.feed(self._skip_scrolled(data))
+
+    def _skip_scrolled(self, data: bytes) -> bytes:
+        """去掉一定会滚出屏幕的开头部分，只保留其颜色状态
+
+        只有解析器处于初始状态、没有设置滚动区域，并且开头这段全是简单输出时才跳过：
+        若简单输出在某个\\r\\n之前已有rows-1个换行（光标必然在最后一行行首）、之后还有
+        rows个换行，那么该点之前的内容全部会被滚出屏幕，对最终屏幕的唯一影响是当前SGR属性。
+        """
+        stream = self.stream
+        if (not stream._taking_plain_text or not stream.use_utf8
+                or stream.utf8_decoder.getstate()[0] or self.screen.margins is not None):
+            return data
+
+        simple_end = _SIMPLE_PREFIX.match(data).end()
+        # 从简单前缀的最后一个换行往前数rows+1个换行，切点落在第rows+1个换行之后
+        cut = data.rfind(b'\n', 0, simple_end)
+        for _ in range(self.rows):
+            if cut <= 0:
+                return data
+            cut = data.rfind(b'\n', 0, cut)
+        if cut < 1 or data[cut - 1:cut + 1] != b'\r\n':
+            return data
+        # 切点之前还要有rows-1个换行，保证原样解析时光标此刻已在最后一行
+        before = cut
+        for _ in range(self.rows - 1):
+            before = data.rfind(b'\n', 0, before)
+            if before < 0:
+                return data
+        cut += 1
+
+        # 切点处生效的SGR：往前收集到最近一次重置为止
+        sgr: List[bytes] = []
+        end = cut
+        while True:
+            esc = data.rfind(b'\x1b[', 0, end)
+            if esc < 0:
+                break
+            if len(sgr) >= SGR_LOOKBACK:
+                return data
+            seq = data[esc:data.index(b'm', esc) + 1]
+            sgr.append(seq)
+            params = seq[2:-1]
+            if params in (b'', b'0') or params.startswith(b'0;'):
+                break
+            end = esc
+
+        SCREEN_SKIPPED.inc(cut)
+        # 光标移到最后一行行首，随后的rows个换行会把旧内容全部滚出
+        return b''.join(reversed(sgr)) + b'\x1b[%d;1H' % self.rows + data[cut:]
@@ -0,0 +1,238 @@
+import os
+import sys
+import pickle
+import socket
+import struct
+import logging
+import itertools
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+from flask import request
+from flask_socketio import SocketIO
+
+import metrics
+from pty_handler import PtyTerminalHandler
+
+logger = logging.getLogger('PtyShard')
+
+# 工作进程数；0表示不分片，所有会话在当前进程中处理
+SHARD_WORKERS = int(os.environ.get('PTY_WORKERS', '0'))
+# 关闭时等待工作进程清理会话并退出的时间（秒）
+WORKER_EXIT_TIMEOUT = 5.0
+# 抓取/metrics时等待各工作进程返回指标快照的时间（秒）
+METRICS_TIMEOUT = 1.0
+
+# 由前端进程按sessionId转发给工作进程的事件
+ROUTED_EVENTS = ['terminal_connect', 'terminal_command', 'terminal_batch', 'terminal_input', 'terminal_resize',
+                 'terminal_ack', 'terminal_replay', 'terminal_interrupt', 'terminal_disconnect']
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pty_worker.py')
+
+_HEADER = struct.Struct('<I')
+
+WORKER_MESSAGES = metrics.REGISTRY.counter(
+    'shard_messages_total', 'Messages exchanged with PTY worker processes', ['direction'])
+
+
+class ShardChannel:
+    """前端进程与工作进程之间的消息通道
+
+    本地socketpair上的长度前缀pickle消息，两端都是本机受信任的进程；
+    发送可能来自多个绿色线程，用锁保证消息不交错。
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._reader = sock.makefile('rb', buffering=64 * 1024)
+        self._lock = threading.Lock()
+
+    def send(self, message: tuple):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self.sock.sendall(_HEADER.pack(len(data)) + data)
+
+    def recv(self) -> Optional[tuple]:
+        """读取一条消息，对端关闭时返回None"""
+        header = self._reader.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        size, = _HEADER.unpack(header)
+        data = self._reader.read(size)
+        if len(data) < size:
+            return None
+        return pickle.loads(data)
+
+    def close(self):
+        try:
+            self._reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ShardWorker:
+    """前端进程中对一个工作进程的记录"""
+
+    def __init__(self, index: int):
+        self.index = index
+        parent, child = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, str(child.fileno())],
+            pass_fds=[child.fileno()],
+            cwd=os.path.dirname(WORKER_SCRIPT)
+        )
+        child.close()
+        self.channel = ShardChannel(parent)
+        self.sessions = 0  # 分配到该进程的会话数
+        self.alive = True
+
+    def send(self, message: tuple):
+        self.channel.send(message)
+        WORKER_MESSAGES.inc(direction='to_worker')
+
+
+class ShardedTerminalHandler:
+    """多进程分片的PTY终端处理器
+
+    前端进程只负责Socket.IO连接：按sessionId把terminal_*事件转发到会话所在的工作进程，
+    并把工作进程发回的事件发送给对应房间。pty读取、输出合并、解码、回放和录像
+    都在工作进程中完成，多个会话的输出处理可以分散到多个CPU核心上。
+    """
+
+    terminal_type = 'pty'
+
+    def __init__(self, socketio: SocketIO, workers: int = SHARD_WORKERS):
+        self.features = PtyTerminalHandler.features + ['sharded']
+        self.socketio = socketio
+        self.workers: List[ShardWorker] = [ShardWorker(i) for i in range(max(1, workers))]
+        self.sessions: Dict[str, ShardWorker] = {}  # sessionId -> 所在工作进程
+        self._metrics_requests = itertools.count(1)
+        self._metrics_waiters: Dict[int, tuple] = {}  # 请求号 -> (完成事件, 收到的快照列表, 期望数量)
+        for worker in self.workers:
+            self.socketio.start_background_task(self._pump, worker)
+        for event in ROUTED_EVENTS:
+            self.socketio.on_event(event, self._make_router(event))
+
+        global sharded_terminal_handler
+        sharded_terminal_handler = self
+        logger.info("ShardedTerminalHandler started %d worker processes", len(self.workers))
+
+    def _make_router(self, event: str):
+        def route(data=None):
+            self._route(event, data)
+        return route
+
+    def _route(self, event: str, data):
+        session_id = data.get('sessionId') if isinstance(data, dict) else None
+        worker = self.sessions.get(session_id)
+        if worker is None:
+            alive = [w for w in self.workers if w.alive] or self.workers
+            if event == 'terminal_connect':
+                # 新会话分配给会话最少的工作进程
+                worker = min(alive, key=lambda w: w.sessions)
+            else:
+                # 未知会话由任一工作进程回复与单进程模式相同的错误
+                worker = alive[0]
+        elif event == 'terminal_disconnect':
+            self._forget_session(session_id)
+        try:
+            worker.send(('event', request.sid, event, data))
+        except OSError as e:
+            logger.error("Failed to forward %s to worker %d: %s", event, worker.index, e)
+
+    def _forget_session(self, session_id: str):
+        worker = self.sessions.pop(session_id, None)
+        if worker:
+            worker.sessions -= 1
+
+    def _pump(self, worker: ShardWorker):
+        """把工作进程发回的消息转为Socket.IO事件"""
+        while True:
+            try:
+                message = worker.channel.recv()
+            except (OSError, pickle.UnpicklingError) as e:
+                logger.error("Error reading from worker %d: %s", worker.index, e)
+                message = None
+            if message is None:
+                break
+            WORKER_MESSAGES.inc(direction='from_worker')
+            kind = message[0]
+            if kind == 'emit':
+                _, event, payload, to = message
+                self.socketio.emit(event, payload, to=to)
+            elif kind == 'join':
+                _, sid, room = message
+                self.socketio.server.enter_room(sid, room, namespace='/')
+                if room not in self.sessions:
+                    self.sessions[room] = worker
+                    worker.sessions += 1
+            elif kind == 'metrics':
+                _, token, snapshot = message
+                waiter = self._metrics_waiters.get(token)
+                if waiter:
+                    waiter[1].append(snapshot)
+                    if len(waiter[1]) >= waiter[2]:
+                        waiter[0].set()
+
+        worker.alive = False
+        for session_id in [s for s, w in self.sessions.items() if w is worker]:
+            self._forget_session(session_id)
+        if worker.process.poll() is None:
+            logger.error("Lost connection to worker %d", worker.index)
+        else:
+            logger.info("Worker %d exited with code %s", worker.index, worker.process.returncode)
+
+    def worker_metrics(self) -> List[dict]:
+        """收集各工作进程的指标快照，超时未返回的进程不计入"""
+        workers = [worker for worker in self.workers if worker.alive]
+        if not workers:
+            return []
+        token = next(self._metrics_requests)
+        done = threading.Event()
+        snapshots: List[dict] = []
+        self._metrics_waiters[token] = (done, snapshots, len(workers))
+        try:
+            for worker in workers:
+                worker.send(('metrics', token))
+            if not done.wait(METRICS_TIMEOUT):
+                logger.warning("Only %d of %d workers returned metrics", len(snapshots), len(workers))
+            return list(snapshots)
+        except OSError as e:
+            logger.error("Failed to request worker metrics: %s", e)
+            return list(snapshots)
+        finally:
+            del self._metrics_waiters[token]
+
+    def cleanup_all_sessions(self):
+        """通知所有工作进程清理会话并退出"""
+        for worker in self.workers:
+            if worker.alive:
+                try:
+                    worker.send(('shutdown',))
+                except OSError:
+                    pass
+        for worker in self.workers:
+            try:
+                worker.process.wait(WORKER_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.warning("Worker %d did not exit in time, killing it", worker.index)
+                worker.process.kill()
+                worker.process.wait()
+            worker.channel.close()
+        self.sessions.clear()
+        logger.info("All sharded pty sessions cleaned up")
+
+
+# 当前的分片处理器实例，供退出时清理
+sharded_terminal_handler: Optional[ShardedTerminalHandler] = None
+
+
+def cleanup_shard_workers():
+    if sharded_terminal_handler:
+        sharded_terminal_handler.cleanup_all_sessions()
+
+
+import atexit
+atexit.register(cleanup_shard_workers)
@@ -0,0 +1,178 @@
+import os
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    # /proc文件不会阻塞，直接用原生的os函数读取，省去eventlet绿色版本的开销
+    from eventlet import patcher as _patcher
+    _os = _patcher.original('os')
+except ImportError:
+    _os = os
+
+import metrics
+
+logger = logging.getLogger('PtyStats')
+
+# 资源采样间隔（秒），0表示关闭
+STATS_INTERVAL = float(os.environ.get('PTY_STATS_INTERVAL', '2.0'))
+# 一个采样时间片的上限（秒），超过后让出反应器，下一轮继续
+SLICE_SECONDS = 0.0005
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+SAMPLE_SECONDS = metrics.REGISTRY.histogram(
+    'stats_sample_seconds', 'Time the reactor spent in one /proc resource sampling slice',
+    [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05])
+
+
+def stats_available() -> bool:
+    return os.path.isdir('/proc/self/task')
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        fd = _os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return _os.read(fd, 4096)
+    except OSError:
+        return None
+    finally:
+        _os.close(fd)
+
+
+def _read_stat(pid: int) -> Optional[Tuple[int, int, int, int]]:
+    """读取/proc/<pid>/stat，返回(会话id, CPU时间(时钟滴答), RSS页数, 启动时间)"""
+    data = _read('/proc/%d/stat' % pid)
+    if not data:
+        return None
+    # 进程名可能包含空格和括号，从最后一个')'之后开始按空格切分
+    fields = data[data.rfind(b')') + 2:].split()
+    try:
+        return int(fields[3]), int(fields[11]) + int(fields[12]), int(fields[21]), int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def _read_io(pid: int) -> Tuple[int, int]:
+    """读取/proc/<pid>/io中的磁盘读写字节数；没有权限时返回0"""
+    data = _read('/proc/%d/io' % pid)
+    read_bytes = write_bytes = 0
+    if data:
+        for line in data.split(b'\n'):
+            if line.startswith(b'read_bytes:'):
+                read_bytes = int(line[11:])
+            elif line.startswith(b'write_bytes:'):
+                write_bytes = int(line[12:])
+    return read_bytes, write_bytes
+
+
+class ProcessSampler:
+    """按任务汇总进程资源占用
+
+    任务进程都以start_new_session启动，任务的所有子孙进程（包括作业控制创建的进程组）
+    与任务进程同属一个会话，会话id就是任务进程的pid。每次采样列一次/proc目录，
+    每个进程读一次stat得到会话id；io只在任务进程的CPU时间有变化时读取（没有占用CPU就不会发起I/O），
+    空闲的任务每次采样只需读一个文件。CPU和I/O速率按进程计算两次采样之间的增量，
+    中途退出的子进程不会使汇总值倒退。pid会被复用，进程以(pid, 启动时间)标识，
+    复用了旧pid的新进程不会继承旧进程的会话归属和增量基准。
+
+    一次采样可以分成多个时间片执行（begin后反复调用step），
+    任务很多时反应器在时间片之间照常处理终端I/O。
+    """
+
+    def __init__(self):
+        self._prev: Dict[Tuple[int, int], Tuple[int, int, int]] = {}  # (pid, 启动时间) -> (CPU滴答, 读字节, 写字节)
+        self._last_time: Optional[float] = None
+        # 进行中的采样
+        self._pids: List[int] = []
+        self._index = 0
+        self._leaders: Dict[int, dict] = {}
+        self._current: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        self._elapsed: Optional[float] = None
+        self._now = 0.0
+
+    def reset(self):
+        """没有任务时丢弃上次采样，下个任务的速率从它自己的第一次采样开始计算"""
+        self._prev = {}
+        self._last_time = None
+
+    def sample(self, leaders: Iterable[int]) -> Dict[int, dict]:
+        """一次完成整个采样，返回{任务进程pid: {cpu, rss, read, write, procs}}"""
+        self.begin(leaders)
+        results = None
+        while results is None:
+            results = self.step(None)
+        return results
+
+    def begin(self, leaders: Iterable[int]):
+        """开始一次采样：列出/proc中的进程"""
+        self._now = time.monotonic()
+        self._elapsed = self._now - self._last_time if self._last_time is not None else None
+        self._leaders = {leader: {'cpu': 0.0, 'rss': 0, 'read': 0, 'write': 0, 'procs': 0} for leader in leaders}
+        self._current = {}
+        self._index = 0
+        try:
+            self._pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+        except OSError as e:
+            logger.error("Failed to list /proc: %s", e)
+            self._pids = []
+
+    def step(self, budget: Optional[float] = SLICE_SECONDS) -> Optional[Dict[int, dict]]:
+        """继续采样至多budget秒（None表示不限），完成时返回结果，否则返回None
+
+        cpu为百分比（单核100%），rss为字节，read/write为每秒字节数。
+        """
+        started = time.perf_counter()
+        deadline = started + budget if budget is not None else None
+        pids, leaders, prev_map, current = self._pids, self._leaders, self._prev, self._current
+        elapsed = self._elapsed
+        index, count = self._index, len(pids)
+        first = index
+        while index < count:
+            # 每16个进程检查一次时间片，每片至少前进一批
+            if deadline is not None and not index & 15 and index != first and time.perf_counter() > deadline:
+                break
+            pid = pids[index]
+            index += 1
+            stat = _read_stat(pid)
+            if stat is None:
+                continue
+            sid, ticks, rss_pages, start = stat
+            entry = leaders.get(sid)
+            if entry is None:
+                continue
+            key = (pid, start)
+            prev = prev_map.get(key)
+            if prev is None or prev[0] != ticks:
+                read_bytes, write_bytes = _read_io(pid)
+            else:
+                read_bytes, write_bytes = prev[1], prev[2]
+            current[key] = (ticks, read_bytes, write_bytes)
+            entry['procs'] += 1
+            entry['rss'] += rss_pages * _PAGE_SIZE
+            if elapsed:
+                # 新出现的进程在上次采样之后才启动，全部计入本次增量
+                prev = prev or (0, 0, 0)
+                entry['cpu'] += max(0, ticks - prev[0])
+                entry['read'] += max(0, read_bytes - prev[1])
+                entry['write'] += max(0, write_bytes - prev[2])
+        self._index = index
+        if index < count:
+            SAMPLE_SECONDS.observe(time.perf_counter() - started)
+            return None
+
+        if elapsed:
+            for entry in leaders.values():
+                entry['cpu'] = round(entry['cpu'] * 100.0 / _CLOCK_TICKS / elapsed, 1)
+                entry['read'] = int(entry['read'] / elapsed)
+                entry['write'] = int(entry['write'] / elapsed)
+
+        self._prev = current
+        self._last_time = self._now
+        self._pids, self._leaders, self._current = [], {}, {}
+        SAMPLE_SECONDS.observe(time.perf_counter() - started)
+        return leaders
@@ -0,0 +1,80 @@
+import eventlet
+eventlet.monkey_patch()
+import sys
+import socket
+import logging
+import threading
+from typing import Optional
+
+import metrics
+from pty_handler import PtyTerminalHandler
+from pty_shard import ShardChannel
+
+logger = logging.getLogger('PtyWorker')
+
+# 当前事件来自哪个Socket.IO客户端（每个事件在自己的绿色线程中处理）
+_current = threading.local()
+
+
+class WorkerSocketIO:
+    """工作进程中代替SocketIO：收集事件处理器，emit经通道交给前端进程发送"""
+
+    def __init__(self, channel: ShardChannel):
+        self.channel = channel
+        self.handlers = {}
+
+    def on(self, event: str, namespace: Optional[str] = None):
+        def decorator(handler):
+            self.handlers[event] = handler
+            return handler
+        return decorator
+
+    def emit(self, event: str, payload: dict, to: Optional[str] = None, **kwargs):
+        self.channel.send(('emit', event, payload, to))
+
+
+class WorkerTerminalHandler(PtyTerminalHandler):
+    """工作进程中的PTY终端处理器：回复和加入房间都交给前端进程执行"""
+
+    def _reply(self, event: str, payload: dict, to: Optional[str] = None):
+        self.socketio.emit(event, payload, to=to or _current.sid)
+
+    def _join(self, room: str):
+        self.socketio.channel.send(('join', _current.sid, room))
+
+    def dispatch(self, sid: str, event: str, data):
+        _current.sid = sid
+        handler = self.socketio.handlers.get(event)
+        if handler is None:
+            logger.warning("No handler for event %s", event)
+            return
+        try:
+            handler(data)
+        except Exception as e:
+            logger.error("Error handling %s: %s", event, e)
+
+
+def main():
+    channel = ShardChannel(socket.socket(fileno=int(sys.argv[1])))
+    handler = WorkerTerminalHandler(WorkerSocketIO(channel))
+    logger.info("PTY worker started")
+
+    while True:
+        message = channel.recv()
+        if message is None or message[0] == 'shutdown':
+            break
+        if message[0] == 'metrics':
+            # 前端进程汇总各工作进程的指标
+            channel.send(('metrics', message[1], metrics.REGISTRY.snapshot()))
+            continue
+        _, sid, event, data = message
+        # 与Socket.IO服务器一样，每个事件在独立的绿色线程中处理
+        eventlet.spawn_n(handler.dispatch, sid, event, data)
+
+    handler.cleanup_all_sessions()
+    channel.close()
+    logger.info("PTY worker stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,11 @@ import subprocess
 import threading
 import uuid
 import os
-import time
 import signal
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from typing import Dict, Optional, List
 import logging
+from process_utils import terminate_process_groups
 
 # 配置日志 - Windows 兼容
 logging.basicConfig(
@@ -23,6 +23,10 @@ class TerminalSession:
         self.running_tasks: Dict[str, bool] = {}  # taskId -> is_running
         logger.debug("Created terminal session: %s", session_id)
     
+    def _emit(self, event: str, payload: dict):
+        """只向加入了本会话房间的客户端发送事件"""
+        self.socketio.emit(event, payload, to=self.session_id)
+    
     def execute_command(self, task_id: str, command: str):
         """执行命令并实时输出 - 支持多任务"""
         try:
@@ -68,7 +72,7 @@ class TerminalSession:
             
         except Exception as e:
             logger.error("Failed to execute command: %s", e)
-            self.socketio.emit('terminal_error', {
+            self._emit('terminal_error', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'error': 'Failed to start command: ' + str(e)
@@ -83,37 +87,34 @@ class TerminalSession:
             if not process or not process.stdout:
                 return
             
-            # 逐行读取输出
+            # 逐行读取输出，直到子进程关闭stdout（EOF）
             while True:
                 line = process.stdout.readline()
                 if not line:
-                    if process.poll() is not None:
-                        break
-                    time.sleep(0.1)
-                    continue
+                    break
                 
                 logger.debug("Output from task %s: %s", task_id, line.strip())
                 # 确保每行输出都包含换行符
                 output_line = line.rstrip('\r\n') + '\n'
-                self.socketio.emit('terminal_output', {
+                self._emit('terminal_output', {
                     'sessionId': self.session_id,
                     'taskId': task_id,
                     'output': output_line,
                     'type': 'stdout'
                 })
         
-            # 发送完成信号
-            return_code = process.poll() if process else -1
+            # 发送完成信号：EOF后直接等待进程退出，不再轮询
+            return_code = process.wait() if process else -1
             logger.debug("Task %s completed with return code: %s", task_id, return_code)
             
-            self.socketio.emit('terminal_complete', {
+            self._emit('terminal_complete', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'exitCode': return_code
                 # 移除message，不在终端中显示退出码
             })
             
-            self.socketio.emit('terminal_status', {
+            self._emit('terminal_status', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'status': 'idle'
@@ -121,7 +122,7 @@ class TerminalSession:
             
         except Exception as e:
             logger.error("Error in output reading thread for task %s: %s", task_id, e)
-            self.socketio.emit('terminal_error', {
+            self._emit('terminal_error', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'error': 'Output reading failed: ' + str(e)
@@ -180,21 +181,21 @@ class TerminalSession:
             self.running_tasks[task_id] = False
             
             # 发送中断通知
-            self.socketio.emit('terminal_output', {
+            self._emit('terminal_output', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'output': '\n^C (interrupted)\n',
                 'type': 'system'
             })
             
-            self.socketio.emit('terminal_complete', {
+            self._emit('terminal_complete', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'exitCode': -2  # 中断退出码
                 # 移除message，不在终端中显示中断信息
             })
             
-            self.socketio.emit('terminal_status', {
+            self._emit('terminal_status', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'status': 'idle'
@@ -205,41 +206,27 @@ class TerminalSession:
             
         except Exception as e:
             logger.error("Failed to interrupt task %s: %s", task_id, e)
-            self.socketio.emit('terminal_error', {
+            self._emit('terminal_error', {
                 'sessionId': self.session_id,
                 'taskId': task_id,
                 'error': 'Failed to interrupt command: ' + str(e)
             })
             return False
     
-    def cleanup(self):
-        """清理资源 - 支持多任务版本"""
+    def live_processes(self) -> List[subprocess.Popen]:
+        """仍在运行的任务进程"""
+        return [process for process in list(self.processes.values()) if process.poll() is None]
+    
+    def cleanup(self, terminate: bool = True):
+        """清理资源 - 支持多任务版本
+
+        terminate为False时表示进程已由调用方统一终止，这里只清理状态。
+        """
         logger.debug("Cleaning up session: %s", self.session_id)
         
-        # 清理所有进程
-        for task_id, process in list(self.processes.items()):
-            if process.poll() is None:
-                try:
-                    if os.name == 'nt':  # Windows
-                        process.terminate()
-                        try:
-                            process.wait(timeout=2)
-                        except subprocess.TimeoutExpired:
-                            process.kill()
-                            process.wait()
-                    else:  # Unix/Linux
-                        # 终止整个进程组
-                        try:
-                            os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                            process.wait(timeout=2)
-                        except (subprocess.TimeoutExpired, ProcessLookupError):
-                            try:
-                                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                                process.wait()
-                            except ProcessLookupError:
-                                pass  # 进程已经退出
-                except Exception as e:
-                    logger.error("Error cleaning up process for task %s: %s", task_id, e)
+        # 所有进程组同时终止，统一期限内回收
+        if terminate:
+            terminate_process_groups(self.live_processes())
         
         # 清理状态
         self.processes.clear()
@@ -261,10 +248,16 @@ class TerminalSession:
             return 'completed'
 
 class TerminalHandler:
+    terminal_type = 'basic'
+    features = ['basic', 'multi_task']
+    
     def __init__(self, socketio: SocketIO):
         self.socketio = socketio
         self.sessions: Dict[str, TerminalSession] = {}
         self.register_handlers()
+        
+        global terminal_handler
+        terminal_handler = self
         logger.info("TerminalHandler initialized")
     
     def register_handlers(self):
@@ -283,6 +276,8 @@ class TerminalHandler:
             logger.debug("Received terminal_connect event: %s", data)
             session_id = str(uuid.uuid4())
             self.sessions[session_id] = TerminalSession(session_id, self.socketio)
+            # 会话事件只发往该房间，避免广播给所有客户端
+            join_room(session_id)
             
             logger.debug("Emitting terminal_connected for session: %s", session_id)
             emit('terminal_connected', {
@@ -430,16 +425,21 @@ class TerminalHandler:
                 logger.info("Terminal session terminated: %s", session_id)
     
     def cleanup_all_sessions(self):
-        """清理所有会话"""
-        for session_id, session in list(self.sessions.items()):
-            session.cleanup()
-            del self.sessions[session_id]
+        """清理所有会话：所有会话的进程一起终止，总耗时与任务数量无关"""
+        sessions = list(self.sessions.items())
+        terminate_process_groups([process for _, session in sessions for process in session.live_processes()])
+        
+        for session_id, session in sessions:
+            session.cleanup(terminate=False)
+            self.sessions.pop(session_id, None)
         logger.info("All terminal sessions cleaned up")
 
+# 当前的处理器实例，供退出时清理
+terminal_handler: Optional[TerminalHandler] = None
+
 # 全局清理函数
 def cleanup_terminals():
     """清理所有终端会话"""
-    global terminal_handler
     if terminal_handler:
         terminal_handler.cleanup_all_sessions()
         logger.info("All terminal sessions cleaned up")
@@ -0,0 +1,194 @@
+"""
+基准测试公共工具 - 在本地启动 backend/app.py 并用无界面的 Socket.IO 客户端驱动终端事件
+
+依赖 python-socketio 客户端: pip install "python-socketio[client]"
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import socketio
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def free_port() -> int:
+    """获取一个空闲的本地端口"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """简单的百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class BackendServer:
+    """以子进程方式启动后端，用作with上下文"""
+
+    def __init__(self, port: Optional[int] = None, env: Optional[Dict[str, str]] = None, script: str = 'app.py'):
+        self.port = port or free_port()
+        self.script = script  # app.py（eventlet）或asgi_app.py（asyncio）
+        self.env = dict(os.environ, **(env or {}))
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def start(self, timeout: float = 15.0):
+        self.process = subprocess.Popen(
+            [sys.executable, self.script, str(self.port)],
+            cwd=BACKEND_DIR,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 0.2).close()
+                return self
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError('backend exited with code %s' % self.process.returncode)
+                time.sleep(0.1)
+        raise RuntimeError('backend did not start within %.0fs' % timeout)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def cpu_seconds(self) -> float:
+        """后端进程累计CPU时间（utime+stime，仅Linux）"""
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+    def rss_bytes(self) -> int:
+        """后端进程常驻内存（仅Linux）"""
+        with open(f'/proc/{self.pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def peak_rss_bytes(self) -> int:
+        """后端进程启动以来的常驻内存峰值（仅Linux）"""
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class TerminalClient:
+    """无界面终端客户端：统计收到的帧并等待任务结束"""
+
+    def __init__(self, url: str, options: Optional[dict] = None):
+        self.url = url
+        self.options = options or {}
+        self.sio = socketio.Client()
+        self.session_id: Optional[str] = None
+        self.frames = 0
+        self.bytes = 0
+        self.other_session_frames = 0  # 收到的不属于本会话的帧（广播泄漏）
+        self.completed: Dict[str, int] = {}
+        self.output_listeners = []
+        self._connected = threading.Event()
+        self._complete = threading.Condition()
+
+        self.sio.on('terminal_connected', self._on_connected)
+        self.sio.on('terminal_output', self._on_output)
+        self.sio.on('terminal_screen', self._on_output)  # 屏幕模式的帧按同样方式统计
+        self.sio.on('terminal_complete', self._on_complete)
+
+    def connect(self, timeout: float = 10.0) -> 'TerminalClient':
+        self.sio.connect(self.url, transports=['websocket'])
+        self.sio.emit('terminal_connect', self.options)
+        if not self._connected.wait(timeout):
+            raise RuntimeError('no terminal_connected from backend')
+        return self
+
+    def disconnect(self):
+        if self.session_id:
+            self.sio.emit('terminal_disconnect', {'sessionId': self.session_id})
+        self.sio.disconnect()
+
+    def run(self, task_id: str, command: str, rows: int = 24, cols: int = 80, **extra):
+        self.sio.emit('terminal_command', dict({
+            'sessionId': self.session_id,
+            'taskId': task_id,
+            'command': command,
+            'rows': rows,
+            'cols': cols
+        }, **extra))
+
+    def send_input(self, task_id: str, data: str):
+        self.sio.emit('terminal_input', {
+            'sessionId': self.session_id,
+            'taskId': task_id,
+            'data': data
+        })
+
+    def interrupt(self, task_id: str):
+        self.sio.emit('terminal_interrupt', {'sessionId': self.session_id, 'taskId': task_id})
+
+    def wait_complete(self, task_id: str, timeout: float = 600.0) -> Optional[int]:
+        deadline = time.time() + timeout
+        with self._complete:
+            while task_id not in self.completed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._complete.wait(remaining)
+            return self.completed[task_id]
+
+    def _on_connected(self, data):
+        self.session_id = data['sessionId']
+        self._connected.set()
+
+    def _on_output(self, data):
+        if data.get('sessionId') != self.session_id:
+            self.other_session_frames += 1
+            return
+        chunk = data.get('data') if data.get('data') is not None else data.get('output', '')
+        self.frames += 1
+        self.bytes += len(chunk)
+        for listener in self.output_listeners:
+            listener(data, chunk)
+        if 'end' in data and self.options.get('flowControl') and self.sio.connected:
+            self.sio.emit('terminal_ack', {
+                'sessionId': self.session_id,
+                'taskId': data['taskId'],
+                'offset': data['end']
+            })
+
+    def _on_complete(self, data):
+        if data.get('sessionId') != self.session_id:
+            return
+        with self._complete:
+            self.completed[data['taskId']] = data.get('exitCode')
+            self._complete.notify_all()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+在管道数据流中按固定间隔插入时间戳，供吞吐基准测量帧延迟
+
+时间戳以 OSC 777;qdbench;<unix时间> BEL 的形式插在换行之后，终端不会显示，
+也不会截断其他转义序列。
+
+用法: <generator> | python3 _stamp.py [间隔字节数]
+"""
+
+import os
+import sys
+import time
+
+STAMP = b'\x1b]777;qdbench;%.6f\x07'
+
+
+def main():
+    interval = int(sys.argv[1]) if len(sys.argv) > 1 else 64 * 1024
+    since_stamp = 0
+    while True:
+        chunk = os.read(0, 64 * 1024)
+        if not chunk:
+            break
+        since_stamp += len(chunk)
+        if since_stamp >= interval:
+            cut = chunk.rfind(b'\n') + 1
+            if cut:
+                chunk = chunk[:cut] + STAMP % time.time() + chunk[cut:]
+                since_stamp = len(chunk) - cut
+        view = memoryview(chunk)
+        while view:
+            written = os.write(1, view)
+            view = view[written:]
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+按键回显往返延迟基准 - 经真实的Socket.IO处理器驱动PTY中的cat，逐个发送按键
+
+回路: terminal_input -> write_to_terminal -> pty -> cat -> pty输出 -> terminal_output
+cat运行在 `stty -icanon -echo` 下，每个按键都由进程读出再写回，和shell行编辑的回显路径一致。
+
+分别在空闲和同一会话中有大输出任务并发时测量，报告回显延迟的分布。
+
+用法: python benchmarks/bench_echo.py [--keys 200] [--rate 20] [--load-bytes 0] [--flow-control] [--asgi]
+"""
+
+import argparse
+import string
+import threading
+import time
+
+from _harness import BackendServer, TerminalClient, percentile
+
+KEYS = string.ascii_letters + string.digits
+
+
+def measure(client: TerminalClient, keys: int, rate: float) -> list:
+    """逐个发送按键，返回每个按键的回显延迟（秒）"""
+    sent_at = []
+    latencies = []
+    received = [0]
+    done = threading.Event()
+
+    def on_output(data, chunk):
+        if data.get('taskId') != 'echo':
+            return
+        now = time.perf_counter()
+        for _ in range(len(chunk)):
+            index = received[0]
+            if index < len(sent_at):
+                latencies.append(now - sent_at[index])
+            received[0] += 1
+        if received[0] >= keys:
+            done.set()
+
+    client.output_listeners.append(on_output)
+    interval = 1.0 / rate
+    next_send = time.perf_counter()
+    for i in range(keys):
+        next_send += interval
+        sent_at.append(time.perf_counter())
+        client.send_input('echo', KEYS[i % len(KEYS)])
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    done.wait(10)
+    client.output_listeners.remove(on_output)
+    return latencies
+
+
+def run_case(label: str, keys: int, rate: float, load_bytes: int, options: dict, script: str) -> dict:
+    with BackendServer(script=script) as server:
+        client = TerminalClient(server.url, options).connect()
+        try:
+            client.run('echo', 'stty -icanon -echo; cat')
+            time.sleep(0.5)
+            if load_bytes:
+                client.run('bulk', f'yes {"x" * 100} | head -c {load_bytes}', cols=200)
+                time.sleep(0.3)
+            latencies = measure(client, keys, rate)
+            bulk_done = client.wait_complete('bulk', 0) is not None if load_bytes else None
+        finally:
+            client.disconnect()
+
+    return {
+        'case': label,
+        'keys': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies, default=0) * 1000,
+        'load_finished_early': bulk_done,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=200, help='每种情况发送的按键数')
+    parser.add_argument('--rate', type=float, default=20.0, help='每秒按键数')
+    parser.add_argument('--load-bytes', type=int, default=2_000_000_000,
+                        help='并发大输出任务的字节数，0表示只测空闲情况')
+    parser.add_argument('--flow-control', action='store_true', help='启用流控并由客户端确认输出')
+    parser.add_argument('--asgi', action='store_true', help='测试asyncio/ASGI模式的后端（asgi_app.py）')
+    args = parser.parse_args()
+
+    options = {'flowControl': args.flow_control}
+    cases = [('idle', 0)]
+    if args.load_bytes:
+        cases.append(('bulk load', args.load_bytes))
+
+    print(f"{'case':>10} {'keys':>5} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, load_bytes in cases:
+        r = run_case(label, args.keys, args.rate, load_bytes, options,
+                     'asgi_app.py' if args.asgi else 'app.py')
+        print(f"{r['case']:>10} {r['keys']:>5} {r['p50_ms']:>8.1f} {r['p90_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+        if r['load_finished_early']:
+            print('           (bulk task finished before the last keystroke; raise --load-bytes)')
+
+
+if __name__ == '__main__':
+    main()
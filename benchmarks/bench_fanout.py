@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Socket.IO 扇出开销基准 - 一个会话产生大量输出，其余客户端各自持有空闲会话
+
+统计每种客户端数量下：
+  - 输出会话的吞吐和后端CPU时间
+  - 其他客户端收到的、不属于自己会话的帧数（按会话房间定向发送后应为0）
+
+用法: python benchmarks/bench_fanout.py [--clients 1,2,4,8] [--bytes 20000000]
+"""
+
+import argparse
+import time
+
+from _harness import BackendServer, TerminalClient
+
+
+def run_case(clients: int, total_bytes: int) -> dict:
+    with BackendServer() as server:
+        terminals = [TerminalClient(server.url).connect() for _ in range(clients)]
+        producer = terminals[0]
+        try:
+            cpu_before = server.cpu_seconds()
+            started = time.perf_counter()
+            producer.run('bulk', f'head -c {total_bytes} /dev/zero | tr "\\0" "x" | fold -w 120')
+            exit_code = producer.wait_complete('bulk')
+            elapsed = time.perf_counter() - started
+            cpu = server.cpu_seconds() - cpu_before
+            # 给其余客户端留一点时间接收尚在途中的帧
+            time.sleep(0.5)
+            leaked = sum(t.other_session_frames for t in terminals)
+        finally:
+            for terminal in terminals:
+                terminal.disconnect()
+
+    return {
+        'clients': clients,
+        'exit': exit_code,
+        'mb_s': producer.bytes / elapsed / 1e6,
+        'frames': producer.frames,
+        'cpu_s': cpu,
+        'cpu_per_frame_us': cpu / max(1, producer.frames) * 1e6,
+        'leaked_frames': leaked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', default='1,2,4,8', help='逗号分隔的客户端数量')
+    parser.add_argument('--bytes', type=int, default=20_000_000, help='输出会话产生的字节数')
+    args = parser.parse_args()
+
+    print(f"{'clients':>7} {'MB/s':>8} {'frames':>8} {'cpu s':>7} {'cpu/frame us':>13} {'leaked frames':>14}")
+    for clients in [int(c) for c in args.clients.split(',')]:
+        r = run_case(clients, args.bytes)
+        print(f"{r['clients']:>7} {r['mb_s']:>8.2f} {r['frames']:>8} {r['cpu_s']:>7.2f} "
+              f"{r['cpu_per_frame_us']:>13.1f} {r['leaked_frames']:>14}")
+
+
+if __name__ == '__main__':
+    main()
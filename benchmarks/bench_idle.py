@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+空闲任务规模基准 - 先打开N个不产生输出的任务（sleep），再运行一个大输出任务
+
+反应器的每次事件分发都不应随打开的任务数增长：N从0增加到几百时，
+大输出任务的耗时和后端CPU时间应基本不变。
+
+用法: python benchmarks/bench_idle.py [--idle 0,100,300] [--bytes 3000000] [--asgi] [--json]
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+import urllib.request
+
+from _harness import BackendServer, TerminalClient
+
+RUNNING = re.compile(r'^quickdemo_terminal_tasks\{state="running"\} ([0-9.]+)$', re.M)
+
+
+def running_tasks(url: str) -> int:
+    text = urllib.request.urlopen(url + '/metrics').read().decode()
+    match = RUNNING.search(text)
+    return int(float(match.group(1))) if match else 0
+
+
+def run_case(idle: int, total_bytes: int, script: str = 'app.py') -> dict:
+    # 调度器上限放开，空闲任务全部立即运行
+    env = {'PTY_MAX_RUNNING': str(idle + 16), 'PTY_MAX_RUNNING_PER_SESSION': str(idle + 16)}
+    with BackendServer(env=env, script=script) as server:
+        client = TerminalClient(server.url).connect()
+        try:
+            if idle:
+                client.sio.emit('terminal_batch', {
+                    'sessionId': client.session_id,
+                    'commands': [{'taskId': f'idle-{i}', 'command': 'sleep 300'} for i in range(idle)]
+                })
+                deadline = time.time() + 60
+                while running_tasks(server.url) < idle and time.time() < deadline:
+                    time.sleep(0.2)
+                time.sleep(1.0)  # 等启动阶段的CPU开销过去
+
+            cpu_before = server.cpu_seconds()
+            started = time.perf_counter()
+            client.run('bulk', f'head -c {total_bytes * 3 // 4} /dev/urandom | base64')
+            exit_code = client.wait_complete('bulk')
+            elapsed = time.perf_counter() - started
+            cpu = server.cpu_seconds() - cpu_before
+        finally:
+            client.disconnect()
+
+    return {
+        'idle': idle,
+        'exit': exit_code,
+        'bytes': client.bytes,
+        'seconds': elapsed,
+        'mb_s': client.bytes / elapsed / 1e6,
+        'cpu_s': cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--idle', default='0,100,300', help='逗号分隔的空闲任务数')
+    parser.add_argument('--bytes', type=int, default=3_000_000, help='大输出任务产生的字节数')
+    parser.add_argument('--asgi', action='store_true', help='测试asyncio/ASGI模式的后端（asgi_app.py）')
+    parser.add_argument('--json', action='store_true', help='以JSON行输出结果，便于比较')
+    args = parser.parse_args()
+
+    script = 'asgi_app.py' if args.asgi else 'app.py'
+    if not args.json:
+        print(f"{'idle':>6} {'seconds':>8} {'MB/s':>8} {'cpu s':>7} {'exit':>5}")
+    for idle in (int(n) for n in args.idle.split(',')):
+        r = run_case(idle, args.bytes, script)
+        if args.json:
+            print(json.dumps(r))
+        else:
+            print(f"{r['idle']:>6} {r['seconds']:>8.2f} {r['mb_s']:>8.2f} {r['cpu_s']:>7.2f} {r['exit']:>5}")
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
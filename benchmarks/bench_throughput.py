@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+端到端输出吞吐基准 - 在PTY中运行大输出量的生成器，经Socket.IO传到无界面客户端
+
+负载:
+  yes     - `yes` 的短行输出
+  base64  - `/dev/urandom | base64`，76列的长行
+  ansi    - 每行都带256色/粗体转义序列的彩色输出
+  progress - 只用回车重绘同一行的进度条（pip/wget/tqdm式），默认不在列表中
+
+每种负载统计 MB/s、frames/s、帧延迟p50/p99（生成器写出到客户端收到）、
+后端CPU时间和常驻内存峰值。帧延迟依靠 _stamp.py 在数据流中插入的时间戳。
+--screen 使用服务端屏幕模型模式，此时统计的是屏幕帧（时间戳不会出现在屏幕上，没有帧延迟）。
+
+用法: python benchmarks/bench_throughput.py [--workloads yes,base64,ansi] [--bytes 50000000]
+                                           [--binary] [--flow-control] [--screen] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from _harness import BackendServer, TerminalClient, percentile
+
+STAMPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_stamp.py')
+STAMP_PATTERN = re.compile(r'\x1b\]777;qdbench;([0-9.]+)\x07')
+STAMP_PATTERN_BYTES = re.compile(rb'\x1b\]777;qdbench;([0-9.]+)\x07')
+
+# ansi负载每行约60字节，progress负载每次重绘约30字节
+ANSI_LINE_BYTES = 60
+PROGRESS_REDRAW_BYTES = 30
+
+WORKLOADS = {
+    'yes': lambda n: f'yes | head -c {n}',
+    'base64': lambda n: f'head -c {n * 3 // 4} /dev/urandom | base64',
+    'ansi': lambda n: (
+        "awk 'BEGIN { for (i = 0; i < %d; i++) "
+        "printf \"\\033[38;5;%%dm%%08d \\033[1mbold\\033[22m \\033[48;5;%%dmbg\\033[0m plain text\\n\", "
+        "i %% 256, i, (i * 7) %% 256 }'" % (n // ANSI_LINE_BYTES)
+    ),
+    'progress': lambda n: (
+        "awk 'BEGIN { n = %d; for (i = 1; i <= n; i++) "
+        "printf \"\\r\\033[32m%%3d%%%%\\033[0m %%010d/%%010d\", i * 100 / n, i, n; print \"\" }'"
+        % (n // PROGRESS_REDRAW_BYTES)
+    ),
+}
+
+
+def run_workload(name: str, total_bytes: int, options: dict, screen: bool = False) -> dict:
+    command = f'{WORKLOADS[name](total_bytes)} | {sys.executable} {STAMPER}'
+    with BackendServer() as server:
+        client = TerminalClient(server.url, options).connect()
+        latencies = []
+
+        def on_output(data, chunk):
+            received = time.time()
+            pattern = STAMP_PATTERN_BYTES if isinstance(chunk, bytes) else STAMP_PATTERN
+            for match in pattern.finditer(chunk):
+                latencies.append(received - float(match.group(1)))
+
+        client.output_listeners.append(on_output)
+        try:
+            cpu_before = server.cpu_seconds()
+            started = time.perf_counter()
+            client.run(name, command, rows=50, cols=200, screen=screen)
+            exit_code = client.wait_complete(name)
+            elapsed = time.perf_counter() - started
+            cpu = server.cpu_seconds() - cpu_before
+            peak_rss = server.peak_rss_bytes()
+        finally:
+            client.disconnect()
+
+    return {
+        'workload': name,
+        'exit': exit_code,
+        'bytes': client.bytes,
+        'seconds': elapsed,
+        'mb_s': client.bytes / elapsed / 1e6,
+        'frames': client.frames,
+        'frames_s': client.frames / elapsed,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+        'cpu_s': cpu,
+        'peak_rss_mb': peak_rss / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workloads', default='yes,base64,ansi', help='逗号分隔的负载名')
+    parser.add_argument('--bytes', type=int, default=50_000_000, help='每种负载大约产生的字节数')
+    parser.add_argument('--binary', action='store_true', help='使用二进制输出会话')
+    parser.add_argument('--flow-control', action='store_true', help='启用流控并由客户端确认输出')
+    parser.add_argument('--screen', action='store_true', help='使用服务端屏幕模型，只接收屏幕差异')
+    parser.add_argument('--json', action='store_true', help='以JSON行输出结果，便于比较')
+    args = parser.parse_args()
+
+    options = {'binary': args.binary, 'flowControl': args.flow_control}
+    if not args.json:
+        print(f"{'workload':>8} {'MB/s':>8} {'frames/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'cpu s':>7} {'rss MB':>7} {'exit':>5}")
+    for name in args.workloads.split(','):
+        r = run_workload(name, args.bytes, options, args.screen)
+        if args.json:
+            print(json.dumps(r))
+        else:
+            print(f"{r['workload']:>8} {r['mb_s']:>8.2f} {r['frames_s']:>9.1f} {r['latency_p50_ms']:>8.1f} "
+                  f"{r['latency_p99_ms']:>8.1f} {r['cpu_s']:>7.2f} {r['peak_rss_mb']:>7.1f} {r['exit']:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import { useApiConfigStore } from '@/stores/apiConfigStore'
+
+// 文件传输：走后端的 /files 接口，文件内容不经过终端输出
+// 下载用Range续传，上传按偏移分块PUT（每块带crc32），最后提交时校验sha256
+
+const UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+
+export interface TransferProgress {
+  transferred: number
+  total: number
+}
+
+const CRC_TABLE = (() => {
+  const table = new Uint32Array(256)
+  for (let n = 0; n < 256; n++) {
+    let c = n
+    for (let k = 0; k < 8; k++) {
+      c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1
+    }
+    table[n] = c >>> 0
+  }
+  return table
+})()
+
+export function crc32(data: Uint8Array): number {
+  let crc = 0xffffffff
+  for (let i = 0; i < data.length; i++) {
+    crc = CRC_TABLE[(crc ^ data[i]) & 0xff] ^ (crc >>> 8)
+  }
+  return (crc ^ 0xffffffff) >>> 0
+}
+
+export async function sha256Hex(data: Uint8Array): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', data)
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('')
+}
+
+class FileTransferServiceImpl {
+  private store = useApiConfigStore()
+
+  get baseURL(): string {
+    return this.store.apiBaseUrl
+  }
+
+  private url(endpoint: string, params: Record<string, string | number>): string {
+    const query = Object.entries(params)
+      .map(([key, value]) => `${key}=${encodeURIComponent(String(value))}`)
+      .join('&')
+    return `${this.baseURL}${endpoint}?${query}`
+  }
+
+  async stat(path: string, withSha256 = false): Promise<any> {
+    const response = await fetch(this.url('/files/stat', withSha256 ? { path, sha256: 1 } : { path }))
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    return await response.json()
+  }
+
+  // 下载文件；partial为上次中断前已收到的数据，从其末尾续传
+  async download(path: string, onProgress?: (progress: TransferProgress) => void,
+                 partial?: Uint8Array): Promise<Uint8Array> {
+    const offset = partial ? partial.length : 0
+    const response = await fetch(this.url('/files', { path }), {
+      headers: offset ? { Range: `bytes=${offset}-` } : {}
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    const total = offset + Number(response.headers.get('Content-Length') || 0)
+    const data = new Uint8Array(total)
+    if (partial) {
+      data.set(partial)
+    }
+
+    const reader = response.body.getReader()
+    let received = offset
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      data.set(value, received)
+      received += value.length
+      onProgress?.({ transferred: received, total })
+    }
+    if (received !== total) {
+      throw new Error(`Download interrupted at ${received}/${total}`)
+    }
+
+    const info = await this.stat(path, true)
+    if (info.sha256 !== await sha256Hex(data)) {
+      throw new Error('Downloaded file checksum mismatch')
+    }
+    return data
+  }
+
+  // 上传文件；服务端保留未完成的.part，重新调用时从服务端记录的偏移继续
+  async upload(path: string, data: Uint8Array, overwrite = false,
+               onProgress?: (progress: TransferProgress) => void): Promise<string> {
+    let offset = (await this.stat(path)).uploadOffset || 0
+    if (offset > data.length) {
+      offset = 0
+    }
+    while (offset < data.length) {
+      const chunk = data.subarray(offset, offset + UPLOAD_CHUNK_BYTES)
+      const response = await fetch(this.url('/files', { path, offset, crc32: crc32(chunk), overwrite: String(overwrite) }), {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: chunk
+      })
+      const result = await response.json()
+      if (response.status === 409 && typeof result.offset === 'number') {
+        offset = result.offset  // 服务端的进度与本地不一致，按服务端的偏移继续
+        continue
+      }
+      if (!response.ok) {
+        throw new Error(result.error || `HTTP error! status: ${response.status}`)
+      }
+      offset = result.offset
+      onProgress?.({ transferred: offset, total: data.length })
+    }
+
+    const sha256 = await sha256Hex(data)
+    const response = await fetch(this.url('/files/commit', { path, sha256, overwrite: String(overwrite) }), {
+      method: 'POST'
+    })
+    const result = await response.json()
+    if (!response.ok) {
+      throw new Error(result.error || `HTTP error! status: ${response.status}`)
+    }
+    return result.sha256
+  }
+}
+
+// 导出单例实例
+export const fileTransferService = new FileTransferServiceImpl()
@@ -11,6 +11,16 @@ export interface ConnectionResult {
   message?: string;
 }
 
+// 任务资源占用（terminal_stats）：cpu为百分比，rss为字节，read/write为每秒字节数
+export interface TaskStats {
+  taskId: string;
+  cpu: number;
+  rss: number;
+  read: number;
+  write: number;
+  procs: number;
+}
+
 // 调试模式控制
 const DEBUG_MODE = import.meta.env.DEV && localStorage.getItem('terminal-debug') === 'true';
 
@@ -32,11 +42,19 @@ class TerminalService {
   private errorCallbacks: Array<(error: string, taskId?: string) => void> = [];
   private statusCallbacks: Array<(status: string, command?: string, taskId?: string) => void> = [];
   private completeCallbacks: Array<(exitCode: number, message?: string, taskId?: string) => void> = [];
+  private statsCallbacks: Array<(stats: TaskStats[]) => void> = [];
   
   // 输入缓冲和节流相关属性
   private inputBuffer: Map<string, { buffer: string; timer: NodeJS.Timeout | null }> = new Map();
   private inputThrottleDelay: number = 50; // 50ms节流延迟
   private maxBufferSize: number = 100; // 最大缓冲大小
+  // 单条terminal_input的最大字符数；服务端单条消息默认上限1MB，按UTF-8每字符最多3字节计算
+  private inputChunkSize: number = 256 * 1024;
+
+  // 输出流控：每个任务最近收到和已确认的输出偏移，以及正在由终端组件显示的任务
+  private receivedOffsets: Map<string, number> = new Map();
+  private ackedOffsets: Map<string, number> = new Map();
+  private renderedTasks: Set<string> = new Set();
   // 连接到后端
   async connect(config: TerminalConfig): Promise<ConnectionResult> {
     return new Promise((resolve) => {
@@ -87,9 +105,9 @@ class TerminalService {
           // 监听其他可能的事件
           this.setupEventListeners();
 
-          // 发送连接请求
+          // 发送连接请求（启用输出流控，消费后通过terminal_ack确认）
           debugLog('Sending terminal_connect event');
-          this.socket?.emit('terminal_connect', {});
+          this.socket?.emit('terminal_connect', { flowControl: true });
         });
 
         // 监听连接错误
@@ -136,7 +154,7 @@ class TerminalService {
 
 
   // 执行命令 (PTY版本)
-  async executeCommand(command: string, taskId: string, options?: { rows?: number; cols?: number }): Promise<boolean> {
+  async executeCommand(command: string, taskId: string, options?: { rows?: number; cols?: number; screen?: boolean }): Promise<boolean> {
     if (!this.socket || !this.sessionId) {
       errorLog('Not connected to terminal');
       return false;
@@ -162,7 +180,10 @@ class TerminalService {
         taskId: taskId,
         command: command.trim(),
         rows: options?.rows || 24,
-        cols: options?.cols || 80
+        cols: options?.cols || 80,
+        // 服务端屏幕模型模式：只接收屏幕差异，适合大量输出的命令
+        screen: options?.screen || false,
+        sentAt: Date.now()
       });
 
       // 设置命令执行超时
@@ -174,6 +195,27 @@ class TerminalService {
     });
   }
 
+  // 批量提交命令：由后端调度器按优先级和并发上限依次启动，排队中的任务会收到queued状态
+  executeBatch(commands: { command: string; taskId: string; rows?: number; cols?: number; priority?: number }[]): boolean {
+    if (!this.socket || !this.sessionId) {
+      errorLog('Not connected to terminal');
+      return false;
+    }
+
+    this.socket.emit('terminal_batch', {
+      sessionId: this.sessionId,
+      commands: commands.map(item => ({
+        taskId: item.taskId,
+        command: item.command.trim(),
+        rows: item.rows || 24,
+        cols: item.cols || 80,
+        priority: item.priority || 0
+      })),
+      sentAt: Date.now()
+    });
+    return true;
+  }
+
   // 向终端发送输入 (PTY交互) - 带缓冲和节流
   sendInput(taskId: string, data: string): boolean {
     if (!this.socket || !this.sessionId) {
@@ -234,11 +276,23 @@ class TerminalService {
     
     // 发送数据，添加错误处理
     try {
-      this.socket.emit('terminal_input', {
-        sessionId: this.sessionId,
-        taskId: taskId,
-        data: dataToSend
-      });
+      // 大段粘贴拆成多条消息，由后端按顺序排队写入
+      let offset = 0;
+      while (offset < dataToSend.length) {
+        let end = Math.min(offset + this.inputChunkSize, dataToSend.length);
+        // 不拆开UTF-16代理对
+        const last = dataToSend.charCodeAt(end - 1);
+        if (end < dataToSend.length && last >= 0xd800 && last <= 0xdbff) {
+          end -= 1;
+        }
+        this.socket.emit('terminal_input', {
+          sessionId: this.sessionId,
+          taskId: taskId,
+          data: dataToSend.slice(offset, end),
+          sentAt: Date.now()
+        });
+        offset = end;
+      }
     } catch (error) {
       console.error('Error sending input to terminal:', error);
       // 重新添加到缓冲区，但只保留最近的数据避免无限循环
@@ -260,7 +314,8 @@ class TerminalService {
       this.socket.emit('terminal_input', {
         sessionId: this.sessionId,
         taskId: taskId,
-        data: data
+        data: data,
+        sentAt: Date.now()
       });
       return true;
     } catch (error) {
@@ -281,7 +336,8 @@ class TerminalService {
       sessionId: this.sessionId,
       taskId: taskId,
       rows: rows,
-      cols: cols
+      cols: cols,
+      sentAt: Date.now()
     });
     
     return true;
@@ -297,12 +353,48 @@ class TerminalService {
     console.log('Sending interrupt signal for task:', taskId);
     this.socket.emit('terminal_interrupt', {
       sessionId: this.sessionId,
-      taskId: taskId
+      taskId: taskId,
+      sentAt: Date.now()
     });
     
     return true;
   }
 
+  // 终端组件开始显示任务：此后该任务的输出在写入xterm完成后才确认
+  attachRenderer(taskId: string): void {
+    this.renderedTasks.add(taskId);
+  }
+
+  // 终端组件不再显示任务：已收到的输出都已进入store，直接确认
+  detachRenderer(taskId: string): void {
+    this.renderedTasks.delete(taskId);
+    const offset = this.receivedOffsets.get(taskId);
+    if (offset !== undefined) {
+      this.acknowledgeOutput(taskId, offset);
+    }
+  }
+
+  // 任务目前已收到的输出偏移（与store中该任务的output同步更新）
+  receivedOffset(taskId: string): number | undefined {
+    return this.receivedOffsets.get(taskId);
+  }
+
+  // 确认任务的输出已消费到offset，后端据此恢复读取
+  acknowledgeOutput(taskId: string, offset?: number): void {
+    if (offset === undefined || !this.socket || !this.sessionId) {
+      return;
+    }
+    if (offset <= (this.ackedOffsets.get(taskId) ?? -1)) {
+      return;
+    }
+    this.ackedOffsets.set(taskId, offset);
+    this.socket.emit('terminal_ack', {
+      sessionId: this.sessionId,
+      taskId: taskId,
+      offset: offset
+    });
+  }
+
   // 获取当前会话ID
   getSessionId(): string | null {
     return this.sessionId;
@@ -324,6 +416,8 @@ class TerminalService {
     
     // 清理所有输入缓冲区
     this.clearAllInputBuffers();
+    this.receivedOffsets.clear();
+    this.ackedOffsets.clear();
     
     this.socket?.disconnect();
     this.socket = null;
@@ -415,6 +509,15 @@ class TerminalService {
     this.completeCallbacks.push(callback);
   }
 
+  // 添加资源占用监听器
+  onStats(callback: (stats: TaskStats[]) => void): void {
+    this.statsCallbacks.push(callback);
+  }
+
+  offStats(callback: (stats: TaskStats[]) => void): void {
+    this.statsCallbacks = this.statsCallbacks.filter(cb => cb !== callback);
+  }
+
   // 触发状态回调
   private triggerStatus(status: string, command?: string, taskId?: string): void {
     this.statusCallbacks.forEach(callback => callback(status, command, taskId));
@@ -435,6 +538,21 @@ class TerminalService {
         console.log('Terminal output for task:', data.taskId, 'Output length:', data.output.length);
         // 调试：显示原始输出内容（前50个字符）
         console.log('Raw output content:', JSON.stringify(data.output.slice(0, 100)));
+        if (typeof data.end === 'number') {
+          this.receivedOffsets.set(data.taskId, data.end);
+        }
+        this.triggerOutput(data.output, data.taskId);
+        // 没有终端组件显示的任务，输出进入store即已消费；显示中的任务由组件在xterm写入完成后确认
+        if (typeof data.end === 'number' && !this.renderedTasks.has(data.taskId)) {
+          this.acknowledgeOutput(data.taskId, data.end);
+        }
+      }
+    });
+
+    // 监听屏幕模式的帧：output是可直接写入终端的重绘序列
+    this.socket.on('terminal_screen', (data: any) => {
+      if (data && data.sessionId === this.sessionId && data.output) {
+        debugLog('Terminal screen frame for task:', data.taskId, data.type, data.seq);
         this.triggerOutput(data.output, data.taskId);
       }
     });
@@ -462,6 +580,13 @@ class TerminalService {
         this.triggerComplete(data.exitCode, data.message, data.taskId);
       }
     });
+
+    // 监听任务资源占用
+    this.socket.on('terminal_stats', (data: any) => {
+      if (data && data.sessionId === this.sessionId && Array.isArray(data.tasks)) {
+        this.statsCallbacks.forEach(callback => callback(data.tasks));
+      }
+    });
   }
 
   // 清理所有监听器
@@ -470,6 +595,7 @@ class TerminalService {
     this.errorCallbacks = [];
     this.statusCallbacks = [];
     this.completeCallbacks = [];
+    this.statsCallbacks = [];
   }
 }
 
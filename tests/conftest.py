@@ -0,0 +1,80 @@
+import heapq
+import os
+
+import pytest
+
+from pty_reactor import TimerHandle
+
+
+class FakeReactor:
+    """同步执行的反应器替身：run_in_loop立即执行，定时器只在advance时触发
+
+    fd和进程的监听只做登记，由测试通过readers/writers/processes手动触发回调。
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers: list = []
+        self.readers: dict = {}  # fd -> (callback, args)
+        self.writers: dict = {}
+        self.processes: dict = {}  # pid -> (callback, args)
+
+    def run_in_loop(self, callback, *args):
+        callback(*args)
+
+    def call_soon_threadsafe(self, callback, *args):
+        callback(*args)
+
+    def call_later(self, delay, callback, *args) -> TimerHandle:
+        handle = TimerHandle(self.now + max(0.0, delay), callback, args)
+        heapq.heappush(self._timers, handle)
+        return handle
+
+    def advance(self, seconds: float):
+        """推进时间并执行到期的定时器"""
+        self.now += seconds
+        while self._timers and self._timers[0].when <= self.now:
+            handle = heapq.heappop(self._timers)
+            if not handle.cancelled:
+                handle.callback(*handle.args)
+
+    def add_reader(self, fd, callback, *args):
+        self.readers[fd] = (callback, args)
+
+    def remove_reader(self, fd):
+        self.readers.pop(fd, None)
+
+    def add_writer(self, fd, callback, *args):
+        self.writers[fd] = (callback, args)
+
+    def remove_writer(self, fd):
+        self.writers.pop(fd, None)
+
+    def close_fd(self, fd):
+        self.remove_reader(fd)
+        self.remove_writer(fd)
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def watch_process(self, process, callback, *args):
+        self.processes[process.pid] = (callback, args)
+
+    def unwatch_process(self, process):
+        self.processes.pop(process.pid, None)
+
+    def process_exited(self, process):
+        """模拟pidfd就绪：回收进程并调用退出回调"""
+        process.wait()
+        callback, args = self.processes.pop(process.pid)
+        callback(*args)
+
+    @property
+    def pending_timers(self) -> int:
+        return sum(1 for handle in self._timers if not handle.cancelled)
+
+
+@pytest.fixture
+def reactor() -> FakeReactor:
+    return FakeReactor()
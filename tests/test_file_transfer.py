@@ -0,0 +1,193 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+import file_transfer
+from file_transfer import Download, FileTransferHandler, TransferError, Upload, crc32, parse_int, resolve_path
+
+DATA = bytes(range(256)) * 64  # 16KB
+
+
+@pytest.fixture(autouse=True)
+def transfer_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_transfer, 'TRANSFER_ROOT', str(tmp_path.resolve()))
+    return tmp_path
+
+
+def test_paths_cannot_leave_the_root(transfer_root):
+    assert resolve_path('a/b.bin') == str(transfer_root.resolve() / 'a' / 'b.bin')
+    with pytest.raises(TransferError) as info:
+        resolve_path('../outside.bin')
+    assert info.value.status == 403
+
+
+def test_parse_int_rejects_garbage():
+    assert parse_int('12', 'offset') == 12
+    assert parse_int(None, 'offset', 5) == 5
+    with pytest.raises(TransferError) as info:
+        parse_int('abc', 'offset')
+    assert info.value.status == 400
+
+
+def test_upload_resumes_from_part_file(transfer_root):
+    upload = Upload('f.bin', len(DATA))
+    assert upload.write(0, DATA[:4096], crc32(DATA[:4096])) == 4096
+    upload.close()  # 连接中断
+
+    upload = Upload('f.bin', len(DATA))
+    assert upload.offset == 4096
+    upload.write(4096, DATA[4096:], crc32(DATA[4096:]))
+    size, digest = upload.commit(hashlib.sha256(DATA).hexdigest())
+    assert size == len(DATA) and digest == hashlib.sha256(DATA).hexdigest()
+    assert (transfer_root / 'f.bin').read_bytes() == DATA
+    assert not (transfer_root / 'f.bin.part').exists()
+
+
+def test_upload_rejects_wrong_offset_and_bad_crc(transfer_root):
+    upload = Upload('f.bin', len(DATA))
+    upload.write(0, DATA[:100])
+    with pytest.raises(TransferError) as info:
+        upload.write(50, DATA[50:150])
+    assert (info.value.status, info.value.offset) == (409, 100)
+    with pytest.raises(TransferError) as info:
+        upload.write(100, DATA[100:200], crc32(DATA[100:200]) ^ 1)
+    assert (info.value.status, info.value.offset) == (422, 100)
+    assert upload.offset == 100
+    upload.close()
+
+
+def test_stream_with_bad_crc_is_truncated_back(transfer_root):
+    upload = Upload('f.bin')
+    upload.write_stream(0, io.BytesIO(DATA[:1000]), crc32(DATA[:1000]))
+    with pytest.raises(TransferError):
+        upload.write_stream(1000, io.BytesIO(DATA[1000:2000]), 0)
+    upload.close()
+    assert os.path.getsize(transfer_root / 'f.bin.part') == 1000
+    assert Upload('f.bin').offset == 1000
+
+
+def test_commit_with_wrong_sha256_discards_part(transfer_root):
+    upload = Upload('f.bin', 3)
+    upload.write(0, b'abc')
+    with pytest.raises(TransferError) as info:
+        upload.commit('0' * 64)
+    assert (info.value.status, info.value.offset) == (422, 0)
+    assert not (transfer_root / 'f.bin.part').exists()
+    assert not (transfer_root / 'f.bin').exists()
+
+
+def test_stale_larger_part_restarts_from_zero(transfer_root):
+    (transfer_root / 'f.bin.part').write_bytes(b'x' * 100)
+    upload = Upload('f.bin', 10)
+    assert upload.offset == 0
+    upload.close()
+
+
+def test_existing_file_needs_overwrite(transfer_root):
+    (transfer_root / 'f.bin').write_bytes(b'old')
+    with pytest.raises(TransferError) as info:
+        Upload('f.bin')
+    assert info.value.status == 409
+    Upload('f.bin', overwrite=True).close()
+
+
+def test_download_resumed_mid_file_still_hashes_whole_file(transfer_root):
+    (transfer_root / 'f.bin').write_bytes(DATA)
+    download = Download('f.bin')
+    offset, received = 4096, bytearray(DATA[:4096])
+    while offset < download.size:
+        chunk = download.read(offset, 1000)
+        received += chunk
+        offset += len(chunk)
+    assert bytes(received) == DATA
+    assert download.sha256() == hashlib.sha256(DATA).hexdigest()
+    with pytest.raises(TransferError) as info:
+        download.read(download.size + 1, 10)
+    assert info.value.status == 416
+    download.close()
+
+
+class FakeSocketIO:
+    """登记事件处理器并记录回复"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.events = []
+
+    def on(self, event):
+        def register(handler):
+            self.handlers[event] = handler
+            return handler
+        return register
+
+    def emit(self, event, payload, to=None):
+        self.events.append((event, payload))
+
+    def start_background_task(self, target, *args):
+        pass
+
+
+@pytest.fixture
+def app():
+    flask = pytest.importorskip('flask')
+    return flask.Flask(__name__)
+
+
+@pytest.fixture
+def handler(app):
+    socketio = FakeSocketIO()
+    handler = FileTransferHandler(socketio)
+    handler.register_routes(app)
+
+    def call(event, data):
+        socketio.events.clear()
+        with app.test_request_context():
+            socketio.handlers[event](data)
+        return socketio.events
+
+    handler.call = call
+    return handler
+
+
+def start_upload(handler, path, size):
+    [(event, payload)] = handler.call('file_upload_start', {'path': path, 'size': size})
+    assert event == 'file_upload_ready'
+    return payload['transferId']
+
+
+def test_text_chunk_is_rejected_with_file_error(handler):
+    transfer_id = start_upload(handler, 'f.bin', 3)
+    [(event, payload)] = handler.call('file_upload_chunk', {'transferId': transfer_id, 'offset': 0, 'data': 'abc'})
+    assert event == 'file_error' and 'binary' in payload['error']
+    [(event, payload)] = handler.call('file_upload_chunk', {'transferId': transfer_id, 'offset': 0, 'data': b'abc'})
+    assert (event, payload['offset']) == ('file_ack', 3)
+
+
+def test_non_string_sha256_is_rejected_and_upload_kept(handler, transfer_root):
+    transfer_id = start_upload(handler, 'f.bin', 3)
+    handler.call('file_upload_chunk', {'transferId': transfer_id, 'offset': 0, 'data': b'abc'})
+    [(event, payload)] = handler.call('file_upload_finish', {'transferId': transfer_id, 'sha256': 123})
+    assert event == 'file_error' and 'sha256' in payload['error']
+    [(event, payload)] = handler.call('file_upload_finish', {'transferId': transfer_id,
+                                                             'sha256': hashlib.sha256(b'abc').hexdigest()})
+    assert event == 'file_complete'
+    assert (transfer_root / 'f.bin').read_bytes() == b'abc'
+
+
+def test_http_commit_without_upload_is_not_found(handler, app, transfer_root):
+    client = app.test_client()
+    response = client.post('/files/commit?path=missing.bin')
+    assert response.status_code == 404
+    assert not (transfer_root / 'missing.bin').exists()
+    assert not (transfer_root / 'missing.bin.part').exists()
+
+    assert client.put('/files?path=f.bin&offset=0', data=b'abc').get_json() == {'offset': 3}
+    response = client.post('/files/commit?path=f.bin')
+    assert response.status_code == 200 and response.get_json()['size'] == 3
+
+
+def test_http_rejects_malformed_offsets(app, handler):
+    response = app.test_client().put('/files?path=f.bin&offset=abc', data=b'abc')
+    assert response.status_code == 400
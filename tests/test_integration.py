@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('socketio')
+
+from _harness import BackendServer, TerminalClient
+
+
+def listen(client, event):
+    """收集客户端收到的event事件，返回(事件列表, 收到第一个事件时置位的Event)"""
+    received, arrived = [], threading.Event()
+
+    def handler(data):
+        received.append(data)
+        arrived.set()
+
+    client.sio.on(event, handler)
+    return received, arrived
+
+
+@pytest.fixture(scope='module')
+def server():
+    with BackendServer() as backend:
+        yield backend
+
+
+@pytest.fixture
+def client(server):
+    client = TerminalClient(server.url, {'flowControl': True}).connect()
+    yield client
+    client.disconnect()
+
+
+def test_command_output_and_exit_code(client):
+    output = []
+    client.output_listeners.append(lambda data, chunk: output.append(chunk))
+    client.run('t1', 'echo hello-$((6 * 7))')
+    assert client.wait_complete('t1', timeout=15) == 0
+    assert 'hello-42' in ''.join(output)
+
+    client.run('t2', 'exit 3')
+    assert client.wait_complete('t2', timeout=15) == 3
+
+
+
+def test_replay_returns_scrollback_and_rejects_bad_offsets(client):
+    replies, replied = listen(client, 'terminal_replay')
+    errors, failed = listen(client, 'terminal_error')
+    client.run('t1', 'printf replay-me')
+    assert client.wait_complete('t1', timeout=15) == 0
+
+    client.sio.emit('terminal_replay', {'sessionId': client.session_id, 'taskId': 't1', 'offset': 0})
+    assert replied.wait(10)
+    assert replies[0]['output'] == 'replay-me' and replies[0]['offset'] == 0
+
+    client.sio.emit('terminal_replay', {'sessionId': client.session_id, 'taskId': 't1', 'offset': 'abc'})
+    assert failed.wait(10)
+    assert errors[0]['taskId'] == 't1'
+
+
+def test_malformed_ack_reports_terminal_error(client):
+    errors, failed = listen(client, 'terminal_error')
+    client.run('t1', 'true')
+    assert client.wait_complete('t1', timeout=15) == 0
+    client.sio.emit('terminal_ack', {'sessionId': client.session_id, 'taskId': 't1', 'offset': 'abc'})
+    assert failed.wait(10)
+    assert errors[0]['taskId'] == 't1'
+
+
+def test_command_longer_than_tty_line_limit(client):
+    # 规范模式的tty一行最多4095字节，超长命令不能写给预热shell
+    time.sleep(1)  # 等预热池填满，确保命令会分配到预热shell
+    output = []
+    client.output_listeners.append(lambda data, chunk: output.append(chunk))
+    client.run('t1', 'echo ' + 'x' * 5000 + '; echo LONGDONE')
+    assert client.wait_complete('t1', timeout=15) == 0
+    text = ''.join(output)
+    assert 'x' * 5000 in text and 'LONGDONE' in text
+
+
+def test_persistent_shell_runs_long_commands(client):
+    output = []
+    client.output_listeners.append(lambda data, chunk: output.append(chunk))
+    client.run('t1', 'cd /tmp', persistent=True)
+    assert client.wait_complete('t1', timeout=15) == 0
+
+    client.completed.pop('t1')
+    client.run('t1', 'echo ' + 'y' * 5000 + '; pwd; false', persistent=True)
+    assert client.wait_complete('t1', timeout=15) == 1
+    text = ''.join(output)
+    assert 'y' * 5000 in text and '/tmp' in text
+
+
+def test_batch_rejects_bad_items_individually(client):
+    errors, failed = listen(client, 'terminal_error')
+    client.sio.emit('terminal_batch', {'sessionId': client.session_id, 'commands': [
+        {'taskId': 'good', 'command': 'exit 4', 'priority': '2'},
+        {'taskId': 'bad', 'command': 'true', 'priority': 'high'},
+    ]})
+    assert client.wait_complete('good', timeout=15) == 4
+    assert failed.wait(10)
+    assert [(e['taskId'], e['error']) for e in errors] == [('bad', 'Invalid priority')]
@@ -0,0 +1,202 @@
+import fcntl
+import os
+import select
+import struct
+import termios
+import time
+
+import pytest
+
+import pty_handler
+from pty_handler import PtyTerminalSession
+
+
+class FakeSocketIO:
+    """记录发往房间的事件"""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, payload, to=None):
+        self.events.append((event, payload))
+
+    def payloads(self, event):
+        return [payload for name, payload in self.events if name == event]
+
+
+@pytest.fixture
+def socketio():
+    return FakeSocketIO()
+
+
+@pytest.fixture
+def make_session(reactor, socketio):
+    sessions = []
+
+    def make(**options):
+        session = PtyTerminalSession('s', socketio, reactor, **options)
+        sessions.append(session)
+        return session
+
+    yield make
+    for session in sessions:
+        session.cleanup()
+
+
+class TestFlowControl:
+    @pytest.fixture(autouse=True)
+    def water_marks(self, monkeypatch):
+        monkeypatch.setattr(pty_handler, 'FLOW_HIGH_WATER', 1000)
+        monkeypatch.setattr(pty_handler, 'FLOW_LOW_WATER', 400)
+
+    @pytest.fixture
+    def task(self, make_session, reactor):
+        session = make_session(flow_control=True, binary=True)
+        assert session.create_terminal('t', 'cat')
+        info = session.terminals['t']
+        # 首块输出不等合并窗口直接发出；这里测的是之后按窗口合并的输出
+        info['coalescer'].immediate = False
+        return session, info
+
+    def test_pauses_at_high_water_and_resumes_at_low_water(self, task, reactor, socketio):
+        session, info = task
+        master_fd = info['master_fd']
+        session._deliver_output('t', info, b'x' * 600)
+        assert not info['paused'] and master_fd in reactor.readers
+        # 合并缓冲区中尚未发出的字节也计入未确认量
+        session._deliver_output('t', info, b'x' * 400)
+        assert info['paused'] and master_fd not in reactor.readers
+
+        reactor.advance(1)
+        assert socketio.payloads('terminal_output')[-1]['end'] == 1000
+        session._on_ack('t', 500)
+        assert info['paused']  # 未确认500字节，仍高于低水位
+        session._on_ack('t', 600)
+        assert not info['paused'] and master_fd in reactor.readers
+
+    def test_ack_beyond_emitted_is_clamped(self, task, reactor):
+        session, info = task
+        session._deliver_output('t', info, b'x' * 1000)
+        assert info['paused']
+        session._on_ack('t', 10 ** 9)
+        # 合并缓冲区里的数据还没有发出，不能被提前确认
+        assert info['acked'] == info['emitted']
+        assert info['paused']
+        reactor.advance(1)
+        session._on_ack('t', 1000)
+        assert not info['paused']
+
+    def test_stale_ack_does_not_move_backwards(self, task, reactor):
+        session, info = task
+        session._deliver_output('t', info, b'x' * 100)
+        reactor.advance(1)
+        session._on_ack('t', 100)
+        session._on_ack('t', 50)
+        assert info['acked'] == 100
+
+
+def read_until(fd, marker: bytes, timeout: float = 5.0) -> bytes:
+    """从master fd读到marker出现为止（测试直接读取，不经过反应器）"""
+    data = b''
+    deadline = time.monotonic() + timeout
+    while marker not in data:
+        remaining = deadline - time.monotonic()
+        assert remaining > 0, 'timed out waiting for %r, got %r' % (marker, data)
+        if select.select([fd], [], [], remaining)[0]:
+            data += os.read(fd, 4096)
+    return data
+
+
+class TestInterruptEscalation:
+    def start(self, make_session, command):
+        session = make_session()
+        assert session.create_terminal('t', command)
+        info = session.terminals['t']
+        read_until(info['master_fd'], b'ready')
+        return session, info
+
+    def test_escalates_to_sigterm_then_sigkill(self, make_session, reactor, socketio):
+        session, info = self.start(make_session, "trap '' INT TERM; echo ready; sleep 30")
+        assert session.interrupt_terminal('t')
+        assert info['interrupt']['signal'] == 'SIGINT'
+
+        reactor.advance(pty_handler.INTERRUPT_TERM_DELAY)
+        assert info['interrupt']['signal'] == 'SIGTERM'
+        assert info['process'].poll() is None  # SIGTERM也被忽略
+
+        reactor.advance(pty_handler.INTERRUPT_KILL_DELAY)
+        assert info['interrupt']['signal'] == 'SIGKILL'
+        reactor.process_exited(info['process'])
+        assert socketio.payloads('terminal_complete') == [
+            {'sessionId': 's', 'taskId': 't', 'exitCode': -2, 'signal': 'SIGKILL'}]
+
+    def test_stops_escalating_once_the_process_exits(self, make_session, reactor, socketio):
+        session, info = self.start(make_session, 'echo ready; sleep 30')
+        assert session.interrupt_terminal('t')
+        info['process'].wait(5)
+
+        reactor.advance(pty_handler.INTERRUPT_TERM_DELAY + pty_handler.INTERRUPT_KILL_DELAY)
+        assert info['interrupt']['signal'] == 'SIGINT'
+        reactor.process_exited(info['process'])
+        assert socketio.payloads('terminal_complete')[0]['signal'] == 'SIGINT'
+        assert reactor.pending_timers == 0
+
+    def test_repeated_interrupt_does_not_restart_escalation(self, make_session, reactor):
+        session, info = self.start(make_session, "trap '' INT; echo ready; sleep 30")
+        session.interrupt_terminal('t')
+        timer = info['interrupt']['timer']
+        session.interrupt_terminal('t')
+        assert info['interrupt']['timer'] is timer
+        assert reactor.pending_timers == 1
+
+
+def pty_size(fd):
+    rows, cols, _, _ = struct.unpack('HHHH', fcntl.ioctl(fd, termios.TIOCGWINSZ, b'\0' * 8))
+    return rows, cols
+
+
+class TestResizeDebounce:
+    @pytest.fixture
+    def task(self, make_session, monkeypatch):
+        monkeypatch.setattr(pty_handler, 'RESIZE_DEBOUNCE', 0.15)
+        session = make_session()
+        assert session.create_terminal('t', 'cat', rows=24, cols=80)
+        return session, session.terminals['t']['master_fd']
+
+    def test_first_resize_applies_immediately_and_last_one_wins(self, task, reactor):
+        session, fd = task
+        session.resize_terminal('t', 30, 100)
+        assert pty_size(fd) == (30, 100)
+
+        session.resize_terminal('t', 31, 101)
+        reactor.advance(0.1)
+        session.resize_terminal('t', 32, 102)
+        # 每次调整都重新计时：距第一次已超过静默期，但距最后一次还没有
+        reactor.advance(0.1)
+        assert pty_size(fd) == (30, 100)
+        reactor.advance(0.05)
+        assert pty_size(fd) == (32, 102)
+        assert reactor.pending_timers == 0
+
+    def test_resize_after_quiet_period_applies_immediately(self, task, reactor):
+        session, fd = task
+        session.resize_terminal('t', 30, 100)
+        reactor.advance(0.15)
+        session.resize_terminal('t', 40, 120)
+        assert pty_size(fd) == (40, 120)
+
+    def test_unchanged_size_does_not_start_a_quiet_period(self, task, reactor):
+        session, fd = task
+        session.resize_terminal('t', 24, 80)
+        assert reactor.pending_timers == 0
+        session.resize_terminal('t', 30, 100)
+        assert pty_size(fd) == (30, 100)
+
+    def test_dragging_back_to_the_applied_size_ends_there(self, task, reactor):
+        session, fd = task
+        session.resize_terminal('t', 30, 100)
+        session.resize_terminal('t', 35, 110)
+        session.resize_terminal('t', 30, 100)  # 拖回原来的尺寸
+        reactor.advance(0.15)
+        assert pty_size(fd) == (30, 100)
+        assert session.terminals['t']['pending_size'] is None
@@ -0,0 +1,99 @@
+import fcntl
+import os
+
+import pytest
+
+from pty_input import InputWriter
+
+
+@pytest.fixture
+def pipe():
+    """容量只有一页的非阻塞管道，模拟很快写满的pty输入缓冲区"""
+    r, w = os.pipe()
+    fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, 4096)
+    os.set_blocking(w, False)
+    os.set_blocking(r, False)
+    yield r, w
+    for fd in (r, w):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def drain(fd) -> bytes:
+    data = b''
+    while True:
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return data
+        if not chunk:
+            return data
+        data += chunk
+
+
+def test_partial_write_waits_for_writable_and_resumes(reactor, pipe):
+    r, w = pipe
+    writer = InputWriter(reactor, w)
+    data = bytes(range(256)) * 100
+    assert writer.write(data)
+    # 只写进了管道容量那么多，其余等fd可写
+    assert w in reactor.writers
+    assert writer.pending == len(data) - 4096
+
+    received = drain(r)
+    while w in reactor.writers:
+        callback, args = reactor.writers[w]
+        callback(*args)
+        received += drain(r)
+    assert received == data
+    assert writer.pending == 0
+
+
+def test_input_arriving_while_waiting_is_queued_behind(reactor, pipe):
+    r, w = pipe
+    writer = InputWriter(reactor, w)
+    writer.write(b'a' * 5000)
+    writer.write(b'b' * 10)
+    assert writer.pending == 5000 + 10 - 4096
+    received = drain(r)
+    callback, args = reactor.writers[w]
+    callback(*args)
+    received += drain(r)
+    assert received == b'a' * 5000 + b'b' * 10
+    assert w not in reactor.writers
+
+
+def test_discard_drops_queued_input(reactor, pipe):
+    r, w = pipe
+    writer = InputWriter(reactor, w)
+    writer.write(b'x' * 10000)
+    writer.discard()
+    assert writer.pending == 0 and w not in reactor.writers
+    drain(r)
+    writer.write(b'\x03')
+    assert drain(r) == b'\x03'
+
+
+def test_queue_limit_and_close(reactor, pipe):
+    r, w = pipe
+    writer = InputWriter(reactor, w, max_bytes=8192)
+    assert not writer.write(b'x' * 8193)
+    assert writer.write(b'x' * 8192)
+    # 已写出的部分不再占用配额
+    assert not writer.write(b'y' * 4097)
+    assert writer.write(b'y' * 4096)
+    writer.close()
+    assert writer.pending == 0
+    assert not writer.write(b'z')
+
+
+def test_write_error_discards_remaining_input(reactor, pipe):
+    r, w = pipe
+    writer = InputWriter(reactor, w)
+    writer.write(b'x' * 5000)
+    os.close(r)  # 没有读者了：继续写入得到EPIPE
+    callback, args = reactor.writers[w]
+    callback(*args)
+    assert writer.pending == 0 and w not in reactor.writers
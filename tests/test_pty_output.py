@@ -0,0 +1,108 @@
+from pty_output import CommandMarkerScanner, OutputCoalescer, ScrollbackBuffer, collapse_redraws
+
+
+class TestCollapseRedraws:
+    def test_keeps_only_last_progress_redraw(self):
+        assert collapse_redraws(b'start\r 10%\r 20%\r 30%\r\n', 80) == b'start\r 30%\r\n'
+
+    def test_plain_lines_untouched(self):
+        data = b'one\r\ntwo\r\n'
+        assert collapse_redraws(data, 80) is data
+
+    def test_keeps_segment_not_fully_covered(self):
+        # 后一段更短，盖不住前一段的尾部
+        assert collapse_redraws(b'x\r 100%\r 2%\rend', 80) == b'x\r 100%\rend'
+
+    def test_keeps_wrapping_segments(self):
+        # 超过屏幕宽度的段会折行，不能判断是否被覆盖
+        data = b'x\r' + b'a' * 100 + b'\r' + b'b' * 100 + b'\rend'
+        assert collapse_redraws(data, 80) == data
+
+    def test_carries_sgr_of_dropped_segments(self):
+        result = collapse_redraws(b'x\r\x1b[32m 10%\r 20%\r 30% done', 80)
+        assert result == b'x\r\x1b[32m 30% done'
+
+
+class TestScrollbackBuffer:
+    def test_reads_before_wrap(self):
+        buffer = ScrollbackBuffer(8)
+        buffer.append(b'abcdef')
+        assert buffer.read_from(0) == (0, b'abcdef')
+
+    def test_wraps_and_keeps_absolute_offsets(self):
+        buffer = ScrollbackBuffer(8)
+        buffer.append(b'abcdef')
+        buffer.append(b'ghijk')
+        assert (buffer.start, buffer.end) == (3, 11)
+        assert buffer.read_from(0) == (3, b'defghijk')
+        assert buffer.read_from(5) == (5, b'fghijk')
+        assert buffer.read_from(0, limit=2) == (9, b'jk')
+        assert buffer.read_from(11) == (11, b'')
+
+    def test_append_larger_than_capacity(self):
+        buffer = ScrollbackBuffer(8)
+        buffer.append(b'abc')
+        buffer.append(b'0123456789ABC')
+        assert buffer.read_from(0) == (8, b'56789ABC')
+
+    def test_zero_capacity_only_counts(self):
+        buffer = ScrollbackBuffer(0)
+        buffer.append(b'abc')
+        assert buffer.end == 3
+        assert buffer.read_from(0) == (3, b'')
+
+
+class TestCommandMarkerScanner:
+    def test_strips_marker_split_across_chunks(self):
+        scanner = CommandMarkerScanner('n1')
+        data = b'out\x1b]777;qd;n1;3;7\x07rest'
+        assert scanner.feed(data[:8]) == [b'out']
+        assert scanner.feed(data[8:]) == [(3, 7), b'rest']
+
+    def test_other_nonce_is_plain_output(self):
+        scanner = CommandMarkerScanner('n1')
+        data = b'\x1b]777;qd;n2;1;0\x07'
+        assert b''.join(scanner.feed(data)) + scanner.flush() == data
+
+    def test_malformed_body_is_plain_output(self):
+        scanner = CommandMarkerScanner('n1')
+        assert scanner.feed(b'\x1b]777;qd;n1;x;y\x07') == [b'\x1b]777;qd;n1;x;y\x07']
+
+    def test_flush_returns_incomplete_marker(self):
+        scanner = CommandMarkerScanner('n1')
+        assert scanner.feed(b'tail\x1b]777;qd;n1;4') == [b'tail']
+        assert scanner.flush() == b'\x1b]777;qd;n1;4'
+
+    def test_marker_command_prints_marker(self):
+        assert CommandMarkerScanner('n1').marker_command(2) == "printf '\\033]777;qd;n1;2;%d\\007' \"$__qd\""
+
+
+class TestOutputCoalescer:
+    def test_merges_chunks_within_window(self, reactor):
+        frames = []
+        coalescer = OutputCoalescer(reactor, frames.append, window_ms=10, max_bytes=1024)
+        coalescer.feed(b'a')
+        coalescer.feed(b'b')
+        assert frames == [] and coalescer.pending == 2
+        reactor.advance(0.01)
+        assert frames == [b'ab']
+        assert reactor.pending_timers == 0
+
+    def test_flushes_at_max_bytes(self, reactor):
+        frames = []
+        coalescer = OutputCoalescer(reactor, frames.append, window_ms=10, max_bytes=4)
+        coalescer.feed(b'ab')
+        coalescer.feed(b'cde')
+        assert frames == [b'abcde']
+        # 提前发送后窗口定时器被取消
+        assert reactor.pending_timers == 0
+
+    def test_immediate_sends_next_chunk_only(self, reactor):
+        frames = []
+        coalescer = OutputCoalescer(reactor, frames.append, window_ms=10, max_bytes=1024)
+        coalescer.immediate = True
+        coalescer.feed(b'echo')
+        coalescer.feed(b'more')
+        assert frames == [b'echo']
+        reactor.advance(0.01)
+        assert frames == [b'echo', b'more']
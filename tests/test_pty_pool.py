@@ -0,0 +1,33 @@
+import os
+import shlex
+
+import pytest
+
+from pty_pool import MAX_INPUT_LINE, PtyPool, persistent_command_line
+
+
+def test_pool_rejects_commands_longer_than_a_tty_line():
+    pool = PtyPool(size=0)
+    assert pool.accepts('echo hi', 24, 80)
+    long_command = 'echo ' + 'x' * MAX_INPUT_LINE
+    assert not pool.accepts(long_command, 24, 80)
+    with pytest.raises(ValueError):
+        pool.run_command(-1, long_command, 24, 80)
+
+
+def test_persistent_command_line_evals_short_commands():
+    line = persistent_command_line('cd /tmp', 'MARK')
+    assert line == b"stty echo; eval 'cd /tmp'; __qd=$?; stty -echo; MARK\n"
+
+
+def test_persistent_command_line_sources_long_commands_from_a_file():
+    command = 'echo ' + 'x' * MAX_INPUT_LINE
+    line = persistent_command_line(command, 'MARK')
+    assert len(line) <= MAX_INPUT_LINE
+    path = shlex.split(line.decode().split(';')[1])[1]
+    try:
+        with open(path) as f:
+            # 文件先删除自己，再执行命令
+            assert f.read() == 'rm -f %s\n%s\n' % (shlex.quote(path), command)
+    finally:
+        os.unlink(path)
@@ -0,0 +1,112 @@
+import os
+import selectors
+import subprocess
+import threading
+
+import pytest
+
+from pty_reactor import EpollSelector, PtyReactor
+
+
+@pytest.fixture
+def pipe():
+    r, w = os.pipe()
+    yield r, w
+    for fd in (r, w):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def running_reactor():
+    reactor = PtyReactor()
+    reactor.start()
+    yield reactor
+    reactor.stop()
+
+
+def wait_for(reactor, callback, *args):
+    """在反应器线程中执行callback，返回其结果"""
+    done = threading.Event()
+    result = []
+    reactor.call_soon_threadsafe(lambda: (result.append(callback(*args)), done.set()))
+    assert done.wait(5)
+    return result[0]
+
+
+class TestEpollSelector:
+    def test_reports_only_requested_events(self, pipe):
+        r, w = pipe
+        selector = EpollSelector()
+        selector.register(r, selectors.EVENT_READ, 'reader')
+        selector.register(w, selectors.EVENT_WRITE, 'writer')
+        ready = {key.data: events for key, events in selector.select(0)}
+        assert ready == {'writer': selectors.EVENT_WRITE}
+
+        os.write(w, b'x')
+        ready = {key.data: events for key, events in selector.select(0)}
+        assert ready == {'reader': selectors.EVENT_READ, 'writer': selectors.EVENT_WRITE}
+        selector.close()
+
+    def test_modify_and_unregister(self, pipe):
+        r, w = pipe
+        selector = EpollSelector()
+        selector.register(w, selectors.EVENT_WRITE)
+        with pytest.raises(KeyError):
+            selector.register(w, selectors.EVENT_WRITE)
+        selector.modify(w, selectors.EVENT_READ, 'data')
+        assert selector.get_map()[w].data == 'data'
+        assert selector.select(0) == []
+        selector.unregister(w)
+        assert selector.get_map() == {}
+        selector.close()
+
+    def test_timeout_returns_empty(self, pipe):
+        selector = EpollSelector()
+        selector.register(pipe[0], selectors.EVENT_READ)
+        assert selector.select(0.01) == []
+        selector.close()
+
+
+class TestPtyReactor:
+    def test_reader_callback_runs_in_reactor_thread(self, running_reactor, pipe):
+        r, w = pipe
+        received = threading.Event()
+        threads = []
+
+        def on_readable():
+            threads.append(running_reactor.in_reactor_thread())
+            os.read(r, 100)
+            running_reactor.remove_reader(r)
+            received.set()
+
+        running_reactor.add_reader(r, on_readable)
+        os.write(w, b'x')
+        assert received.wait(5)
+        assert threads == [True]
+        assert wait_for(running_reactor, running_reactor.registered_fds) == 0
+
+    def test_timers_fire_in_order_and_can_be_cancelled(self, running_reactor):
+        fired = []
+        done = threading.Event()
+        running_reactor.call_later(0.03, fired.append, 'late')
+        running_reactor.call_later(0.01, fired.append, 'early')
+        running_reactor.call_later(0.02, fired.append, 'cancelled').cancel()
+        running_reactor.call_later(0.05, done.set)
+        assert done.wait(5)
+        assert fired == ['early', 'late']
+
+    def test_process_exit_is_reported_once(self, running_reactor):
+        process = subprocess.Popen(['sh', '-c', 'exit 3'])
+        exited = []
+        done = threading.Event()
+
+        def on_exit(name):
+            exited.append((name, process.poll()))
+            done.set()
+
+        running_reactor.watch_process(process, on_exit, 'task')
+        assert done.wait(5)
+        assert exited == [('task', 3)]
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import pty_recorder
+from pty_recorder import Recording, RecordingIndex, read_events, start_recording
+
+
+@pytest.fixture
+def cast_path(tmp_path, monkeypatch):
+    """按批写入一段录像：索引点落在每批第一条满足间隔的事件上"""
+    monkeypatch.setattr(pty_recorder, 'INDEX_INTERVAL', 1.0)
+    path = str(tmp_path / 'task.cast')
+    recording = Recording(None, path, {'version': 2, 'width': 80, 'height': 24})
+    for batch in ([(0.0, 'o', b'a'), (0.5, 'o', b'b')],
+                  [(1.2, 'o', b'c'), (1.5, 'o', b'd')],
+                  [(1.9, 'o', b'e')],  # 距上个索引点不足INDEX_INTERVAL，不写索引
+                  [(2.5, 'o', b'f')]):
+        recording._write_events(batch)
+    recording._close_files()
+    return path
+
+
+def line_at(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+
+def test_index_points_at_the_first_event_of_each_indexed_batch(cast_path):
+    index = RecordingIndex(cast_path)
+    try:
+        assert len(index) == 3
+        assert line_at(cast_path, index.offset_for(0.7))[0] == 0.0
+        assert line_at(cast_path, index.offset_for(1.2))[0] == 1.2
+        assert line_at(cast_path, index.offset_for(2.4))[0] == 1.2
+        assert line_at(cast_path, index.offset_for(99))[0] == 2.5
+        # 早于第一个索引点时从第一条事件开始
+        assert line_at(cast_path, index.offset_for(-1))[0] == 0.0
+    finally:
+        index.close()
+
+
+def test_read_events_seeks_to_start(cast_path):
+    assert [event[2] for event in read_events(cast_path, 1.3)] == ['d', 'e', 'f']
+    assert [event[2] for event in read_events(cast_path)] == ['a', 'b', 'c', 'd', 'e', 'f']
+
+
+def test_empty_index_reads_from_the_header(tmp_path):
+    path = str(tmp_path / 'empty.cast')
+    with open(path, 'w') as f:
+        f.write('{"version": 2}\n[0.1, "o", "x"]\n')
+    open(path + '.idx', 'wb').close()
+    assert list(read_events(path)) == [[0.1, 'o', 'x']]
+
+
+def test_same_task_in_the_same_second_gets_separate_files(tmp_path):
+    first = start_recording('t1', 'echo', 24, 80, directory=str(tmp_path))
+    second = start_recording('t1', 'echo', 24, 80, directory=str(tmp_path))
+    assert first.path != second.path
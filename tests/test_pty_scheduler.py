@@ -0,0 +1,79 @@
+from pty_scheduler import ScheduledTask, TaskScheduler
+
+
+def make_scheduler(reactor, max_running=2, max_per_session=2):
+    started, events = [], []
+    scheduler = TaskScheduler(reactor, started.append, lambda sid, event, payload: events.append((event, payload)),
+                              max_running=max_running, max_per_session=max_per_session)
+    return scheduler, started, events
+
+
+def task(session_id, task_id, priority=0):
+    return ScheduledTask(session_id, task_id, 'true', {}, priority)
+
+
+def ids(tasks):
+    return [t.task_id for t in tasks]
+
+
+def test_priority_then_submission_order(reactor):
+    scheduler, started, _ = make_scheduler(reactor, max_running=1)
+    scheduler.submit([task('s', 'a'), task('s', 'b', 5), task('s', 'c'), task('s', 'd', 5)], lambda t: False)
+    # 提交时已经启动了一个：当时队列中优先级最高的b
+    assert ids(started) == ['b']
+    for expected in ['d', 'a', 'c']:
+        scheduler.release('s', started[-1].task_id)
+        assert started[-1].task_id == expected
+    assert not scheduler.is_queued('s', 'c')
+
+
+def test_per_session_limit_lets_other_sessions_run(reactor):
+    scheduler, started, _ = make_scheduler(reactor, max_running=4, max_per_session=1)
+    scheduler.submit([task('s1', 'a'), task('s1', 'b')], lambda t: False)
+    scheduler.submit([task('s2', 'c')], lambda t: False)
+    assert ids(started) == ['a', 'c']
+    assert scheduler.is_queued('s1', 'b')
+    scheduler.release('s1', 'a')
+    assert ids(started) == ['a', 'c', 'b']
+
+
+def test_queued_tasks_report_status_and_can_be_cancelled(reactor):
+    scheduler, started, events = make_scheduler(reactor, max_running=1)
+    scheduler.submit([task('s', 'a'), task('s', 'b'), task('s', 'c')], lambda t: False)
+    assert [p['taskId'] for e, p in events if e == 'terminal_status' and p['status'] == 'queued'] == ['b', 'c']
+    scheduler.cancel('s', 'b')
+    assert ('terminal_complete', {'sessionId': 's', 'taskId': 'b', 'exitCode': -2}) in events
+    scheduler.release('s', 'a')
+    assert ids(started) == ['a', 'c']
+
+
+def test_duplicate_task_ids_are_rejected(reactor):
+    scheduler, started, events = make_scheduler(reactor, max_running=1)
+    scheduler.submit([task('s', 'a'), task('s', 'b'), task('s', 'b')], lambda t: t.task_id == 'a')
+    assert ids(started) == ['b']
+    # a已被会话占用，同一批中重复的b也被拒绝，各自收到带taskId的错误
+    assert [p['taskId'] for e, p in events if e == 'terminal_error'] == ['a', 'b']
+    # 与排队中的任务重复
+    scheduler.submit([task('s', 'c')], lambda t: False)
+    scheduler.submit([task('s', 'c')], lambda t: False)
+    assert [p['taskId'] for e, p in events if e == 'terminal_error'] == ['a', 'b', 'c']
+
+
+def test_drop_session_frees_its_slots(reactor):
+    scheduler, started, _ = make_scheduler(reactor, max_running=1)
+    scheduler.submit([task('s1', 'a'), task('s1', 'b')], lambda t: False)
+    scheduler.submit([task('s2', 'c')], lambda t: False)
+    scheduler.drop_session('s1')
+    assert ids(started) == ['a', 'c']
+    assert not scheduler.is_queued('s1', 'b')
+
+
+def test_task_still_starting_is_a_duplicate(reactor):
+    # 冷启动中的任务占着配额，但还没有登记到会话的终端列表
+    scheduler, started, events = make_scheduler(reactor, max_running=2)
+    scheduler.submit([task('s', 'a')], lambda t: False)
+    scheduler.submit([task('s', 'a')], lambda t: False)
+    assert ids(started) == ['a']
+    assert [p['taskId'] for e, p in events if e == 'terminal_error'] == ['a']
+    scheduler.release('s', 'a')
+    assert scheduler._running_total == 0
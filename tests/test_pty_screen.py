@@ -0,0 +1,75 @@
+import pytest
+
+pyte = pytest.importorskip('pyte')
+
+from pty_screen import ScreenModel
+
+
+def reference_screen(rows, cols, data):
+    """完整解析全部输出的屏幕，作为跳过优化的对照"""
+    screen = pyte.Screen(cols, rows)
+    pyte.ByteStream(screen).feed(data)
+    return screen
+
+
+def lines(count, prefix=b'line'):
+    return b''.join(b'%s %d\r\n' % (prefix, i) for i in range(count))
+
+
+def assert_same_screen(model, reference):
+    assert model.screen.display == reference.display
+    assert (model.screen.cursor.x, model.screen.cursor.y) == (reference.cursor.x, reference.cursor.y)
+    for y in range(reference.lines):
+        assert model.screen.buffer[y] == reference.buffer[y]
+
+
+class TestSkipScrolled:
+    def test_skips_output_that_scrolls_off_screen(self):
+        model = ScreenModel(5, 20)
+        data = lines(100)
+        skipped = model._skip_scrolled(data)
+        assert len(skipped) < len(data) // 10
+        model.feed(data)
+        model.render()
+        assert_same_screen(model, reference_screen(5, 20, data))
+
+    def test_keeps_colour_in_effect_at_the_cut(self):
+        data = b'\x1b[1m\x1b[31m' + lines(50) + b'\x1b[0mplain ' + lines(3) + b'\x1b[32m' + lines(40) + b'tail'
+        model = ScreenModel(5, 20)
+        model.feed(data)
+        model.render()
+        assert_same_screen(model, reference_screen(5, 20, data))
+        assert model.screen.buffer[4][0].fg == 'green'
+
+    def test_short_output_is_untouched(self):
+        data = lines(4)
+        assert ScreenModel(5, 20)._skip_scrolled(data) is data
+
+    def test_cut_stops_before_cursor_movement(self):
+        data = lines(50) + b'\x1b[2;1Hmoved\r\n' + lines(50)
+        model = ScreenModel(5, 20)
+        # 只有开头的简单输出可以跳过，光标定位及其之后的内容原样解析
+        skipped = model._skip_scrolled(data)
+        assert len(skipped) < len(data)
+        assert skipped.endswith(b'\x1b[2;1Hmoved\r\n' + lines(50))
+        model.feed(data)
+        model.render()
+        assert_same_screen(model, reference_screen(5, 20, data))
+
+    def test_leading_cursor_movement_disables_skipping(self):
+        data = b'\x1b[2;1H' + lines(50)
+        assert ScreenModel(5, 20)._skip_scrolled(data) is data
+
+    def test_scroll_region_disables_skipping(self):
+        model = ScreenModel(5, 20)
+        model.feed(b'\x1b[2;4r')
+        model.render()
+        data = lines(50)
+        assert model._skip_scrolled(data) is data
+
+    def test_mid_sequence_parser_state_disables_skipping(self):
+        model = ScreenModel(5, 20)
+        model.feed(b'x\x1b[')
+        model.render(final=True)
+        data = lines(50)
+        assert model._skip_scrolled(data) is data
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+import pty_stats
+from pty_stats import ProcessSampler, _read_stat
+
+
+def stat_line(pid, comm, sid, utime, stime, start, rss):
+    fields = ['S', '1', str(sid), str(sid), '0', '-1', '0', '0', '0', '0', '0', str(utime), str(stime),
+              '0', '0', '20', '0', '1', '0', str(start), '0', str(rss)]
+    return ('%d (%s) %s\n' % (pid, comm, ' '.join(fields))).encode()
+
+
+@pytest.fixture
+def proc(monkeypatch):
+    """伪造的/proc：{路径: 内容}"""
+    files = {}
+    real_listdir = os.listdir
+
+    def listdir(path):
+        if path == '/proc':
+            return [name.split('/')[2] for name in files if name.endswith('/stat')] + ['self']
+        return real_listdir(path)
+
+    monkeypatch.setattr(pty_stats, '_read', files.get)
+    monkeypatch.setattr(pty_stats.os, 'listdir', listdir)
+    return files
+
+
+def test_read_stat_handles_spaces_and_parens_in_comm(proc):
+    proc['/proc/42/stat'] = stat_line(42, 'my (evil) prog) 1 2', 40, 7, 3, 12345, 9)
+    assert _read_stat(42) == (40, 10, 9, 12345)
+
+
+def test_read_stat_rejects_truncated_lines(proc):
+    proc['/proc/42/stat'] = b'42 (sh) S 1 40'
+    assert _read_stat(42) is None
+    assert _read_stat(43) is None
+
+
+def test_reused_pid_starts_a_new_baseline(proc):
+    sampler = ProcessSampler()
+    proc['/proc/100/stat'] = stat_line(100, 'task', 100, 0, 0, 5, 1)
+    proc['/proc/101/stat'] = stat_line(101, 'child', 100, 500, 0, 6, 1)
+    proc['/proc/101/io'] = b'read_bytes: 8192\nwrite_bytes: 0\n'
+    assert sampler.sample([100])[100]['procs'] == 2
+
+    # 子进程101退出，pid被同一任务中新启动的进程复用，CPU时间从头计数
+    proc['/proc/101/stat'] = stat_line(101, 'child', 100, 20, 0, 900, 1)
+    proc['/proc/101/io'] = b'read_bytes: 4096\nwrite_bytes: 0\n'
+    result = sampler.sample([100])[100]
+    assert result['cpu'] > 0 and result['read'] > 0
+
+
+def test_processes_outside_the_task_sessions_are_ignored(proc):
+    proc['/proc/100/stat'] = stat_line(100, 'task', 100, 0, 0, 5, 2)
+    proc['/proc/200/stat'] = stat_line(200, 'other', 200, 0, 0, 5, 7)
+    result = ProcessSampler().sample([100])
+    assert result == {100: {'cpu': 0.0, 'rss': 2 * pty_stats._PAGE_SIZE, 'read': 0, 'write': 0, 'procs': 1}}